@@ -14,11 +14,17 @@
 #    You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import math
+import time
+
 import bpy
 from bpy.types import Operator, Panel, PropertyGroup, UIList
-from bpy.props import PointerProperty, BoolProperty, CollectionProperty, IntProperty, StringProperty
+from bpy_extras.io_utils import ExportHelper, ImportHelper
+from bpy.props import PointerProperty, BoolProperty, CollectionProperty, IntProperty, StringProperty, EnumProperty, FloatProperty
 import mathutils
 
+from . import api, characters, export, fingerprint, live_sync, matching, mesh_list, parallel_weights, profiles, profiling, validation, weights, weight_cache
+
 # Addon Info
 bl_info = {
     "name": "AutoRigPro-To-Rigify",
@@ -144,6 +150,43 @@ class MeshObjectItem(PropertyGroup):
         poll=lambda self, obj: obj.type == 'MESH'
     )
 
+# PropertyGroup for the collections the meshes to parent are read from
+class MeshCollectionItem(PropertyGroup):
+    collection: PointerProperty(name="Collection", type=bpy.types.Collection)
+
+# PropertyGroup for the characters found in the scene
+class CharacterItem(PropertyGroup):
+    enabled: BoolProperty(name="Convert", description="Include this character in Convert All", default=True)
+    auto_rig: PointerProperty(name="Auto-Rig Pro Rig", type=bpy.types.Object)
+    metarig: PointerProperty(name="Metarig", type=bpy.types.Object)
+    rig: PointerProperty(name="Generated Rig", type=bpy.types.Object)
+    state: EnumProperty(
+        name="State",
+        items=[
+            ('NEW', "New", ""),
+            ('PENDING', "Pending", ""),
+            ('DONE', "Done", ""),
+            ('SKIPPED', "Skipped", ""),
+            ('FAILED', "Failed", ""),
+        ],
+        default='NEW'
+    )
+    status: StringProperty(name="Status")
+
+# Install or remove the live sync handler when the toggle changes
+def update_live_sync(self, context):
+    live_sync.update()
+
+# Load the bone and influence settings of the chosen engine preset
+def update_export_preset(self, context):
+    preset = export.PRESETS[self.export_preset]
+    self.export_deform_only = preset["deform_only"]
+    self.export_max_influences = preset["max_influences"]
+
+# Names of the mapping profiles offered by the profile field
+def search_profiles(self, context, edit_text):
+    return profiles.names(self.profile_folder)
+
 # Property group to store rig selections and settings
 class RigSelectionProperties(PropertyGroup):
     auto_rig: PointerProperty(
@@ -158,15 +201,46 @@ class RigSelectionProperties(PropertyGroup):
         description="Select the Rigify metarig",
         poll=lambda self, obj: obj.type == 'ARMATURE'
     )
+    mapping_profile: StringProperty(
+        name="Mapping Profile",
+        description="Bone mapping profile used to align, prune face bones and transfer weights",
+        default=profiles.DEFAULT_PROFILE,
+        search=search_profiles
+    )
+    profile_folder: StringProperty(
+        name="Profile Folder",
+        description="Extra folder of mapping profile files (.json, .toml), on top of the user config folder",
+        subtype='DIR_PATH'
+    )
     keep_face_bones: BoolProperty(
         name="Keep Face Bones",
         description="Keep face bones in the rigify rig, otherwise delete them",
         default=False
     )
+    fit_face_bones: BoolProperty(
+        name="Fit Face Bones",
+        description="When face bones are kept, fit them to the Auto-Rig Pro facial reference bones during the one-pass preparation",
+        default=False
+    )
     # List of meshes to parent
     meshes_to_parent: CollectionProperty(type=MeshObjectItem)
     # Index for the UI list of meshes
     active_mesh_index: IntProperty(name="Active Mesh Index")
+    mesh_source: EnumProperty(
+        name="Meshes",
+        description="Where the meshes to parent come from",
+        items=[
+            ('LIST', "Mesh List", "The meshes added to the list"),
+            ('COLLECTIONS', "Collections", "Every mesh of the chosen collections, read when parenting"),
+        ],
+        default='LIST'
+    )
+    mesh_collections: CollectionProperty(type=MeshCollectionItem)
+    include_child_collections: BoolProperty(
+        name="Include Child Collections",
+        description="Also take the meshes of the collections nested in the chosen ones",
+        default=True
+    )
 
     rig_controls: PointerProperty(
         name="Rig Controls",
@@ -174,6 +248,242 @@ class RigSelectionProperties(PropertyGroup):
         description="Select the rig with control bones (generated rigify rig)",
         poll=lambda self, obj: obj.type == 'ARMATURE'
     )
+    weight_mode: EnumProperty(
+        name="Weights",
+        description="How mesh weights are created when parenting",
+        items=[
+            ('AUTOMATIC', "Automatic Weights", "Compute automatic (heat) weights for the generated rig"),
+            ('TRANSFER', "Transfer ARP Weights", "Rename and merge the mesh's existing Auto-Rig Pro deform groups onto the generated DEF- bones"),
+            ('PROXY', "Proxy Automatic Weights", "Compute automatic weights on a decimated proxy and project them onto the full mesh"),
+        ],
+        default='AUTOMATIC'
+    )
+    proxy_vertex_count: IntProperty(
+        name="Proxy Vertices",
+        description="Target vertex count of the decimated proxy. Meshes at or below this count get regular automatic weights",
+        default=30000,
+        min=1000
+    )
+    use_weight_cache: BoolProperty(
+        name="Use Weight Cache",
+        description="Reuse weights computed earlier for the same mesh and deform skeleton instead of recomputing them",
+        default=True
+    )
+    weight_cache_dir: StringProperty(
+        name="Cache Folder",
+        description="Folder of the weight cache (empty: Blender's user data folder)",
+        subtype='DIR_PATH'
+    )
+    weight_cache_limit_mb: IntProperty(
+        name="Cache Limit (MB)",
+        description="Least recently used entries are removed once the cache is larger than this",
+        default=512,
+        min=1
+    )
+    parallel_weights: BoolProperty(
+        name="Parallel Weighting",
+        description="Compute automatic weights in background Blender processes, several meshes at once",
+        default=False
+    )
+    weight_workers: IntProperty(
+        name="Workers",
+        description="Background Blender processes computing weights (0: one per CPU core)",
+        default=0,
+        min=0
+    )
+    worker_memory_limit_mb: IntProperty(
+        name="Memory Limit (MB)",
+        description="Address space limit of each worker process, a worker going over it fails its meshes only (0: no limit)",
+        default=0,
+        min=0
+    )
+    clean_up_weights: BoolProperty(
+        name="Clean Up Weights",
+        description="After parenting, limit the influences per vertex, drop small weights, normalize and remove empty deform groups",
+        default=False
+    )
+    max_influences: IntProperty(
+        name="Max Influences",
+        description="Largest number of deform bones weighting a vertex",
+        default=4,
+        min=1,
+        max=16
+    )
+    min_weight: FloatProperty(
+        name="Min Weight",
+        description="Deform weights below this are removed (the largest weight of a vertex is always kept)",
+        default=0.01,
+        min=0.0,
+        max=1.0
+    )
+    normalize_weights: BoolProperty(
+        name="Normalize",
+        description="Scale the deform weights of each vertex to sum to 1",
+        default=True
+    )
+    remove_empty_groups: BoolProperty(
+        name="Remove Empty Groups",
+        description="Delete deform vertex groups left without weights",
+        default=True
+    )
+    live_sync: BoolProperty(
+        name="Live Sync",
+        description="Realign the metarig while Auto-Rig Pro reference bones are being edited",
+        default=False,
+        update=update_live_sync
+    )
+    live_sync_interval: FloatProperty(
+        name="Sync Interval",
+        description="Shortest time in seconds between two live syncs while bones are moving",
+        default=0.2,
+        min=0.05,
+        max=2.0,
+        subtype='TIME_ABSOLUTE',
+        unit='TIME_ABSOLUTE'
+    )
+    use_matched_bones: BoolProperty(
+        name="Match Unmapped Bones",
+        description="Align the metarig bones the mapping leaves empty or unresolved to the nearest matching Auto-Rig Pro reference bone",
+        default=False
+    )
+    min_match_confidence: FloatProperty(
+        name="Min Confidence",
+        description="Matches below this confidence are reported but not aligned",
+        default=matching.MIN_CONFIDENCE,
+        min=0.0,
+        max=1.0,
+        subtype='FACTOR'
+    )
+    # Characters found by Find Characters
+    characters: CollectionProperty(type=CharacterItem)
+    active_character_index: IntProperty(name="Active Character Index")
+    skip_unchanged_rig: BoolProperty(
+        name="Skip Unchanged Metarig",
+        description="Do not regenerate the rig when the metarig has not changed since the last generation",
+        default=True
+    )
+    retarget_pattern: StringProperty(
+        name="Actions",
+        description="Only retarget the Auto-Rig Pro actions whose name matches this pattern",
+        default="*"
+    )
+    # Alignment precheck before generation and weighting
+    validate_before_generate: BoolProperty(
+        name="Check Alignment First",
+        description="Check the metarig against the Auto-Rig Pro rig before generating or weighting, and stop if it is off by more than the limits",
+        default=True
+    )
+    max_alignment_error: FloatProperty(
+        name="Max Distance",
+        description="Largest head or tail distance allowed between a metarig bone and its Auto-Rig Pro bone",
+        default=validation.MAX_DISTANCE,
+        min=0.0,
+        subtype='DISTANCE'
+    )
+    max_length_error: FloatProperty(
+        name="Max Length Error",
+        description="Largest bone length difference allowed between a metarig bone and its Auto-Rig Pro bone",
+        default=validation.MAX_LENGTH_ERROR,
+        min=0.0,
+        subtype='DISTANCE'
+    )
+    max_roll_error: FloatProperty(
+        name="Max Roll Error",
+        description="Largest roll difference allowed between a metarig bone and its Auto-Rig Pro bone (0: rolls are not checked)",
+        default=0.0,
+        min=0.0,
+        max=math.pi,
+        subtype='ANGLE'
+    )
+    max_missing_bones: IntProperty(
+        name="Max Missing Bones",
+        description="Mapped bones that may be missing on either rig before the check fails (-1: missing bones are only reported)",
+        default=-1,
+        min=-1
+    )
+    # Profiling of the addon's operators
+    show_profiling: BoolProperty(name="Show Profiling", default=False)
+    profile_operators: BoolProperty(
+        name="Record Timings",
+        description="Record the wall time of each operator and its stages",
+        default=False
+    )
+    profile_memory: BoolProperty(
+        name="Memory",
+        description="Also record Python memory deltas (tracemalloc, slows Python code down)",
+        default=False
+    )
+    profile_cprofile: BoolProperty(
+        name="cProfile",
+        description="Also capture a cProfile report of each operator run",
+        default=False
+    )
+    # Progress of the background mesh parenting job
+    parent_job_progress: FloatProperty(name="Parenting Progress", min=0.0, max=1.0, subtype='FACTOR')
+    parent_job_status: StringProperty(name="Parenting Status")
+    # Export of converted characters to game engines
+    export_dir: StringProperty(
+        name="Export Folder",
+        description="Folder the exported files are written to",
+        default="//export/",
+        subtype='DIR_PATH'
+    )
+    export_fbx: BoolProperty(name="FBX", description="Export an .fbx file per character", default=True)
+    export_gltf: BoolProperty(name="glTF", description="Export a .glb file per character", default=False)
+    export_preset: EnumProperty(
+        name="Engine",
+        description="Export settings for a game engine",
+        items=[
+            ('GENERIC', "Generic", "Deform bones, 4 influences, Y up"),
+            ('UNREAL', "Unreal", "Deform bones, 8 influences, Z up, animations"),
+            ('UNITY', "Unity", "Deform bones, 4 influences, Y up, animations"),
+            ('GODOT', "Godot", "Deform bones, 4 influences, Y up, animations"),
+        ],
+        default='GENERIC',
+        update=update_export_preset
+    )
+    export_deform_only: BoolProperty(
+        name="Deform Bones Only",
+        description="Leave the control and mechanism bones of the rig out of the exports",
+        default=True
+    )
+    export_max_influences: IntProperty(
+        name="Max Influences",
+        description="Largest number of deform bones weighting a vertex in the exports (0: keep all)",
+        default=4,
+        min=0,
+        max=16
+    )
+    export_all_characters: BoolProperty(
+        name="All Characters",
+        description="Export every converted character of the All Characters list instead of the current rig",
+        default=False
+    )
+    export_workers: IntProperty(
+        name="Workers",
+        description="Background Blender processes exporting characters (0: one per CPU core)",
+        default=0,
+        min=0
+    )
+    export_job_progress: FloatProperty(name="Export Progress", min=0.0, max=1.0, subtype='FACTOR')
+    export_job_status: StringProperty(name="Export Status")
+
+# Operator to read the mapping profile files again
+class OBJECT_OT_ReloadProfiles(Operator):
+    bl_idname = "object.reload_mapping_profiles"
+    bl_label = "Reload Profiles"
+    bl_description = "Read the mapping profile files again after adding or editing them"
+
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        profiles.clear()
+        try:
+            profile = active_profile(props)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Profile '{profile.name}': {len(profile.inverse)} mapped bones, {len(profile.prune)} face bones")
+        return {'FINISHED'}
 
 # Operator to add basic human metarig
 class OBJECT_OT_AddMetarig(Operator):
@@ -181,6 +491,7 @@ class OBJECT_OT_AddMetarig(Operator):
     bl_label = "Add Human Metarig"
     bl_description = "Add a basic human metarig for rigify"
 
+    @profiling.instrumented
     def execute(self, context):
         try:
             bpy.ops.object.armature_human_metarig_add()
@@ -196,6 +507,7 @@ class OBJECT_OT_HandleFaceBones(Operator):
     bl_label = "Process Face Bones"
     bl_description = "Keep or delete face bones based on selection"
 
+    @profiling.instrumented
     def execute(self, context):
         props = context.scene.rig_selection_props
         rigify_rig = props.rigify_rig
@@ -208,26 +520,56 @@ class OBJECT_OT_HandleFaceBones(Operator):
             return {'CANCELLED'}
 
         if not props.keep_face_bones:
-            bpy.context.view_layer.objects.active = rigify_rig
-            bpy.ops.object.mode_set(mode='EDIT')
-            deleted_count = 0
-            for bone_name in face_bones:
-                bone = rigify_rig.data.edit_bones.get(bone_name)
-                if bone:
-                    rigify_rig.data.edit_bones.remove(bone)
-                    deleted_count += 1
-            bpy.ops.object.mode_set(mode='OBJECT')
+            try:
+                deleted_count = api.prune_bones(rigify_rig, active_profile(props).prune)
+            except (OSError, ValueError) as e:
+                self.report({'ERROR'}, str(e))
+                return {'CANCELLED'}
             self.report({'INFO'}, f"Deleted {deleted_count} face bones")
         else:
             self.report({'INFO'}, "Face bones kept in the rig")
         return {'FINISHED'}
 
+# Operator to fit the kept face bones to the Auto-Rig Pro facial markers
+class OBJECT_OT_FitFaceBones(Operator):
+    bl_idname = "object.fit_face_bones"
+    bl_label = "Fit Face Bones"
+    bl_description = "Fit the metarig face chains (lids, lips, brows, jaw, cheeks...) to the Auto-Rig Pro facial reference bones"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        auto_rig = props.auto_rig
+        rigify_rig = props.rigify_rig
+
+        if not auto_rig or not rigify_rig:
+            self.report({'ERROR'}, "Please select both Auto-Rig Pro and Rigify metarig")
+            return {'CANCELLED'}
+        if auto_rig.type != 'ARMATURE' or rigify_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Selected objects must be armatures")
+            return {'CANCELLED'}
+
+        try:
+            profile = active_profile(props)
+            fitted, chains, markers = api.fit_face(auto_rig, rigify_rig, profile.mapping, profile.prune)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        if not fitted:
+            self.report({'WARNING'}, "The metarig has no face bones to fit")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Fitted {len(fitted)} face bones, {chains} chain(s) to {markers} facial marker(s)")
+        return {'FINISHED'}
+
 # Operator to align Rigify metarig to Auto-Rig Pro rig in object mode
 class OBJECT_OT_AlignRigs(Operator):
     bl_idname = "object.align_rigs"
     bl_label = "Align"
     bl_description = "Align Rigify metarig to Auto-Rig Pro rig in object mode"
 
+    @profiling.instrumented
     def execute(self, context):
         props = context.scene.rig_selection_props
         auto_rig = props.auto_rig
@@ -240,20 +582,60 @@ class OBJECT_OT_AlignRigs(Operator):
             self.report({'ERROR'}, "Selected objects must be armatures")
             return {'CANCELLED'}
 
-        bpy.ops.object.select_all(action='DESELECT')
-        auto_rig.select_set(True)
-        context.view_layer.objects.active = auto_rig
-        bpy.ops.view3d.snap_cursor_to_selected()
+        # Same result as snapping the cursor to the ARP rig and the metarig to the
+        # cursor, without needing a 3D View (so it also runs in background mode)
+        api.align_rig(auto_rig, rigify_rig)
 
-        auto_rig.select_set(False)
-        rigify_rig.select_set(True)
-        context.view_layer.objects.active = rigify_rig
-        bpy.ops.view3d.snap_selected_to_cursor(use_offset=False)
+        self.report({'INFO'}, "Rigify metarig aligned to Auto-Rig Pro rig")
+        return {'FINISHED'}
 
-        rigify_rig.rotation_euler = auto_rig.rotation_euler
-        rigify_rig.scale = auto_rig.scale
+# Compiled mapping profile selected in the panel (raises ValueError or OSError)
+def active_profile(props):
+    return profiles.get(props.mapping_profile, props.profile_folder)
+
+# Bone mapping used for alignment: the profile's mapping, extended with the
+# matches of its empty or unresolved entries (face bones aside) when enabled
+def alignment_mapping(props):
+    profile = active_profile(props)
+    if not props.use_matched_bones:
+        return profile.mapping
+    return api.matched_mapping(props.auto_rig, props.rigify_rig, profile.mapping, props.min_match_confidence,
+                               excluded=profile.prune)
+
+# Operator to match the unmapped Rigify bones to Auto-Rig Pro bones
+class OBJECT_OT_MatchBones(Operator):
+    bl_idname = "object.match_bones"
+    bl_label = "Match Unmapped Bones"
+    bl_description = "Find the Auto-Rig Pro reference bones of the Rigify bones the bone mapping leaves empty, by position, direction and hierarchy"
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        auto_rig = props.auto_rig
+        rigify_rig = props.rigify_rig
 
-        self.report({'INFO'}, "Rigify metarig aligned to Auto-Rig Pro rig")
+        if not auto_rig or not rigify_rig:
+            self.report({'ERROR'}, "Please select both Auto-Rig Pro and Rigify metarig")
+            return {'CANCELLED'}
+        if auto_rig.type != 'ARMATURE' or rigify_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Selected objects must be armatures")
+            return {'CANCELLED'}
+
+        try:
+            profile = active_profile(props)
+            matches, _cached = api.match_bones(auto_rig, rigify_rig, profile.mapping, use_cache=False,
+                                               excluded=profile.prune)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        used = 0
+        for rigify_bone_name, arp_bone_name, confidence in matches:
+            if confidence >= props.min_match_confidence:
+                used += 1
+                self.report({'INFO'}, f"'{rigify_bone_name}' -> '{arp_bone_name}' ({confidence:.2f})")
+            else:
+                self.report({'WARNING'}, f"'{rigify_bone_name}' -> '{arp_bone_name}' ({confidence:.2f}, below minimum)")
+        self.report({'INFO'}, f"Matched {used} unmapped bones" + (f", {len(matches) - used} below minimum confidence" if len(matches) > used else ""))
         return {'FINISHED'}
 
 # Operator to align Rigify bones to Auto-Rig Pro bones
@@ -262,6 +644,14 @@ class OBJECT_OT_AlignBones(Operator):
     bl_label = "Align Bones"
     bl_description = "Align Rigify bones head and tail to Auto-Rig Pro bones"
 
+    full: BoolProperty(
+        name="Full Realign",
+        description="Realign every mapped bone, not only the ones whose Auto-Rig Pro bone moved since the last alignment",
+        default=False,
+        options={'SKIP_SAVE'}
+    )
+
+    @profiling.instrumented
     def execute(self, context):
         props = context.scene.rig_selection_props
         auto_rig = props.auto_rig
@@ -274,60 +664,130 @@ class OBJECT_OT_AlignBones(Operator):
             self.report({'ERROR'}, "Selected objects must be armatures")
             return {'CANCELLED'}
 
-        if bpy.context.mode != 'OBJECT':
-            bpy.ops.object.mode_set(mode='OBJECT')
-        
-        auto_rig_bone_positions = {}
-        
-        context.view_layer.objects.active = auto_rig
-        bpy.ops.object.mode_set(mode='EDIT')
-        
-        for rigify_bone_name, auto_rig_bone_name in bone_mapping.items():
-            if not auto_rig_bone_name: 
-                continue
-            auto_edit_bone = auto_rig.data.edit_bones.get(auto_rig_bone_name)
-            if not auto_edit_bone: 
-                continue
-            
-            head_world = auto_rig.matrix_world @ auto_edit_bone.head
-            tail_world = auto_rig.matrix_world @ auto_edit_bone.tail
-            auto_rig_bone_positions[rigify_bone_name] = {'head': head_world, 'tail': tail_world}
-        
-        bpy.ops.object.mode_set(mode='OBJECT')
-        
-        context.view_layer.objects.active = rigify_rig
-        bpy.ops.object.mode_set(mode='EDIT')
-        
-        for rigify_bone_name, positions in auto_rig_bone_positions.items():
-            rigify_edit_bone = rigify_rig.data.edit_bones.get(rigify_bone_name)
-            if not rigify_edit_bone:
-                self.report({'WARNING'}, f"Rigify bone '{rigify_bone_name}' not found")
-                continue
-            
-            head_local = rigify_rig.matrix_world.inverted() @ positions['head']
-            tail_local = rigify_rig.matrix_world.inverted() @ positions['tail']
-            rigify_edit_bone.head = head_local
-            rigify_edit_bone.tail = tail_local
-            
-        spine004_bone = rigify_rig.data.edit_bones.get("spine.004")
-        spine003_bone = rigify_rig.data.edit_bones.get("spine.003")
-        spine005_bone = rigify_rig.data.edit_bones.get("spine.005")
-        
-        if spine004_bone and spine003_bone and spine005_bone:
-            spine005_bone.head.z += 0.045
-            spine005_bone.tail.z += 0.01
-            
-            if rigify_rig.data.edit_bones.get("spine.006"):
-                spine006_bone = rigify_rig.data.edit_bones.get("spine.006")
-                spine006_bone.head.z += 0.005
-                spine006_bone.tail.z += 0.005
-            
-            spine004_bone.head = spine003_bone.tail.copy()
-            spine004_bone.tail = spine005_bone.head.copy()
-            self.report({'INFO'}, "Special spine.004 bone positioned")
-        
-        bpy.ops.object.mode_set(mode='OBJECT')
-        self.report({'INFO'}, "Rigify bones aligned to Auto-Rig Pro bones")
+        # Rest positions come straight from the ARP armature data, no edit mode
+        # needed; only the bones whose ARP bone moved since last time are written
+        try:
+            aligned, missing = api.align_bones(auto_rig, rigify_rig, alignment_mapping(props), full=self.full)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        for rigify_bone_name in missing:
+            self.report({'WARNING'}, f"Rigify bone '{rigify_bone_name}' not found")
+        if aligned:
+            self.report({'INFO'}, f"Rigify bones aligned to Auto-Rig Pro bones ({len(aligned)} updated)")
+        else:
+            self.report({'INFO'}, "Rigify bones already aligned to Auto-Rig Pro bones")
+        return {'FINISHED'}
+
+# Operator to prune face bones and align bones in a single edit-mode pass
+class OBJECT_OT_PrepareMetarig(Operator):
+    bl_idname = "object.prepare_metarig"
+    bl_label = "Prepare Metarig"
+    bl_description = "Process face bones and align Rigify bones to Auto-Rig Pro bones in one edit-mode pass"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    full: BoolProperty(
+        name="Full Realign",
+        description="Realign every mapped bone, not only the ones whose Auto-Rig Pro bone moved since the last alignment",
+        default=False,
+        options={'SKIP_SAVE'}
+    )
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        auto_rig = props.auto_rig
+        rigify_rig = props.rigify_rig
+
+        if not auto_rig or not rigify_rig:
+            self.report({'ERROR'}, "Please select both Auto-Rig Pro and Rigify metarig")
+            return {'CANCELLED'}
+        if auto_rig.type != 'ARMATURE' or rigify_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Selected objects must be armatures")
+            return {'CANCELLED'}
+
+        try:
+            face_bones = active_profile(props).prune
+            deleted_count, aligned, missing = api.prepare_metarig(
+                auto_rig, rigify_rig, alignment_mapping(props),
+                prune=() if props.keep_face_bones else face_bones, full=self.full,
+                face_bones=face_bones if props.keep_face_bones and props.fit_face_bones else ())
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        for rigify_bone_name in missing:
+            self.report({'WARNING'}, f"Rigify bone '{rigify_bone_name}' not found")
+        self.report({'INFO'}, f"Metarig prepared: {deleted_count} face bones deleted, {len(aligned)} bones aligned")
+        return {'FINISHED'}
+
+# Operator to save a skeleton snapshot of the Auto-Rig Pro rig
+class OBJECT_OT_ExportSkeleton(Operator, ExportHelper):
+    bl_idname = "object.export_skeleton"
+    bl_label = "Export Skeleton Snapshot"
+    bl_description = "Save the mapped Auto-Rig Pro bones to a small file that alignment can run from"
+
+    filename_ext = ".npz"
+    filter_glob: StringProperty(default="*.npz;*.json", options={'HIDDEN'})
+    file_format: EnumProperty(
+        name="Format",
+        items=[
+            ('NPZ', "NumPy (.npz)", "Compressed binary arrays"),
+            ('JSON', "JSON", "Readable text, easy to diff"),
+        ],
+        default='NPZ'
+    )
+
+    def check(self, context):
+        self.filename_ext = ".json" if self.file_format == 'JSON' else ".npz"
+        return super().check(context)
+
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        auto_rig = props.auto_rig
+
+        if not auto_rig or auto_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Please select the Auto-Rig Pro armature")
+            return {'CANCELLED'}
+
+        try:
+            snapshot = api.save_skeleton(auto_rig, self.filepath, active_profile(props).mapping)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, f"Failed to save skeleton snapshot: {str(e)}")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Saved {len(snapshot.names)} bones of '{auto_rig.name}' to {self.filepath}")
+        return {'FINISHED'}
+
+# Operator to align the metarig to a skeleton snapshot instead of the rig
+class OBJECT_OT_AlignFromSkeleton(Operator, ImportHelper):
+    bl_idname = "object.align_from_skeleton"
+    bl_label = "Align from Snapshot"
+    bl_description = "Align Rigs and Align Bones using a skeleton snapshot file instead of the Auto-Rig Pro rig"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filter_glob: StringProperty(default="*.npz;*.json", options={'HIDDEN'})
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        rigify_rig = props.rigify_rig
+
+        if not rigify_rig or rigify_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Please select a Rigify metarig")
+            return {'CANCELLED'}
+
+        try:
+            snapshot = api.load_skeleton(self.filepath)
+            api.align_rig(snapshot, rigify_rig)
+            aligned, missing = api.align_bones(snapshot, rigify_rig, active_profile(props).mapping)
+        except (OSError, KeyError, ValueError) as e:
+            self.report({'ERROR'}, f"Failed to align from snapshot: {str(e)}")
+            return {'CANCELLED'}
+
+        for rigify_bone_name in missing:
+            self.report({'WARNING'}, f"Rigify bone '{rigify_bone_name}' not found")
+        self.report({'INFO'}, f"Metarig aligned to snapshot of '{snapshot.name}' ({len(aligned)} bones updated)")
         return {'FINISHED'}
 
 # Operator to apply all transforms
@@ -336,6 +796,7 @@ class OBJECT_OT_ApplyTransforms(Operator):
     bl_label = "Apply All Transforms"
     bl_description = "Apply all transforms to the selected rig"
 
+    @profiling.instrumented
     def execute(self, context):
         props = context.scene.rig_selection_props
         rigify_rig = props.rigify_rig
@@ -344,19 +805,41 @@ class OBJECT_OT_ApplyTransforms(Operator):
             self.report({'ERROR'}, "Please select a Rigify rig")
             return {'CANCELLED'}
 
-        bpy.ops.object.select_all(action='DESELECT')
-        rigify_rig.select_set(True)
-        context.view_layer.objects.active = rigify_rig
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
+        if bpy.context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        try:
+            api.apply_transforms(rigify_rig)
+        except (TypeError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
         self.report({'INFO'}, "All transforms applied to Rigify rig")
         return {'FINISHED'}
 
+# Report which metarig bones were added, removed or changed between generations
+def report_bone_changes(operator, previous_bones, bone_digests):
+    added, removed, changed = fingerprint.diff_bones(previous_bones, bone_digests)
+    if not (added or removed or changed):
+        operator.report({'INFO'}, "No metarig bones changed, only rig settings or placement")
+        return
+    for label, names in (("Added", added), ("Removed", removed), ("Changed", changed)):
+        if names:
+            operator.report({'INFO'}, f"{label} bones ({len(names)}): {', '.join(names)}")
+
 # Operator to generate rigify rig
 class OBJECT_OT_GenerateRig(Operator):
     bl_idname = "object.generate_rig"
     bl_label = "Generate Rig"
     bl_description = "Generate the final rigify rig from the metarig"
 
+    force: BoolProperty(
+        name="Force",
+        description="Generate even if the metarig has not changed since the last generation",
+        default=False,
+        options={'SKIP_SAVE'}
+    )
+
+    @profiling.instrumented
     def execute(self, context):
         props = context.scene.rig_selection_props
         rigify_rig = props.rigify_rig
@@ -368,16 +851,244 @@ class OBJECT_OT_GenerateRig(Operator):
             self.report({'ERROR'}, "Selected object must be an armature")
             return {'CANCELLED'}
 
-        bpy.ops.object.select_all(action='DESELECT')
-        rigify_rig.select_set(True)
-        context.view_layer.objects.active = rigify_rig
+        if bpy.context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        try:
+            failures = precheck_failures(props)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        if failures:
+            report_precheck_failures(self, failures, "generation")
+            return {'CANCELLED'}
 
+        bpy.ops.object.select_all(action='DESELECT')
         try:
-            bpy.ops.pose.rigify_generate()
-            self.report({'INFO'}, "Rigify rig generated successfully!")
+            target, generated, previous_bones, bone_digests = api.generate_rig(
+                rigify_rig, skip_unchanged=props.skip_unchanged_rig and not self.force)
         except Exception as e:
             self.report({'ERROR'}, f"Failed to generate rig: {str(e)}")
             return {'CANCELLED'}
+
+        if not generated:
+            self.report({'INFO'}, f"Metarig unchanged since '{target.name}' was generated, skipped generation")
+            return {'FINISHED'}
+        self.report({'INFO'}, "Rigify rig generated successfully!")
+        if previous_bones is not None:
+            report_bone_changes(self, previous_bones, bone_digests)
+        return {'FINISHED'}
+
+# Failure messages of the alignment precheck of the selected rigs, empty when
+# it passes or is turned off
+def precheck_failures(props):
+    if not (props.validate_before_generate and props.auto_rig and props.rigify_rig):
+        return []
+    report = validation.check(props.rigify_rig, props.auto_rig, alignment_mapping(props))
+    return report.failures(*precheck_limits(props))
+
+def precheck_limits(props):
+    return (props.max_alignment_error, props.max_length_error, math.degrees(props.max_roll_error),
+            props.max_missing_bones)
+
+def report_precheck_failures(operator, failures, action):
+    for message in failures:
+        operator.report({'WARNING'}, message)
+    operator.report({'ERROR'}, f"Alignment check failed, {action} stopped (see Generate Rig in the panel)")
+
+# Operator to check the metarig alignment against the Auto-Rig Pro rig
+class OBJECT_OT_ValidateAlignment(Operator):
+    bl_idname = "object.validate_alignment"
+    bl_label = "Check Alignment"
+    bl_description = "Compare every mapped metarig bone with its Auto-Rig Pro bone and list the worst offenders"
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        auto_rig = props.auto_rig
+        rigify_rig = props.rigify_rig
+
+        if not auto_rig or not rigify_rig:
+            self.report({'ERROR'}, "Please select both Auto-Rig Pro and Rigify metarig")
+            return {'CANCELLED'}
+        if auto_rig.type != 'ARMATURE' or rigify_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Selected objects must be armatures")
+            return {'CANCELLED'}
+
+        try:
+            report = validation.check(rigify_rig, auto_rig, alignment_mapping(props))
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        failures = report.failures(*precheck_limits(props))
+        for message in failures + report.warnings(props.max_missing_bones):
+            self.report({'WARNING'}, message)
+        summary = f"{len(report.names)} bones checked in {report.seconds * 1000:.1f} ms"
+        if failures:
+            self.report({'WARNING'}, f"Alignment check failed: {summary}")
+        else:
+            self.report({'INFO'}, f"Alignment OK: {summary}")
+        return {'FINISHED'}
+
+# Operator to carry the Auto-Rig Pro actions over to the generated rig
+class OBJECT_OT_RetargetActions(Operator):
+    bl_idname = "object.retarget_actions"
+    bl_label = "Retarget ARP Actions"
+    bl_description = "Copy every Auto-Rig Pro action onto the matching controls of the generated Rigify rig, as new '_rigify' actions"
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        auto_rig = props.auto_rig
+        rig_obj = props.rig_controls or (api.generated_rig(props.rigify_rig, context.scene) if props.rigify_rig else None)
+
+        if not auto_rig or auto_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Please select the Auto-Rig Pro armature")
+            return {'CANCELLED'}
+        if not rig_obj or rig_obj.type != 'ARMATURE':
+            self.report({'ERROR'}, "Please generate the rig or select rig controls first")
+            return {'CANCELLED'}
+
+        try:
+            profile = active_profile(props)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        active = auto_rig.animation_data.action if auto_rig.animation_data else None
+        window_manager = context.window_manager
+        window_manager.progress_begin(0, max(len(bpy.data.actions), 1))
+        count = 0
+        skipped_bones = set()
+        try:
+            for action, result, retargeted, skipped in api.retarget_actions(
+                    auto_rig, rig_obj, props.retarget_pattern, profile.mapping, profile.controls):
+                count += 1
+                skipped_bones.update(skipped)
+                window_manager.progress_update(count)
+                if action == active:
+                    rig_obj.animation_data_create().action = result
+        finally:
+            window_manager.progress_end()
+        profiling.count(actions=count)
+
+        if skipped_bones:
+            names = sorted(skipped_bones)
+            self.report({'WARNING'}, f"No Rigify control for {len(names)} animated bone(s): {', '.join(names[:10])}"
+                                     + (", ..." if len(names) > 10 else ""))
+        if not count:
+            self.report({'WARNING'}, "No Auto-Rig Pro actions to retarget")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"Retargeted {count} action(s) onto '{rig_obj.name}'")
+        return {'FINISHED'}
+
+# Operator to list the metarig bones changed since the last generation
+class OBJECT_OT_CheckMetarigChanges(Operator):
+    bl_idname = "object.check_metarig_changes"
+    bl_label = "Check Metarig Changes"
+    bl_description = "Report which metarig bones changed since the rig was last generated"
+
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        rigify_rig = props.rigify_rig
+
+        if not rigify_rig or rigify_rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "Please select a Rigify metarig")
+            return {'CANCELLED'}
+
+        target = api.generated_rig(rigify_rig, context.scene)
+        previous_digest, previous_bones = fingerprint.stored_fingerprint(target)
+        if previous_digest is None:
+            self.report({'WARNING'}, "No generated rig with a stored fingerprint, the next generation is a full one")
+            return {'CANCELLED'}
+
+        bone_digests = fingerprint.metarig_bone_fingerprints(rigify_rig)
+        if fingerprint.metarig_fingerprint(rigify_rig, bone_digests) == previous_digest:
+            self.report({'INFO'}, f"Metarig unchanged since '{target.name}' was generated")
+        else:
+            report_bone_changes(self, previous_bones, bone_digests)
+        return {'FINISHED'}
+
+# Operator to find every Auto-Rig Pro character in the scene
+class OBJECT_OT_DiscoverCharacters(Operator):
+    bl_idname = "object.discover_characters"
+    bl_label = "Find Characters"
+    bl_description = "List every armature with Auto-Rig Pro reference bones in the scene"
+
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        try:
+            found = characters.discover(context.scene, active_profile(props).mapping)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        # Keep the pairing and status of characters found before
+        previous = {item.auto_rig: (item.enabled, item.metarig, item.rig, item.state, item.status)
+                    for item in props.characters if item.auto_rig}
+        props.characters.clear()
+        for obj in found:
+            item = props.characters.add()
+            item.auto_rig = obj
+            if obj in previous:
+                item.enabled, item.metarig, item.rig, item.state, item.status = previous[obj]
+        props.active_character_index = min(props.active_character_index, max(len(found) - 1, 0))
+
+        self.report({'INFO'}, f"Found {len(found)} Auto-Rig Pro character(s)")
+        return {'FINISHED'}
+
+# Operator to convert every listed character in one batched pass
+class OBJECT_OT_ConvertCharacters(Operator):
+    bl_idname = "object.convert_characters"
+    bl_label = "Convert All Characters"
+    bl_description = "Add, align and generate a Rigify rig for every checked character, grouping the edit-mode work"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        items = [item for item in props.characters if item.enabled]
+        if not items:
+            self.report({'ERROR'}, "No characters to convert, use Find Characters first")
+            return {'CANCELLED'}
+
+        try:
+            profile = active_profile(props)
+            converted = characters.convert(
+                context.scene, items, profile.mapping,
+                prune=() if props.keep_face_bones else profile.prune,
+                skip_unchanged=props.skip_unchanged_rig,
+                limits=precheck_limits(props) if props.validate_before_generate else None,
+                match_confidence=props.min_match_confidence if props.use_matched_bones else None,
+                match_excluded=profile.prune,
+                fit_face_bones=profile.prune if props.keep_face_bones and props.fit_face_bones else ())
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        for item in items:
+            if item.state == 'FAILED':
+                self.report({'WARNING'}, f"{item.auto_rig.name if item.auto_rig else 'Missing rig'}: {item.status}")
+        self.report({'INFO'}, f"Converted {converted} of {len(items)} character(s)")
+        return {'FINISHED'}
+
+# Operator to load a listed character into the single-character sections
+class OBJECT_OT_UseCharacter(Operator):
+    bl_idname = "object.use_character"
+    bl_label = "Use Character"
+    bl_description = "Select the active character's rigs in the sections above"
+
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        if not 0 <= props.active_character_index < len(props.characters):
+            self.report({'ERROR'}, "No character selected in the list")
+            return {'CANCELLED'}
+
+        item = props.characters[props.active_character_index]
+        props.auto_rig = item.auto_rig
+        props.rigify_rig = item.metarig
+        props.rig_controls = item.rig
         return {'FINISHED'}
 
 # Operators to manage the list of meshes to parent
@@ -394,15 +1105,9 @@ class MESH_OT_AddSelectedToParentList(Operator):
             self.report({'WARNING'}, "No mesh objects selected in the 3D View")
             return {'CANCELLED'}
 
-        current_mesh_pointers = {item.obj for item in props.meshes_to_parent if item.obj}
-
-        added_count = 0
-        for mesh_obj in selected_meshes:
-            if mesh_obj not in current_mesh_pointers:
-                new_item = props.meshes_to_parent.add()
-                new_item.obj = mesh_obj
-                added_count += 1
-        
+        added_count, pruned_count = mesh_list.add(props, context.scene, selected_meshes)
+        if pruned_count > 0:
+            self.report({'INFO'}, f"Removed {pruned_count} deleted mesh(es) from the list")
         if added_count > 0:
             self.report({'INFO'}, f"Added {added_count} mesh(es) to the list")
         else:
@@ -454,68 +1159,285 @@ class MESH_OT_ClearParentList(Operator):
         self.report({'INFO'}, f"Cleared {count} mesh(es) from the list")
         return {'FINISHED'}
 
+# Operators to choose the collections the meshes to parent are read from
+class MESH_OT_AddParentCollection(Operator):
+    bl_idname = "mesh.add_parent_collection"
+    bl_label = "Add Collection"
+    bl_description = "Read meshes to parent from the active collection"
+
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        collection = context.collection
+        if collection is None or collection == context.scene.collection:
+            self.report({'ERROR'}, "Make a collection other than the scene collection active first")
+            return {'CANCELLED'}
+        if any(item.collection == collection for item in props.mesh_collections):
+            self.report({'INFO'}, f"Collection '{collection.name}' is already used")
+            return {'CANCELLED'}
+        props.mesh_collections.add().collection = collection
+        return {'FINISHED'}
+
+class MESH_OT_RemoveParentCollection(Operator):
+    bl_idname = "mesh.remove_parent_collection"
+    bl_label = "Remove Collection"
+    bl_description = "Stop reading meshes to parent from this collection"
+
+    index: IntProperty()
+
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        if not 0 <= self.index < len(props.mesh_collections):
+            return {'CANCELLED'}
+        props.mesh_collections.remove(self.index)
+        return {'FINISHED'}
+
+# Operators to inspect and clear the weight cache
+class OBJECT_OT_InspectWeightCache(Operator):
+    bl_idname = "object.inspect_weight_cache"
+    bl_label = "Inspect Weight Cache"
+    bl_description = "Count the entries and size of the weight cache"
+
+    def execute(self, context):
+        cache = weight_cache.from_props(context.scene.rig_selection_props)
+        count, size = cache.stats()
+        self.report({'INFO'}, f"Weight cache: {count} entries, {size / (1024 * 1024):.1f} MB in {cache.directory}")
+        return {'FINISHED'}
+
+class OBJECT_OT_ClearWeightCache(Operator):
+    bl_idname = "object.clear_weight_cache"
+    bl_label = "Clear Weight Cache"
+    bl_description = "Delete every entry of the weight cache"
+
+    def execute(self, context):
+        cache = weight_cache.from_props(context.scene.rig_selection_props)
+        removed = cache.clear()
+        self.report({'INFO'}, f"Removed {removed} weight cache entries")
+        return {'FINISHED'}
+
+# Weight cache method of the panel's weight mode
+def weight_method(props):
+    return f"PROXY:{props.proxy_vertex_count}" if props.weight_mode == 'PROXY' else props.weight_mode
+
+# Influence limiting, pruning and normalization of the deform weights of a
+# mesh, with the settings of the panel. Returns (vertices changed, groups removed).
+def clean_up_mesh_weights(props, mesh_obj, rig_obj):
+    with profiling.stage(f"clean up '{mesh_obj.name}'", vertices=len(mesh_obj.data.vertices)):
+        return weights.clean_up_weights(
+            mesh_obj, set(weights.deform_bone_names(rig_obj)), props.max_influences,
+            props.min_weight, props.normalize_weights, props.remove_empty_groups)
+
+# Operator to clean up the weights of the listed meshes
+class OBJECT_OT_CleanUpWeights(Operator):
+    bl_idname = "object.clean_up_weights"
+    bl_label = "Clean Up Weights"
+    bl_description = "Limit the influences per vertex, drop small weights, normalize and remove empty deform groups on every listed mesh"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @profiling.instrumented
+    def execute(self, context):
+        props = context.scene.rig_selection_props
+        rig_obj = props.rig_controls
+
+        if not rig_obj or rig_obj.type != 'ARMATURE':
+            self.report({'ERROR'}, "Please select rig controls (generated Rigify rig)")
+            return {'CANCELLED'}
+        meshes = mesh_list.meshes(props, context.scene)
+        if not meshes:
+            self.report({'ERROR'}, "No meshes in the list to clean up.")
+            return {'CANCELLED'}
+
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        changed_total = removed_total = 0
+        for mesh_obj in meshes:
+            changed, removed = clean_up_mesh_weights(props, mesh_obj, rig_obj)
+            changed_total += changed
+            removed_total += removed
+        self.report({'INFO'}, f"Cleaned up {len(meshes)} mesh(es): {changed_total} vertices changed, {removed_total} empty groups removed")
+        return {'FINISHED'}
+
+# Operators to export and clear recorded profiling runs
+class OBJECT_OT_ExportProfile(Operator, ExportHelper):
+    bl_idname = "object.export_profile"
+    bl_label = "Export Profile"
+    bl_description = "Export the recorded operator timings as JSON or CSV"
+
+    filename_ext = ".json"
+    filter_glob: StringProperty(default="*.json;*.csv", options={'HIDDEN'})
+    file_format: EnumProperty(
+        name="Format",
+        items=[
+            ('JSON', "JSON", "Runs with nested stages and cProfile reports"),
+            ('CSV', "CSV", "One row per run and per stage"),
+        ],
+        default='JSON'
+    )
+
+    def check(self, context):
+        self.filename_ext = ".csv" if self.file_format == 'CSV' else ".json"
+        return super().check(context)
+
+    def execute(self, context):
+        if not profiling.history:
+            self.report({'ERROR'}, "No profiling runs recorded")
+            return {'CANCELLED'}
+        if self.file_format == 'CSV':
+            profiling.export_csv(self.filepath)
+        else:
+            profiling.export_json(self.filepath)
+        self.report({'INFO'}, f"Exported {len(profiling.history)} profiling runs to {self.filepath}")
+        return {'FINISHED'}
+
+class OBJECT_OT_ClearProfile(Operator):
+    bl_idname = "object.clear_profile"
+    bl_label = "Clear Profile"
+    bl_description = "Forget the recorded operator timings"
+
+    def execute(self, context):
+        profiling.clear()
+        return {'FINISHED'}
+
 # Operator to parent mesh to rig with automatic weights
 class OBJECT_OT_ParentWithWeights(Operator):
     bl_idname = "object.parent_with_weights"
     bl_label = "Parent Meshes with Automatic Weights"
-    bl_description = "Parent meshes in the list to rig with automatic weights (Ctrl+P)"
+    bl_description = "Parent meshes in the list to rig with automatic weights (Ctrl+P). Runs in the background from the panel, press Esc to cancel"
 
-    def execute(self, context):
+    # Seconds of work per timer tick before control goes back to the UI
+    time_slice = 0.1
+
+    # The running modal job, if any (read by the panel and the cancel operator)
+    _active_job = None
+    _cancel_requested = False
+
+    def _validate(self, context):
         props = context.scene.rig_selection_props
-        meshes_to_parent_items = props.meshes_to_parent
         rig_obj = props.rig_controls
 
-        if not meshes_to_parent_items:
+        if mesh_list.is_empty(props):
             self.report({'ERROR'}, "No meshes in the list to parent.")
-            return {'CANCELLED'}
+            return None
         
         if not rig_obj:
             self.report({'ERROR'}, "Please select rig controls (generated Rigify rig)")
-            return {'CANCELLED'}
+            return None
 
         if rig_obj.type != 'ARMATURE':
             self.report({'ERROR'}, "Rig controls must be an armature")
-            return {'CANCELLED'}
+            return None
 
-        if bpy.context.mode != 'OBJECT':
-            bpy.ops.object.mode_set(mode='OBJECT')
+        try:
+            failures = precheck_failures(props)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return None
+        if failures:
+            report_precheck_failures(self, failures, "weighting")
+            return None
+        return rig_obj
+
+    def _collect_meshes(self, context):
+        props = context.scene.rig_selection_props
+        if props.mesh_source == 'COLLECTIONS':
+            meshes = mesh_list.collection_meshes(props, context.scene)
+            if not meshes:
+                self.report({'WARNING'}, "The chosen collections hold no meshes in this scene.")
+            return meshes, 0
+
+        skipped_count = mesh_list.prune(props, context.scene)
+        if skipped_count:
+            self.report({'WARNING'}, f"Removed {skipped_count} deleted or unlinked mesh(es) from the list. Skipping.")
+        return [item.obj for item in props.meshes_to_parent], skipped_count
+
+    def _parent_mesh(self, context, mesh_obj, rig_obj):
+        props = context.scene.rig_selection_props
+        with profiling.stage(f"weights '{mesh_obj.name}'", vertices=len(mesh_obj.data.vertices)):
+            parented = self._parent_mesh_weights(context, mesh_obj, rig_obj)
+        # The cache keeps the raw weights, so changing the limits needs no recompute
+        if parented and props.clean_up_weights:
+            clean_up_mesh_weights(props, mesh_obj, rig_obj)
+        return parented
+
+    def _parent_mesh_weights(self, context, mesh_obj, rig_obj):
+        props = context.scene.rig_selection_props
+        try:
+            # Transfer is already a cheap remap, only computed weights are cached
+            cache = weight_cache.from_props(props) if props.use_weight_cache and props.weight_mode != 'TRANSFER' else None
+            if cache:
+                key = weight_cache.entry_key(mesh_obj, rig_obj, weight_method(props))
+                entry = cache.get(key)
+                profiling.count(cache_hit=bool(entry))
+                if entry:
+                    weights.apply_weights(mesh_obj, rig_obj, *entry)
+                    self.report({'INFO'}, f"Mesh '{mesh_obj.name}' parented to rig '{rig_obj.name}' with cached weights")
+                    return True
+
+            if props.weight_mode == 'TRANSFER':
+                renamed, merged = weights.parent_with_transferred_weights(mesh_obj, rig_obj, props.auto_rig, active_profile(props).mapping)
+                self.report({'INFO'}, f"Mesh '{mesh_obj.name}' parented to rig '{rig_obj.name}' with transferred ARP weights ({renamed} renamed, {merged} merged)")
+            elif props.weight_mode == 'PROXY':
+                used_proxy = weights.parent_with_proxy_weights(context, mesh_obj, rig_obj, props.proxy_vertex_count)
+                method = "proxy-projected automatic weights" if used_proxy else "automatic weights"
+                self.report({'INFO'}, f"Mesh '{mesh_obj.name}' parented to rig '{rig_obj.name}' with {method}")
+            else:
+                weights.parent_with_automatic_weights(context, mesh_obj, rig_obj)
+                self.report({'INFO'}, f"Mesh '{mesh_obj.name}' parented to rig '{rig_obj.name}' with automatic weights")
 
-        parented_count = 0
-        failed_count = 0
-
-        for item in meshes_to_parent_items:
-            mesh_obj = item.obj
-            if not mesh_obj:
-                self.report({'WARNING'}, f"Skipping an empty item in the mesh list.")
-                failed_count += 1
-                continue
-            
-            if mesh_obj.name not in context.scene.objects:
-                self.report({'WARNING'}, f"Mesh '{mesh_obj.name}' not found in scene. Skipping.")
-                failed_count += 1
-                continue
-
-            if mesh_obj.type != 'MESH':
-                self.report({'WARNING'}, f"Object '{mesh_obj.name}' is not a mesh. Skipping.")
-                failed_count += 1
-                continue
-            
-            # Deselect all objects
-            bpy.ops.object.select_all(action='DESELECT')
+            if cache:
+                deform_names = set(weights.deform_bone_names(rig_obj))
+                cache.put(key, *weights.deform_weights(mesh_obj, deform_names))
+            return True
+        except Exception as e:
+            self.report({'ERROR'}, f"Failed to parent '{mesh_obj.name}': {str(e)}")
+            return False
 
-            # Select mesh first, then rig (rig needs to be active)
-            mesh_obj.select_set(True)
-            rig_obj.select_set(True)
-            context.view_layer.objects.active = rig_obj
+    def _remote_meshes(self, context, meshes, rig_obj):
+        # Meshes for the worker processes: with parallel weighting, those
+        # without cached weights, when there are at least two of them
+        props = context.scene.rig_selection_props
+        if not props.parallel_weights or props.weight_mode == 'TRANSFER':
+            return []
+        cache = weight_cache.from_props(props) if props.use_weight_cache else None
+        method = weight_method(props)
+        remote = [mesh_obj for mesh_obj in meshes
+                  if cache is None or weight_cache.entry_key(mesh_obj, rig_obj, method) not in cache]
+        return remote if len(remote) > 1 else []
+
+    def _start_jobs(self, context, meshes, rig_obj):
+        props = context.scene.rig_selection_props
+        jobs = parallel_weights.WeightJobs(rig_obj, meshes, props.weight_mode, props.proxy_vertex_count,
+                                           props.weight_workers, props.worker_memory_limit_mb)
+        try:
+            with profiling.stage("ship weight jobs", meshes=len(meshes)):
+                return jobs.start()
+        except (OSError, RuntimeError) as e:
+            jobs.close()
+            self.report({'WARNING'}, f"Parallel weighting unavailable, weighting in this session: {e}")
+            return None
+
+    def _apply_solved(self, context, mesh_obj, rig_obj, entry, error):
+        # Apply weights computed by a worker process
+        props = context.scene.rig_selection_props
+        try:
+            if entry is None:
+                raise RuntimeError(error)
+            with profiling.stage(f"apply weights '{mesh_obj.name}'", vertices=len(mesh_obj.data.vertices)):
+                weights.apply_weights(mesh_obj, rig_obj, *entry)
+            if props.use_weight_cache:
+                key = weight_cache.entry_key(mesh_obj, rig_obj, weight_method(props))
+                weight_cache.from_props(props).put(key, *entry)
+            self.report({'INFO'}, f"Mesh '{mesh_obj.name}' parented to rig '{rig_obj.name}' with weights from a worker process")
+        except ReferenceError:
+            self.report({'ERROR'}, "A mesh was deleted while its weights were being computed")
+            return False
+        except Exception as e:
+            self.report({'ERROR'}, f"Failed to parent '{mesh_obj.name}': {str(e)}")
+            return False
+        if props.clean_up_weights:
+            clean_up_mesh_weights(props, mesh_obj, rig_obj)
+        return True
 
-            try:
-                bpy.ops.object.parent_set(type='ARMATURE_AUTO')
-                self.report({'INFO'}, f"Mesh '{mesh_obj.name}' parented to rig '{rig_obj.name}' with automatic weights")
-                parented_count += 1
-            except Exception as e:
-                self.report({'ERROR'}, f"Failed to parent '{mesh_obj.name}': {str(e)}")
-                failed_count += 1
-        
+    def _report_totals(self, parented_count, failed_count):
         if parented_count > 0:
             self.report({'INFO'}, f"Successfully parented {parented_count} mesh(es).")
         if failed_count > 0:
@@ -523,6 +1445,7 @@ class OBJECT_OT_ParentWithWeights(Operator):
         if parented_count == 0 and failed_count == 0:  # Should not happen if list is not empty
             self.report({'WARNING'}, "No meshes were processed.")
 
+    def _reselect_rig(self, context, rig_obj):
         # Clear selection after operation
         bpy.ops.object.select_all(action='DESELECT')
         if rig_obj:  # Attempt to re-select the rig controls if it exists
@@ -532,22 +1455,453 @@ class OBJECT_OT_ParentWithWeights(Operator):
             except ReferenceError:  # rig_obj might have been deleted or is invalid
                 pass
 
+    def execute(self, context):
+        # The job is recorded as a run of its own, active only during its
+        # own ticks, so operators used meanwhile are profiled apart
+        self._profiling_run = profiling.start_detached(context, self.bl_idname)
+        with profiling.resumed(self._profiling_run):
+            result = self._start(context)
+        if 'RUNNING_MODAL' not in result:
+            profiling.finish(result, run=self._profiling_run)
+            self._profiling_run = None
+        return result
+
+    def _start(self, context):
+        rig_obj = self._validate(context)
+        if not rig_obj:
+            return {'CANCELLED'}
+
+        if bpy.context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        meshes, failed_count = self._collect_meshes(context)
+        profiling.count(meshes=len(meshes))
+        parented_count = 0
+
+        remote = self._remote_meshes(context, meshes, rig_obj)
+        jobs = self._start_jobs(context, remote, rig_obj) if remote else None
+        try:
+            # Meshes weighted here run while the workers solve the others
+            for mesh_obj in meshes:
+                if jobs is not None and mesh_obj in remote:
+                    continue
+                if self._parent_mesh(context, mesh_obj, rig_obj):
+                    parented_count += 1
+                else:
+                    failed_count += 1
+            if jobs is not None:
+                for mesh_obj, entry, error in jobs.wait():
+                    if self._apply_solved(context, mesh_obj, rig_obj, entry, error):
+                        parented_count += 1
+                    else:
+                        failed_count += 1
+        finally:
+            if jobs is not None:
+                jobs.close()
+        
+        self._report_totals(parented_count, failed_count)
+        self._reselect_rig(context, rig_obj)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        if OBJECT_OT_ParentWithWeights._active_job is not None:
+            self.report({'WARNING'}, "Mesh parenting is already running")
+            return {'CANCELLED'}
+
+        rig_obj = self._validate(context)
+        if not rig_obj:
+            return {'CANCELLED'}
+
+        if bpy.context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        meshes, self._failed_count = self._collect_meshes(context)
+        self._total = len(meshes)
+        self._done = 0
+        self._parented_count = 0
+        self._states = []
+        self._rig_obj = rig_obj
+        self._deform_names = None
+
+        if not meshes:
+            self._report_totals(0, self._failed_count)
+            return {'CANCELLED'}
+
+        remote = self._remote_meshes(context, meshes, rig_obj)
+        self._jobs = self._start_jobs(context, remote, rig_obj) if remote else None
+        if self._jobs is not None:
+            meshes = [mesh_obj for mesh_obj in meshes if mesh_obj not in remote]
+        # Largest first, so the slowest solves are not left for the end
+        self._queue = sorted(meshes, key=lambda obj: len(obj.data.vertices), reverse=True)
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.05, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, self._total)
+        OBJECT_OT_ParentWithWeights._active_job = self
+        OBJECT_OT_ParentWithWeights._cancel_requested = False
+        profiling.count(meshes=self._total)
+        self._update_progress(context, f"Parenting {self._total} mesh(es)...")
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        with profiling.resumed(self._profiling_run):
+            return self._tick(context, event)
+
+    def _tick(self, context, event):
+        if event.type == 'ESC' or OBJECT_OT_ParentWithWeights._cancel_requested:
+            return self._cancel(context)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        deadline = time.perf_counter() + self.time_slice
+        # Results of the worker processes are applied as their jobs finish
+        if self._jobs is not None:
+            for mesh_obj, entry, error in self._jobs.poll():
+                try:
+                    self._capture_state(context, mesh_obj)
+                except ReferenceError:  # mesh deleted while its job was running
+                    self.report({'ERROR'}, "A mesh was deleted while its weights were being computed")
+                    parented = False
+                else:
+                    parented = self._apply_solved(context, mesh_obj, self._rig_obj, entry, error)
+                if parented:
+                    self._parented_count += 1
+                else:
+                    self._failed_count += 1
+                self._done += 1
+                context.window_manager.progress_update(self._done)
+
+        while self._queue and time.perf_counter() < deadline:
+            mesh_obj = self._queue.pop(0)
+            self._update_progress(context, f"Parenting '{mesh_obj.name}'...")
+            self._capture_state(context, mesh_obj)
+
+            if self._parent_mesh(context, mesh_obj, self._rig_obj):
+                self._parented_count += 1
+            else:
+                self._failed_count += 1
+            self._done += 1
+            context.window_manager.progress_update(self._done)
+
+        if self._queue or (self._jobs is not None and not self._jobs.done):
+            status = f"Parented {self._done}/{self._total} mesh(es)"
+            if self._jobs is not None and not self._jobs.done:
+                status += f", {self._jobs.max_workers} worker(s) running"
+            self._update_progress(context, status)
+            return {'PASS_THROUGH'}
+
+        self._end(context)
+        self._report_totals(self._parented_count, self._failed_count)
+        self._reselect_rig(context, self._rig_obj)
+        self._update_progress(context, f"Parented {self._parented_count}/{self._total} mesh(es)")
+        return {'FINISHED'}
+
+    def _capture_state(self, context, mesh_obj):
+        # Remember what parenting mesh_obj changes, for rolling back on cancel
+        props = context.scene.rig_selection_props
+        if props.weight_mode == 'TRANSFER':
+            capture_weights = True
+        else:
+            if self._deform_names is None:
+                self._deform_names = set(weights.deform_bone_names(self._rig_obj))
+            capture_weights = not self._deform_names.isdisjoint(mesh_obj.vertex_groups.keys())
+        self._states.append(weights.MeshState(mesh_obj, capture_weights))
+
+    def _cancel(self, context):
+        if self._jobs is not None:
+            self._jobs.cancel()
+        self._end(context)
+        # Roll back the meshes already processed, newest first
+        for state in reversed(self._states):
+            try:
+                state.restore()
+            except ReferenceError:  # mesh deleted while the job was running
+                pass
+        self._reselect_rig(context, self._rig_obj)
+        self._update_progress(context, f"Cancelled, rolled back {len(self._states)} mesh(es)")
+        self.report({'WARNING'}, f"Mesh parenting cancelled, rolled back {len(self._states)} mesh(es)")
+        return {'CANCELLED'}
+
+    def cancel(self, context):
+        # Called when Blender drops the modal handler (file load, window closed)
+        self._end(context)
+
+    def _end(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        if self._jobs is not None:
+            self._jobs.close()
+            self._jobs = None
+        OBJECT_OT_ParentWithWeights._active_job = None
+        OBJECT_OT_ParentWithWeights._cancel_requested = False
+        if self._profiling_run is not None:
+            profiling.finish(run=self._profiling_run)
+            self._profiling_run = None
+
+    def _update_progress(self, context, status):
+        props = context.scene.rig_selection_props
+        props.parent_job_progress = self._done / self._total if self._total else 1.0
+        props.parent_job_status = status
+        for window in context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
+
+# Operator to cancel the running mesh parenting job
+class OBJECT_OT_CancelParentWithWeights(Operator):
+    bl_idname = "object.cancel_parent_with_weights"
+    bl_label = "Cancel Parenting"
+    bl_description = "Cancel mesh parenting and roll back the meshes already parented"
+
+    @classmethod
+    def poll(cls, context):
+        return OBJECT_OT_ParentWithWeights._active_job is not None
+
+    def execute(self, context):
+        OBJECT_OT_ParentWithWeights._cancel_requested = True
+        return {'FINISHED'}
+
+# Export settings of the panel: the engine preset with its bone and influence fields
+def export_settings(props):
+    return export.settings_for(props.export_preset, deform_only=props.export_deform_only,
+                               max_influences=props.export_max_influences)
+
+# Operator to export converted characters to FBX/glTF in background Blender processes
+class OBJECT_OT_ExportCharacters(Operator):
+    bl_idname = "object.export_characters"
+    bl_label = "Export Characters"
+    bl_description = "Export the generated rig and its meshes, or every converted character, to FBX/glTF in background Blender processes. Press Esc to cancel"
+
+    # The running modal job, if any (read by the panel and the cancel operator)
+    _active_job = None
+    _cancel_requested = False
+
+    def _characters(self, context):
+        # (name, rig, meshes) of each character to export
+        props = context.scene.rig_selection_props
+        scene = context.scene
+        if props.export_all_characters:
+            rigs = [item.rig for item in props.characters if item.rig and item.rig.name in scene.objects]
+            return [(rig.name, rig, export.character_meshes(rig, scene)) for rig in rigs]
+        rig_obj = props.rig_controls
+        if not rig_obj or rig_obj.type != 'ARMATURE':
+            return []
+        meshes = mesh_list.meshes(props, scene) or export.character_meshes(rig_obj, scene)
+        return [(rig_obj.name, rig_obj, meshes)]
+
+    def _start(self, context):
+        props = context.scene.rig_selection_props
+        formats = [name for name, enabled in (('FBX', props.export_fbx), ('GLTF', props.export_gltf)) if enabled]
+        if not formats:
+            self.report({'ERROR'}, "Choose FBX, glTF or both to export")
+            return None
+        if props.export_dir.startswith("//") and not bpy.data.filepath:
+            self.report({'ERROR'}, "Save the file first or choose an absolute export folder")
+            return None
+        found = self._characters(context)
+        if not found:
+            if props.export_all_characters:
+                self.report({'ERROR'}, "No converted characters in the list, use Convert All Characters first")
+            else:
+                self.report({'ERROR'}, "Please select rig controls (generated Rigify rig)")
+            return None
+
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        jobs = export.ExportJobs(found, props.export_dir, formats, export_settings(props), props.export_workers)
+        try:
+            with profiling.stage("ship export jobs", characters=len(found)):
+                return jobs.start()
+        except (OSError, RuntimeError) as e:
+            jobs.close()
+            self.report({'ERROR'}, f"Failed to start the export: {e}")
+            return None
+
+    def _report_result(self, name, files, error):
+        if error:
+            self.report({'ERROR'}, f"Failed to export '{name}': {error}")
+            return False
+        self.report({'INFO'}, f"Exported '{name}': {', '.join(bpy.path.basename(path) for path in files)}")
+        return True
+
+    @profiling.instrumented
+    def execute(self, context):
+        jobs = self._start(context)
+        if jobs is None:
+            return {'CANCELLED'}
+        exported_count = failed_count = 0
+        try:
+            for name, files, error in jobs.wait():
+                if self._report_result(name, files, error):
+                    exported_count += 1
+                else:
+                    failed_count += 1
+        finally:
+            jobs.close()
+        profiling.count(characters=exported_count + failed_count)
+        self.report({'INFO'} if not failed_count else {'WARNING'},
+                    f"Exported {exported_count} character(s), {failed_count} failed")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        if OBJECT_OT_ExportCharacters._active_job is not None:
+            self.report({'WARNING'}, "An export is already running")
+            return {'CANCELLED'}
+
+        self._jobs = self._start(context)
+        if self._jobs is None:
+            return {'CANCELLED'}
+        self._total = len(self._jobs.characters)
+        self._done = 0
+        self._failed_count = 0
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        OBJECT_OT_ExportCharacters._active_job = self
+        OBJECT_OT_ExportCharacters._cancel_requested = False
+        self._update_progress(context, f"Exporting {self._total} character(s), {self._jobs.max_workers} worker(s)...")
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' or OBJECT_OT_ExportCharacters._cancel_requested:
+            self._jobs.cancel()
+            self._end(context)
+            self._update_progress(context, f"Export cancelled after {self._done}/{self._total} character(s)")
+            self.report({'WARNING'}, "Export cancelled, files already written are kept")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # Each character is reported as soon as its worker finishes
+        for name, files, error in self._jobs.poll():
+            self._done += 1
+            if not self._report_result(name, files, error):
+                self._failed_count += 1
+            self._update_progress(context, f"Exported {self._done}/{self._total}: '{name}'"
+                                  + (" failed" if error else ""))
+        if not self._jobs.done:
+            return {'PASS_THROUGH'}
+
+        self._end(context)
+        exported_count = self._total - self._failed_count
+        self._update_progress(context, f"Exported {exported_count}/{self._total} character(s)"
+                              + (f", {self._failed_count} failed" if self._failed_count else ""))
+        return {'FINISHED'}
+
+    def cancel(self, context):
+        # Called when Blender drops the modal handler (file load, window closed)
+        self._jobs.cancel()
+        self._end(context)
+
+    def _end(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        self._jobs.close()
+        OBJECT_OT_ExportCharacters._active_job = None
+        OBJECT_OT_ExportCharacters._cancel_requested = False
+
+    def _update_progress(self, context, status):
+        props = context.scene.rig_selection_props
+        props.export_job_progress = self._done / self._total if self._total else 1.0
+        props.export_job_status = status
+        for window in context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
+
+# Operator to cancel the running export
+class OBJECT_OT_CancelExportCharacters(Operator):
+    bl_idname = "object.cancel_export_characters"
+    bl_label = "Cancel Export"
+    bl_description = "Stop the background export, files already written are kept"
+
+    @classmethod
+    def poll(cls, context):
+        return OBJECT_OT_ExportCharacters._active_job is not None
+
+    def execute(self, context):
+        OBJECT_OT_ExportCharacters._cancel_requested = True
         return {'FINISHED'}
 
-# UIList class for displaying mesh items
+# UIList class for displaying mesh items, filtered by name and vertex count
 class MESH_UL_MeshParentList(UIList):
+    min_vertices: IntProperty(name="Min Vertices", description="Hide meshes with fewer vertices", min=0)
+    sort_by: EnumProperty(
+        name="Sort By",
+        items=[
+            ('NONE', "List Order", "Keep the order the meshes were added in"),
+            ('NAME', "Name", "Sort by object name"),
+            ('VERTICES', "Vertices", "Sort by vertex count"),
+        ],
+        default='NONE'
+    )
+
     def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
         # 'item' is the MeshObjectItem type
         # 'data' is the RigSelectionProperties instance
         if self.layout_type in {'DEFAULT', 'COMPACT'}:
             if item.obj:
-                layout.prop(item.obj, "name", text="", emboss=False, icon_value=icon)
+                row = layout.row()
+                row.prop(item.obj, "name", text="", emboss=False, icon_value=icon)
+                row.label(text=f"{len(item.obj.data.vertices):,}")
             else:
                 layout.label(text="<Empty Slot>", icon='QUESTION')
         elif self.layout_type == 'GRID':
             layout.alignment = 'CENTER'
             layout.label(text="", icon_value=icon)
 
+    def draw_filter(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, "filter_name", text="")
+        row.prop(self, "use_filter_invert", text="", icon='ARROW_LEFTRIGHT')
+        row = layout.row(align=True)
+        row.prop(self, "min_vertices")
+        row.prop(self, "sort_by", text="")
+        row.prop(self, "use_filter_sort_reverse", text="", icon='SORT_DESC')
+
+    def filter_items(self, context, data, propname):
+        # One pass over the items: names and vertex counts are read once and
+        # the order comes from a single sort
+        items = getattr(data, propname)
+        pattern = self.filter_name.lower()
+        names = []
+        counts = []
+        flags = []
+        for item in items:
+            obj = item.obj
+            name = obj.name if obj else ""
+            count = len(obj.data.vertices) if obj else 0
+            names.append(name)
+            counts.append(count)
+            shown = (not pattern or pattern in name.lower()) != self.use_filter_invert
+            flags.append(self.bitflag_filter_item if shown and count >= self.min_vertices else 0)
+
+        order = []
+        if self.sort_by != 'NONE':
+            keys = names if self.sort_by == 'NAME' else counts
+            ranked = sorted(range(len(items)), key=keys.__getitem__)
+            order = [0] * len(items)
+            for position, index in enumerate(ranked):
+                order[index] = position
+        return flags, order
+
+# UIList class for displaying the characters and their conversion status
+class OBJECT_UL_CharacterList(UIList):
+    state_icons = {'NEW': 'DOT', 'PENDING': 'TIME', 'DONE': 'CHECKMARK', 'SKIPPED': 'FILE_REFRESH', 'FAILED': 'ERROR'}
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        if self.layout_type in {'DEFAULT', 'COMPACT'}:
+            row = layout.row(align=True)
+            row.prop(item, "enabled", text="")
+            row.label(text=item.auto_rig.name if item.auto_rig else "(missing)", icon='OUTLINER_OB_ARMATURE')
+            row.label(text=item.metarig.name if item.metarig else "-")
+            row.label(text=item.status or "Not converted", icon=self.state_icons[item.state])
+        elif self.layout_type == 'GRID':
+            layout.alignment = 'CENTER'
+            layout.label(text="", icon=self.state_icons[item.state])
+
 # Panel in the 3D View N-panel
 class VIEW3D_PT_AutoRigToRigify(Panel):
     bl_space_type = 'VIEW_3D'
@@ -564,6 +1918,10 @@ class VIEW3D_PT_AutoRigToRigify(Panel):
         box.label(text="1. Rig Selection", icon='ARMATURE_DATA')
         box.prop(props, "auto_rig", icon='OUTLINER_OB_ARMATURE')
         box.prop(props, "rigify_rig", icon='OUTLINER_OB_ARMATURE')
+        row = box.row(align=True)
+        row.prop(props, "mapping_profile", icon='PRESET')
+        row.operator("object.reload_mapping_profiles", text="", icon='FILE_REFRESH')
+        box.prop(props, "profile_folder")
 
         # Shelf Two: Add armature
         box = layout.box()
@@ -574,6 +1932,10 @@ class VIEW3D_PT_AutoRigToRigify(Panel):
         box = layout.box()
         box.label(text="3. Face Bones", icon='FACE_MAPS')
         box.prop(props, "keep_face_bones")
+        if props.keep_face_bones:
+            row = box.row(align=True)
+            row.prop(props, "fit_face_bones")
+            row.operator("object.fit_face_bones", text="Fit Now", icon='FACE_MAPS')
         box.operator("object.handle_face_bones", text="Process Face Bones", icon='CHECKMARK')
 
         # Shelf Four: Alignment operations
@@ -581,12 +1943,59 @@ class VIEW3D_PT_AutoRigToRigify(Panel):
         box.label(text="4. Alignment", icon='SNAP_ON')
         box.operator("object.align_rigs", text="Align Rigs", icon='SNAP_FACE')
         box.operator("object.align_bones", text="Align Bones", icon='BONE_DATA')
+        box.operator("object.prepare_metarig", text="Face Bones + Align Bones (One Pass)", icon='EDITMODE_HLT')
+        row = box.row(align=True)
+        row.prop(props, "use_matched_bones", text="Match Unmapped")
+        sub = row.row(align=True)
+        sub.active = props.use_matched_bones
+        sub.prop(props, "min_match_confidence", text="")
+        sub.operator("object.match_bones", text="", icon='VIEWZOOM')
+        row = box.row(align=True)
+        row.prop(props, "live_sync", icon='UV_SYNC_SELECT')
+        sub = row.row(align=True)
+        sub.active = props.live_sync
+        sub.prop(props, "live_sync_interval", text="")
+        if props.live_sync and live_sync.waiting():
+            box.label(text="Live sync waits for Object Mode (edit the metarig too for live updates)", icon='INFO')
+        if props.live_sync and live_sync.error():
+            box.label(text=f"Live sync skipped: {live_sync.error()}", icon='ERROR')
+        row = box.row(align=True)
+        row.operator("object.export_skeleton", text="Export Snapshot", icon='EXPORT')
+        row.operator("object.align_from_skeleton", text="Align from Snapshot", icon='IMPORT')
         box.operator("object.apply_transforms", text="Apply Transforms", icon='CHECKMARK')
 
         # Shelf Five: Generate rig
         box = layout.box()
         box.label(text="5. Generate Rig", icon='MODIFIER_ON')
+        box.prop(props, "skip_unchanged_rig")
+        row = box.row(align=True)
+        row.prop(props, "validate_before_generate")
+        row.operator("object.validate_alignment", text="", icon='VIEWZOOM')
+        if props.validate_before_generate:
+            col = box.column(align=True)
+            col.prop(props, "max_alignment_error")
+            col.prop(props, "max_length_error")
+            col.prop(props, "max_roll_error")
+            col.prop(props, "max_missing_bones")
+        report = validation.last_report(props.rigify_rig)
+        if report:
+            failures = report.failures(*precheck_limits(props))
+            warnings = report.warnings(props.max_missing_bones)
+            sub = box.box()
+            sub.label(text=f"{len(report.names)} bones, max distance {report.max_distance:.4f}"
+                           + (f", {len(failures)} problem(s)" if failures else ""),
+                      icon='ERROR' if failures else 'CHECKMARK')
+            for message in failures:
+                sub.label(text=message)
+            for message in warnings:
+                sub.label(text=message, icon='INFO')
+            for name, head, tail, length, roll in report.worst(5):
+                sub.label(text=f"{name}: head {head:.4f}, tail {tail:.4f}, length {length:.4f}, roll {roll:.0f}°")
         box.operator("object.generate_rig", text="Generate Rigify Rig", icon='ARMATURE_DATA')
+        box.operator("object.check_metarig_changes", text="Check Metarig Changes", icon='VIEWZOOM')
+        row = box.row(align=True)
+        row.prop(props, "retarget_pattern")
+        row.operator("object.retarget_actions", text="Retarget", icon='ACTION')
 
         # Shelf Six: Mesh parenting
         box = layout.box()
@@ -594,33 +2003,169 @@ class VIEW3D_PT_AutoRigToRigify(Panel):
         box.prop(props, "rig_controls", icon='OUTLINER_OB_ARMATURE')
         
         # Mesh list UI
-        row = box.row()
-        row.template_list("MESH_UL_MeshParentList", "", props, "meshes_to_parent", props, "active_mesh_index")
-        
-        # List management buttons
-        col = row.column(align=True)
-        col.operator("mesh.add_selected_to_parent_list", text="", icon='ADD')
-        col.operator("mesh.remove_selected_from_parent_list", text="", icon='REMOVE')
-        col.operator("mesh.clear_parent_list", text="", icon='TRASH')
+        box.row().prop(props, "mesh_source", expand=True)
+        if props.mesh_source == 'COLLECTIONS':
+            col = box.column(align=True)
+            for index, item in enumerate(props.mesh_collections):
+                row = col.row(align=True)
+                row.prop(item, "collection", text="", icon='OUTLINER_COLLECTION')
+                row.operator("mesh.remove_parent_collection", text="", icon='X').index = index
+            row = box.row(align=True)
+            row.operator("mesh.add_parent_collection", text="Add Active Collection", icon='ADD')
+            row.prop(props, "include_child_collections", text="", icon='OUTLINER')
+        else:
+            row = box.row()
+            row.template_list("MESH_UL_MeshParentList", "", props, "meshes_to_parent", props, "active_mesh_index")
+            
+            # List management buttons
+            col = row.column(align=True)
+            col.operator("mesh.add_selected_to_parent_list", text="", icon='ADD')
+            col.operator("mesh.remove_selected_from_parent_list", text="", icon='REMOVE')
+            col.operator("mesh.clear_parent_list", text="", icon='TRASH')
         
         # Parent operation
-        box.operator("object.parent_with_weights", text="Parent Meshes", icon='CONSTRAINT_BONE')
+        box.prop(props, "weight_mode")
+        if props.weight_mode == 'PROXY':
+            box.prop(props, "proxy_vertex_count")
+        if props.weight_mode != 'TRANSFER':
+            cache_box = box.box()
+            cache_box.prop(props, "use_weight_cache")
+            if props.use_weight_cache:
+                cache_box.prop(props, "weight_cache_dir")
+                cache_box.prop(props, "weight_cache_limit_mb")
+                row = cache_box.row(align=True)
+                if weight_cache.last_stats is not None:
+                    count, size = weight_cache.last_stats
+                    row.label(text=f"{count} entries, {size / (1024 * 1024):.1f} MB")
+                row.operator("object.inspect_weight_cache", text="", icon='VIEWZOOM')
+                row.operator("object.clear_weight_cache", text="", icon='TRASH')
+        if props.weight_mode != 'TRANSFER':
+            parallel_box = box.box()
+            parallel_box.prop(props, "parallel_weights")
+            if props.parallel_weights:
+                row = parallel_box.row(align=True)
+                row.prop(props, "weight_workers")
+                row.prop(props, "worker_memory_limit_mb")
+        clean_box = box.box()
+        row = clean_box.row(align=True)
+        row.prop(props, "clean_up_weights")
+        row.operator("object.clean_up_weights", text="", icon='BRUSH_DATA')
+        col = clean_box.column(align=True)
+        col.prop(props, "max_influences")
+        col.prop(props, "min_weight")
+        row = col.row(align=True)
+        row.prop(props, "normalize_weights")
+        row.prop(props, "remove_empty_groups")
+        if OBJECT_OT_ParentWithWeights._active_job is not None:
+            row = box.row(align=True)
+            row.progress(factor=props.parent_job_progress, type='BAR', text=props.parent_job_status)
+            row.operator("object.cancel_parent_with_weights", text="", icon='CANCEL')
+        else:
+            box.operator("object.parent_with_weights", text="Parent Meshes", icon='CONSTRAINT_BONE')
+            if props.parent_job_status:
+                box.label(text=props.parent_job_status, icon='INFO')
+
+        # Shelf Seven: All characters of the scene
+        box = layout.box()
+        box.label(text="7. All Characters", icon='COMMUNITY')
+        row = box.row()
+        row.template_list("OBJECT_UL_CharacterList", "", props, "characters", props, "active_character_index", rows=3)
+        col = row.column(align=True)
+        col.operator("object.discover_characters", text="", icon='VIEWZOOM')
+        col.operator("object.use_character", text="", icon='EYEDROPPER')
+        box.operator("object.convert_characters", text="Convert All Characters", icon='ARMATURE_DATA')
+
+        # Shelf Eight: Export to game engines
+        box = layout.box()
+        box.label(text="8. Export", icon='EXPORT')
+        box.prop(props, "export_dir")
+        row = box.row(align=True)
+        row.prop(props, "export_fbx", toggle=True)
+        row.prop(props, "export_gltf", toggle=True)
+        row.prop(props, "export_preset", text="")
+        row = box.row(align=True)
+        row.prop(props, "export_deform_only")
+        row.prop(props, "export_max_influences")
+        row = box.row(align=True)
+        row.prop(props, "export_all_characters")
+        row.prop(props, "export_workers")
+        if OBJECT_OT_ExportCharacters._active_job is not None:
+            row = box.row(align=True)
+            row.progress(factor=props.export_job_progress, type='BAR', text=props.export_job_status)
+            row.operator("object.cancel_export_characters", text="", icon='CANCEL')
+        else:
+            box.operator("object.export_characters", text="Export", icon='EXPORT')
+            if props.export_job_status:
+                box.label(text=props.export_job_status, icon='INFO')
+
+        # Shelf Nine: Profiling (collapsed by default)
+        box = layout.box()
+        box.prop(props, "show_profiling", text="9. Profiling", emboss=False,
+                 icon='TRIA_DOWN' if props.show_profiling else 'TRIA_RIGHT')
+        if props.show_profiling:
+            row = box.row(align=True)
+            row.prop(props, "profile_operators")
+            sub = row.row(align=True)
+            sub.active = props.profile_operators
+            sub.prop(props, "profile_memory", toggle=True)
+            sub.prop(props, "profile_cprofile", toggle=True)
+            if profiling.history:
+                record = profiling.history[-1]
+                col = box.column(align=True)
+                col.label(text=f"{record['operator']}: {record['seconds'] * 1000:.1f} ms", icon='TIME')
+                for entry in record["stages"][:30]:
+                    counts = ", ".join(f"{key} {value}" for key, value in entry["counts"].items())
+                    col.label(text=f"{'    ' * (entry['depth'] + 1)}{entry['stage']}: {entry['seconds'] * 1000:.1f} ms"
+                                   + (f" ({counts})" if counts else ""))
+                if len(profiling.history) > 1:
+                    col = box.column(align=True)
+                    col.label(text="Earlier runs:")
+                    for record in reversed(profiling.history[-6:-1]):
+                        col.label(text=f"    {record['operator']}: {record['seconds'] * 1000:.1f} ms")
+                row = box.row(align=True)
+                row.operator("object.export_profile", text="Export", icon='EXPORT')
+                row.operator("object.clear_profile", text="", icon='TRASH')
 
 # Registration
 classes = [
     MeshObjectItem,
+    MeshCollectionItem,
+    CharacterItem,
     RigSelectionProperties,
+    OBJECT_OT_ReloadProfiles,
     OBJECT_OT_AddMetarig,
     OBJECT_OT_HandleFaceBones,
+    OBJECT_OT_FitFaceBones,
     OBJECT_OT_AlignRigs,
+    OBJECT_OT_MatchBones,
     OBJECT_OT_AlignBones,
+    OBJECT_OT_PrepareMetarig,
+    OBJECT_OT_ExportSkeleton,
+    OBJECT_OT_AlignFromSkeleton,
     OBJECT_OT_ApplyTransforms,
+    OBJECT_OT_ValidateAlignment,
     OBJECT_OT_GenerateRig,
+    OBJECT_OT_RetargetActions,
+    OBJECT_OT_CheckMetarigChanges,
+    OBJECT_OT_DiscoverCharacters,
+    OBJECT_OT_ConvertCharacters,
+    OBJECT_OT_UseCharacter,
     MESH_OT_AddSelectedToParentList,
     MESH_OT_RemoveSelectedFromParentList,
     MESH_OT_ClearParentList,
+    MESH_OT_AddParentCollection,
+    MESH_OT_RemoveParentCollection,
+    OBJECT_OT_InspectWeightCache,
+    OBJECT_OT_ClearWeightCache,
+    OBJECT_OT_CleanUpWeights,
+    OBJECT_OT_ExportProfile,
+    OBJECT_OT_ClearProfile,
     OBJECT_OT_ParentWithWeights,
+    OBJECT_OT_CancelParentWithWeights,
+    OBJECT_OT_ExportCharacters,
+    OBJECT_OT_CancelExportCharacters,
     MESH_UL_MeshParentList,
+    OBJECT_UL_CharacterList,
     VIEW3D_PT_AutoRigToRigify,
 ]
 
@@ -628,8 +2173,12 @@ def register():
     for cls in classes:
         bpy.utils.register_class(cls)
     bpy.types.Scene.rig_selection_props = PointerProperty(type=RigSelectionProperties)
+    live_sync.register(lambda props: active_profile(props).mapping)
+    mesh_list.register()
 
 def unregister():
+    mesh_list.unregister()
+    live_sync.unregister()
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
     del bpy.types.Scene.rig_selection_props
@@ -0,0 +1,345 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Vectorized bone alignment.
+#
+# Rest heads and tails are read in bulk with foreach_get from armature.data.bones
+# (no edit mode needed on the source rig), transformed with NumPy and written
+# back to the target's edit bones with a single foreach_set per attribute.
+# EditSession groups every edit-bone mutation of the metarig into one trip
+# through edit mode.
+
+import json
+
+import bpy
+import numpy as np
+
+from . import profiling
+
+
+def matrix_to_array(matrix):
+    return np.array(matrix, dtype=np.float64).reshape(4, 4)
+
+
+def transform_points(points, matrix):
+    # Apply a 4x4 matrix to an (N, 3) array of points
+    m = matrix if isinstance(matrix, np.ndarray) else matrix_to_array(matrix)
+    return points @ m[:3, :3].T + m[:3, 3]
+
+
+def name_index(collection):
+    return {name: i for i, name in enumerate(collection.keys())}
+
+
+def read_vectors(collection, attribute, count=None):
+    count = len(collection) if count is None else count
+    values = np.empty(count * 3, dtype=np.float32)
+    collection.foreach_get(attribute, values)
+    return values.reshape(count, 3)
+
+
+def read_mapped_rest_positions(source_rig, mapping):
+    # World-space rest heads and tails of the source bones named in mapping
+    # (target name -> source name). Returns (target_names, heads, tails);
+    # entries with an empty or missing source bone are left out. A source rig
+    # in edit mode is read from its edit bones, which hold the unsaved edits.
+    if source_rig.mode == 'EDIT':
+        bones = source_rig.data.edit_bones
+        heads = read_vectors(bones, "head")
+        tails = read_vectors(bones, "tail")
+    else:
+        bones = source_rig.data.bones
+        heads = read_vectors(bones, "head_local")
+        tails = read_vectors(bones, "tail_local")
+    index = name_index(bones)
+
+    target_names = []
+    rows = []
+    for target_name, source_name in mapping.items():
+        if not source_name:
+            continue
+        row = index.get(source_name)
+        if row is None:
+            continue
+        target_names.append(target_name)
+        rows.append(row)
+
+    matrix_world = matrix_to_array(source_rig.matrix_world)
+    heads_world = transform_points(heads[rows].astype(np.float64), matrix_world)
+    tails_world = transform_points(tails[rows].astype(np.float64), matrix_world)
+    return target_names, heads_world, tails_world
+
+
+def write_edit_bone_positions(target_rig, names, heads_world, tails_world):
+    # Must be called with target_rig in edit mode. Returns the names that have
+    # no edit bone on the target.
+    edit_bones = target_rig.data.edit_bones
+    count = len(edit_bones)
+    index = name_index(edit_bones)
+    heads = read_vectors(edit_bones, "head", count)
+    tails = read_vectors(edit_bones, "tail", count)
+
+    rows = []
+    sources = []
+    missing = []
+    for i, name in enumerate(names):
+        row = index.get(name)
+        if row is None:
+            missing.append(name)
+            continue
+        rows.append(row)
+        sources.append(i)
+
+    if rows:
+        world_to_local = np.linalg.inv(matrix_to_array(target_rig.matrix_world))
+        heads[rows] = transform_points(np.asarray(heads_world)[sources], world_to_local)
+        tails[rows] = transform_points(np.asarray(tails_world)[sources], world_to_local)
+        _reconnect_joints(edit_bones, index, set(rows), heads, tails)
+        edit_bones.foreach_set("head", heads.ravel())
+        edit_bones.foreach_set("tail", tails.ravel())
+
+    return missing
+
+
+def _reconnect_joints(edit_bones, index, written_rows, heads, tails):
+    # Bulk writes skip the per-bone update that keeps connected joints
+    # together. As with assigning bone.head, a written connected bone moves
+    # its parent's tail; a connected bone that was not written follows its
+    # written parent's tail.
+    connected = np.empty(len(edit_bones), dtype=bool)
+    edit_bones.foreach_get("use_connect", connected)
+    joints = []
+    for row in np.flatnonzero(connected).tolist():
+        parent = edit_bones[row].parent
+        parent_row = index.get(parent.name) if parent else None
+        if parent_row is not None and (row in written_rows or parent_row in written_rows):
+            joints.append((row, parent_row))
+    for row, parent_row in joints:
+        if row in written_rows:
+            tails[parent_row] = heads[row]
+    for row, parent_row in joints:
+        if row not in written_rows:
+            heads[row] = tails[parent_row]
+
+
+def prune_edit_bones(edit_bones, names):
+    # Remove the named edit bones that exist, returns how many were removed
+    removed = 0
+    for name in names:
+        bone = edit_bones.get(name)
+        if bone:
+            edit_bones.remove(bone)
+            removed += 1
+    return removed
+
+
+# Offsets (head, tail) in armature space applied on top of the aligned
+# positions of the bones around spine.004
+SPINE_OFFSETS = {
+    "spine.005": ((0.0, 0.0, 0.045), (0.0, 0.0, 0.01)),
+    "spine.006": ((0.0, 0.0, 0.005), (0.0, 0.0, 0.005)),
+}
+
+
+def position_spine_004(edit_bones, baselines=None):
+    # spine.004 has no ARP counterpart: bridge it between spine.003 and spine.005.
+    # The offsets are added to baselines ({name: (head, tail)} before any
+    # offset) so repeated runs land on the same positions; bones without a
+    # baseline are offset from where they are now.
+    spine004_bone = edit_bones.get("spine.004")
+    spine003_bone = edit_bones.get("spine.003")
+    spine005_bone = edit_bones.get("spine.005")
+    if not (spine004_bone and spine003_bone and spine005_bone):
+        return False
+
+    baselines = baselines or {}
+    for name, (head_offset, tail_offset) in SPINE_OFFSETS.items():
+        bone = edit_bones.get(name)
+        if not bone:
+            continue
+        head, tail = baselines.get(name, (bone.head.copy(), bone.tail.copy()))
+        bone.head = [value + offset for value, offset in zip(head, head_offset)]
+        bone.tail = [value + offset for value, offset in zip(tail, tail_offset)]
+
+    spine004_bone.head = spine003_bone.tail.copy()
+    spine004_bone.tail = spine005_bone.head.copy()
+    return True
+
+
+# Custom property on the metarig recording the last applied alignment
+ALIGNMENT_PROP = "arp_to_rigify_alignment"
+
+# Source bones that moved less than this (in world units) are not realigned
+ALIGNMENT_TOLERANCE = 1e-5
+
+
+def stored_alignment(metarig):
+    # Last alignment stored on the metarig, or None
+    try:
+        return json.loads(metarig.get(ALIGNMENT_PROP, ""))
+    except ValueError:
+        return None
+
+
+def changed_rows(snapshot, source_rig, target_rig, names, heads_world, tails_world):
+    # Indices into names of the bones whose source head or tail moved since
+    # the snapshot. Everything is stale when there is no snapshot or the
+    # source rig or the metarig's placement changed.
+    everything = np.arange(len(names))
+    if (snapshot is None or snapshot.get("source") != source_rig.name
+            or not np.allclose(snapshot.get("matrix", ()), matrix_to_array(target_rig.matrix_world).ravel(),
+                               atol=ALIGNMENT_TOLERANCE)):
+        return everything
+
+    previous = snapshot.get("bones", {})
+    rows = []
+    for row, name in enumerate(names):
+        if name not in previous:
+            rows.append(row)
+            continue
+        head, tail = previous[name]
+        moved = max(np.abs(heads_world[row] - head).max(), np.abs(tails_world[row] - tail).max())
+        if moved > ALIGNMENT_TOLERANCE:
+            rows.append(row)
+    return np.array(rows, dtype=np.int64)
+
+
+def store_alignment(metarig, source_rig, names, heads_world, tails_world, spine_baselines):
+    metarig[ALIGNMENT_PROP] = json.dumps({
+        "source": source_rig.name,
+        "matrix": matrix_to_array(metarig.matrix_world).ravel().tolist(),
+        "bones": {name: (heads_world[row].tolist(), tails_world[row].tolist()) for row, name in enumerate(names)},
+        "spine": spine_baselines,
+    })
+
+
+def realign_edit_bones(armature_obj, source_rig, mapping, full=False):
+    # Align the bones whose mapped source bone moved since the last alignment
+    # (all of them when full) and redo the spine.004 handling from stored
+    # baselines. Must be called with armature_obj in edit mode. source_rig is
+    # an armature object or a skeleton.SkeletonSnapshot. Returns (aligned
+    # names, missing names).
+    edit_bones = armature_obj.data.edit_bones
+    with profiling.stage("read ARP rest positions"):
+        if hasattr(source_rig, "mapped_rest_positions"):
+            names, heads, tails = source_rig.mapped_rest_positions(mapping)
+        else:
+            names, heads, tails = read_mapped_rest_positions(source_rig, mapping)
+        profiling.count(bones=len(names))
+    with profiling.stage("compare with last alignment", bones=len(names)):
+        snapshot = None if full else stored_alignment(armature_obj)
+        rows = changed_rows(snapshot, source_rig, armature_obj, names, heads, tails)
+
+    aligned = [names[row] for row in rows]
+    with profiling.stage("write metarig bones", bones=len(aligned)):
+        missing = write_edit_bone_positions(armature_obj, aligned, heads[rows], tails[rows]) if aligned else []
+
+    # Baselines are the pre-offset positions: freshly aligned bones give
+    # new ones, the others keep the ones from the previous run
+    previous = (snapshot or {}).get("spine", {})
+    baselines = {}
+    for name in SPINE_OFFSETS:
+        bone = edit_bones.get(name)
+        if not bone:
+            continue
+        if name in aligned and name not in missing:
+            baselines[name] = (bone.head[:], bone.tail[:])
+        else:
+            baselines[name] = tuple(previous.get(name, (bone.head[:], bone.tail[:])))
+    with profiling.stage("position spine.004"):
+        position_spine_004(edit_bones, baselines)
+
+    # Bones missing on the metarig stay out of the record so they are retried
+    kept = [row for row, name in enumerate(names) if name not in missing]
+    store_alignment(armature_obj, source_rig, [names[row] for row in kept],
+                    heads[kept], tails[kept], baselines)
+    return [name for name in aligned if name not in missing], missing
+
+
+class EditSession:
+    # Enter edit mode on an armature once, run any number of edit-bone
+    # mutations and leave edit mode once on exit:
+    #
+    #     with EditSession(metarig) as session:
+    #         session.prune(face_bones)
+    #         session.align(names, heads, tails)
+    #         session.position_spine_004()
+    #
+    # Only the current view layer is needed, no 3D View. The active object,
+    # its mode and the selection are restored on exit, and other selected
+    # armatures are kept out of multi-object edit mode. Armatures passed as
+    # others enter edit mode together with armature_obj, so several metarigs
+    # share one round trip; the session methods act on armature_obj.
+
+    def __init__(self, armature_obj, others=()):
+        self.armature_obj = armature_obj
+        self.others = [obj for obj in others if obj != armature_obj]
+
+    def __enter__(self):
+        view_layer = bpy.context.view_layer
+        editing = [self.armature_obj] + self.others
+        for obj in editing:
+            if view_layer.objects.get(obj.name) != obj:
+                raise ValueError(f"'{obj.name}' is not in the current view layer")
+
+        with profiling.stage("enter edit mode", bones=sum(len(obj.data.bones) for obj in editing)):
+            self.previous_active = view_layer.objects.active
+            self.previous_mode = self.previous_active.mode if self.previous_active else 'OBJECT'
+            if self.previous_mode != 'OBJECT':
+                bpy.ops.object.mode_set(mode='OBJECT')
+            self.deselected = [obj for obj in view_layer.objects.selected
+                               if obj.type == 'ARMATURE' and obj not in editing]
+            self.selected = [obj for obj in self.others if not obj.select_get()]
+            for obj in self.deselected:
+                obj.select_set(False)
+            for obj in self.selected:
+                obj.select_set(True)
+            view_layer.objects.active = self.armature_obj
+            bpy.ops.object.mode_set(mode='EDIT')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with profiling.stage("leave edit mode", bones=len(self.armature_obj.data.edit_bones)):
+            bpy.ops.object.mode_set(mode='OBJECT')
+            view_layer = bpy.context.view_layer
+            for obj in self.selected:
+                obj.select_set(False)
+            for obj in self.deselected:
+                obj.select_set(True)
+            view_layer.objects.active = self.previous_active
+            if self.previous_active and self.previous_mode != 'OBJECT':
+                bpy.ops.object.mode_set(mode=self.previous_mode)
+        return False
+
+    @property
+    def edit_bones(self):
+        return self.armature_obj.data.edit_bones
+
+    def prune(self, names):
+        with profiling.stage("prune bones"):
+            removed = prune_edit_bones(self.edit_bones, names)
+            profiling.count(bones=removed)
+        return removed
+
+    def align(self, names, heads_world, tails_world):
+        with profiling.stage("write metarig bones", bones=len(names)):
+            return write_edit_bone_positions(self.armature_obj, names, heads_world, tails_world)
+
+    def position_spine_004(self, baselines=None):
+        return position_spine_004(self.edit_bones, baselines)
+
+    def realign(self, source_rig, mapping, full=False):
+        return realign_edit_bones(self.armature_obj, source_rig, mapping, full)
@@ -0,0 +1,250 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Scripting API of the conversion steps.
+#
+# The functions take objects rather than a context: no 3D View, selection or
+# 3D cursor is used, so they run the same from the panel, a farm script or
+# `blender -b`. Edit-bone changes go through align.EditSession, which needs
+# the armature in the current view layer and restores the active object, its
+# mode and the selection afterwards. The panel operators are wrappers around
+# these functions.
+#
+#     from arp_to_rigify import api
+#     api.align_rig(arp_rig, metarig)
+#     removed, aligned, missing = api.prepare_metarig(arp_rig, metarig, prune=api.default_face_bones())
+#     api.apply_transforms(metarig)
+#
+# Alignment can also run from a skeleton snapshot instead of the rig:
+#
+#     api.save_skeleton(arp_rig, "//hero_skeleton.npz")
+#     api.align_bones(api.load_skeleton("//hero_skeleton.npz"), metarig)
+#
+# Bones the mapping leaves empty can be matched by position first:
+#
+#     mapping = api.matched_mapping(arp_rig, metarig)
+#     api.align_bones(arp_rig, metarig, mapping)
+#
+# Kept face bones can be fitted to the Auto-Rig Pro facial markers:
+#
+#     fitted, chains, markers = api.fit_face(arp_rig, metarig)
+#
+# Studio mappings come from profiles:
+#
+#     profile = api.mapping_profile("quadruped")
+#     api.prepare_metarig(arp_rig, metarig, profile.mapping, prune=profile.prune)
+
+import bpy
+import mathutils
+
+from . import align, face, fingerprint, matching, profiles, profiling, retarget, skeleton
+
+
+def default_mapping():
+    # The addon's Rigify bone -> Auto-Rig Pro bone mapping
+    from . import bone_mapping
+    return bone_mapping
+
+
+def default_face_bones():
+    # The Rigify face bone names deleted by "Process Face Bones"
+    from . import face_bones
+    return face_bones
+
+
+def mapping_profile(name, folder=""):
+    # Compiled mapping profile (profiles.MappingProfile): mapping, inverse,
+    # prune, reference_names and mirror_pairs. Compiled once, then cached.
+    return profiles.get(name, folder)
+
+
+def _check_armature(obj, role):
+    if obj is None or obj.type != 'ARMATURE':
+        raise TypeError(f"{role} must be an armature object")
+
+
+def _check_source(source):
+    if not isinstance(source, skeleton.SkeletonSnapshot):
+        _check_armature(source, "source")
+
+
+def align_rig(source, target):
+    # Place target at the origin of source with the same rotation and scale
+    _check_source(source)
+    _check_armature(target, "target")
+    if isinstance(source, skeleton.SkeletonSnapshot):
+        location, rotation, scale = mathutils.Matrix(source.matrix_world.tolist()).decompose()
+        target.location = location
+        target.rotation_euler = rotation.to_euler(target.rotation_mode) if len(target.rotation_mode) == 3 else rotation.to_euler()
+        target.scale = scale
+        return
+    target.location = source.matrix_world.translation
+    target.rotation_euler = source.rotation_euler
+    target.scale = source.scale
+
+
+def prune_bones(rig, names):
+    # Delete the named bones that exist, returns how many were deleted
+    _check_armature(rig, "rig")
+    with align.EditSession(rig) as session:
+        return session.prune(names)
+
+
+def align_bones(source, target, mapping=None, full=False):
+    # Align the target bones to the source bones they are mapped to (target
+    # name -> source name). Only bones whose source moved since the previous
+    # alignment are written unless full. source is an armature object or a
+    # skeleton snapshot. Returns (aligned, missing) names.
+    _check_source(source)
+    _check_armature(target, "target")
+    with align.EditSession(target) as session:
+        return session.realign(source, mapping if mapping is not None else default_mapping(), full=full)
+
+
+def prepare_metarig(source, target, mapping=None, prune=(), full=False, face_bones=()):
+    # prune_bones(), align_bones() and, for face_bones, fit_face() in a single
+    # trip through edit mode. Returns (deleted count, aligned names, missing
+    # names).
+    _check_source(source)
+    _check_armature(target, "target")
+    if face_bones:
+        _check_armature(source, "source")
+    mapping = mapping if mapping is not None else default_mapping()
+    with align.EditSession(target) as session:
+        removed = session.prune(prune) if prune else 0
+        aligned, missing = session.realign(source, mapping, full=full)
+        if face_bones:
+            with profiling.stage("fit face bones"):
+                face.fit_edit_bones(target, source, mapping, face_bones)
+    return removed, aligned, missing
+
+
+def fit_face(source, target, mapping=None, face_bones=None):
+    # Fit the target's face bones (default: the built-in face bone list) to
+    # the facial reference bones of the Auto-Rig Pro rig source. Returns
+    # (fitted names, chains fitted to markers, markers used).
+    _check_armature(source, "source")
+    _check_armature(target, "target")
+    with align.EditSession(target):
+        return face.fit_edit_bones(target, source, mapping if mapping is not None else default_mapping(),
+                                   face_bones if face_bones is not None else default_face_bones())
+
+
+def match_bones(source, target, mapping=None, use_cache=True, excluded=None):
+    # Match the target bones that mapping leaves empty or unresolved, other
+    # than excluded (default: the face bones), to source bones by position,
+    # direction and hierarchy. The result is cached on source. Returns
+    # ([(target bone, source bone, confidence)], cached).
+    _check_armature(source, "source")
+    _check_armature(target, "target")
+    return matching.resolve(source, target, mapping if mapping is not None else default_mapping(),
+                            use_cache=use_cache,
+                            excluded=excluded if excluded is not None else default_face_bones())
+
+
+def matched_mapping(source, target, mapping=None, min_confidence=matching.MIN_CONFIDENCE, excluded=None):
+    # mapping extended with the match_bones() results at or above min_confidence
+    mapping = mapping if mapping is not None else default_mapping()
+    matches, _cached = match_bones(source, target, mapping, excluded=excluded)
+    return matching.extend_mapping(mapping, matches, min_confidence)
+
+
+def save_skeleton(rig, filepath, mapping=None):
+    # Write a snapshot of the mapped source bones of rig to a .npz or .json file
+    _check_armature(rig, "rig")
+    snapshot = skeleton.capture(rig, mapping if mapping is not None else default_mapping())
+    skeleton.save(snapshot, bpy.path.abspath(filepath))
+    return snapshot
+
+
+def load_skeleton(filepath):
+    # Snapshot usable as the source of align_bones() and prepare_metarig()
+    return skeleton.load(bpy.path.abspath(filepath))
+
+
+def generated_rig(metarig, scene=None):
+    # Rig generated from metarig, if it is still in the scene
+    scene = scene or bpy.context.scene
+    target = getattr(metarig.data, "rigify_target_rig", None)
+    if target and target.name in scene.objects:
+        return target
+    return None
+
+
+def generate_rig(metarig, skip_unchanged=True):
+    # Generate the Rigify rig of metarig. With skip_unchanged nothing is
+    # generated when the metarig's fingerprint matches the one stored on its
+    # rig. Returns (rig, generated, previous bone digests or None, bone
+    # digests); the digests feed fingerprint.diff_bones().
+    _check_armature(metarig, "metarig")
+    with profiling.stage("fingerprint metarig", bones=len(metarig.data.bones)):
+        bone_digests = fingerprint.metarig_bone_fingerprints(metarig)
+        digest = fingerprint.metarig_fingerprint(metarig, bone_digests)
+        target = generated_rig(metarig)
+        previous_digest, previous_bones = fingerprint.stored_fingerprint(target)
+    if previous_digest is None:
+        previous_bones = None
+    if skip_unchanged and previous_digest == digest:
+        return target, False, previous_bones, bone_digests
+
+    # Rigify generates the rig of the active object
+    bpy.context.view_layer.objects.active = metarig
+    metarig.select_set(True)
+    with profiling.stage("rigify generate", bones=len(metarig.data.bones)):
+        bpy.ops.pose.rigify_generate()
+
+    target = generated_rig(metarig)
+    if target:
+        fingerprint.store_fingerprint(target, digest, bone_digests)
+    return target, True, previous_bones, bone_digests
+
+
+def retarget_actions(source, target, pattern="*", mapping=None, controls=None):
+    # Retarget the actions of the Auto-Rig Pro rig source whose name matches
+    # pattern onto the controls of the generated rig target, one action at a
+    # time. controls overrides the pairs derived from mapping (see
+    # retarget.control_mapping). Yields (action, new action, controls
+    # retargeted, ARP bones skipped).
+    _check_armature(source, "source")
+    _check_armature(target, "target")
+    pairs = retarget.control_mapping(mapping if mapping is not None else default_mapping(), controls)
+    for action, (result, retargeted, skipped) in retarget.retarget_actions(
+            retarget.rig_actions(source, pairs, pattern), source, target, pairs):
+        yield action, result, retargeted, skipped
+
+
+def apply_transforms(obj):
+    # Bake the object's location, rotation and scale into its armature or mesh
+    # data, like Apply > All Transforms; children keep their world placement
+    if obj.type not in {'ARMATURE', 'MESH'}:
+        raise TypeError("Only armature and mesh objects can have their transforms applied")
+    if obj.mode != 'OBJECT':
+        raise ValueError(f"'{obj.name}' must be in Object Mode")
+    if obj.data.users > 1:
+        raise ValueError(f"'{obj.name}' shares its data with other objects")
+
+    basis = obj.matrix_basis.copy()
+    if obj.type == 'MESH':
+        # Shape keys move with the mesh, and a mirroring scale turns the
+        # faces inside out unless their winding is flipped back
+        obj.data.transform(basis, shape_keys=True)
+        if basis.determinant() < 0.0:
+            obj.data.flip_normals()
+    else:
+        obj.data.transform(basis)
+    for child in obj.children:
+        child.matrix_parent_inverse = basis @ child.matrix_parent_inverse
+    obj.matrix_basis = mathutils.Matrix.Identity(4)
@@ -0,0 +1,550 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Headless batch conversion of Auto-Rig Pro characters.
+#
+# Usage:
+#   blender -b --python batch.py -- SOURCE [SOURCE ...] --output DIR [options]
+#
+# SOURCE is a directory of .blend files or a manifest (.txt with one path per
+# line, or .json holding a list of paths). Every file is converted in its own
+# background Blender process, running the same chain as the panel:
+# Add Metarig, Align Rigs, Process Face Bones + Align Bones (one edit-mode
+# pass), Apply Transforms, Generate Rig and Parent Meshes. Converted files are written atomically to
+# the output directory and a JSON report with per-file timings and failures is
+# written next to them.
+#
+# With --memory-limit-mb, every worker process caps its own address space and a
+# worker going over it fails on its own. The same script also runs the workers
+# of parallel mesh weighting (parallel_weights.py) in --weight-job mode, and
+# of background exports (export.py) in --export-job mode.
+#
+# With --export fbx gltf, every worker also exports its converted character
+# with an engine preset (--export-preset) once the file is saved, so a cast
+# is converted and exported in one parallel pass.
+#
+# With --armature-only, workers start from an empty file and append just the
+# Auto-Rig Pro armature (library.load_armature) instead of opening the source,
+# so their memory use follows the skeleton rather than the production file.
+# The output then holds the rigs only and mesh parenting is skipped.
+
+import argparse
+import fnmatch
+import glob
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import as_completed
+
+import bpy
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_MODULE_NAME = "arp_to_rigify"
+
+
+def load_addon():
+    # Reuse the addon if it is already enabled, otherwise load it from this folder
+    init_path = os.path.join(ADDON_DIR, "__init__.py")
+    addon = None
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, "__file__", None)
+        if module_file and os.path.abspath(module_file) == init_path:
+            addon = module
+            break
+
+    if addon is None:
+        spec = importlib.util.spec_from_file_location(
+            ADDON_MODULE_NAME, init_path, submodule_search_locations=[ADDON_DIR])
+        addon = importlib.util.module_from_spec(spec)
+        sys.modules[ADDON_MODULE_NAME] = addon
+        spec.loader.exec_module(addon)
+    return addon
+
+
+def load_submodule(addon, name):
+    return importlib.import_module(f"{addon.__name__}.{name}")
+
+
+def ensure_registered(addon):
+    import addon_utils
+    addon_utils.enable("rigify", default_set=True)
+    if not hasattr(bpy.types.Scene, "rig_selection_props"):
+        addon.register()
+
+
+def script_arguments():
+    return sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="blender -b --python batch.py --",
+        description="Convert Auto-Rig Pro characters to Rigify in background Blender processes")
+    parser.add_argument("sources", nargs="*", help="Directories of .blend files or manifest files")
+    parser.add_argument("--output", "-o", help="Directory for converted .blend files")
+    parser.add_argument("--jobs", "-j", type=int, default=0, help="Worker processes (default: CPU count)")
+    parser.add_argument("--report", help="Path of the JSON report (default: OUTPUT/batch_report.json)")
+    parser.add_argument("--recursive", action="store_true", help="Search source directories recursively")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds before a worker is killed")
+    parser.add_argument("--auto-rig", default="", help="Name of the Auto-Rig Pro armature (default: detect)")
+    parser.add_argument("--keep-face-bones", action="store_true", help="Keep the metarig face bones")
+    parser.add_argument("--profile", default="default", help="Bone mapping profile (default: the built-in mapping)")
+    parser.add_argument("--profile-folder", default="", help="Extra folder of mapping profile files")
+    parser.add_argument("--mesh-pattern", default="*", help="Only parent meshes whose name matches this pattern")
+    parser.add_argument("--no-parent", action="store_true", help="Skip mesh parenting")
+    parser.add_argument("--no-alignment-check", action="store_true",
+                        help="Generate and weight even when the alignment check fails")
+    parser.add_argument("--max-missing-bones", type=int, default=-1,
+                        help="Mapped bones that may be missing before the alignment check fails "
+                             "(default: missing bones are only reported)")
+    parser.add_argument("--armature-only", action="store_true",
+                        help="Append only the Auto-Rig Pro armature instead of opening the whole file "
+                             "(implies --no-parent)")
+    parser.add_argument("--armature-pattern", default="*rig*",
+                        help="With --armature-only and no --auto-rig, objects tried when no armature "
+                             "is named like the best armature data")
+    parser.add_argument("--weights", choices=["automatic", "transfer", "proxy"], default="automatic",
+                        help="Automatic weights, transfer of the existing ARP skin weights, or automatic "
+                             "weights on a decimated proxy")
+    parser.add_argument("--proxy-vertices", type=int, default=30000, help="Target vertex count of weight proxies")
+    parser.add_argument("--weight-cache", default="", help="Weight cache folder (default: Blender's user data folder)")
+    parser.add_argument("--no-weight-cache", action="store_true", help="Always recompute weights")
+    parser.add_argument("--blender", default=None, help="Blender executable used for workers")
+    parser.add_argument("--memory-limit-mb", type=int, default=0,
+                        help="Address space limit of each worker process in MB (default: no limit)")
+    parser.add_argument("--export", nargs="+", choices=["fbx", "gltf"], default=[],
+                        help="Also export each converted character to these formats")
+    parser.add_argument("--export-preset", choices=["generic", "unreal", "unity", "godot"], default="generic",
+                        help="Engine preset of the exports (deform bones only, influences per vertex, axes)")
+    parser.add_argument("--export-dir", default="", help="Directory for exported files (default: OUTPUT)")
+    parser.add_argument("--export-max-influences", type=int, default=None,
+                        help="Influences per vertex in exports, overriding the preset (0: keep all)")
+    # Worker side, set by the controller
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    parser.add_argument("--source", help=argparse.SUPPRESS)
+    parser.add_argument("--weight-job", help=argparse.SUPPRESS)
+    parser.add_argument("--rig", help=argparse.SUPPRESS)
+    parser.add_argument("--mesh-names", nargs="*", default=[], help=argparse.SUPPRESS)
+    parser.add_argument("--export-job", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def collect_sources(sources, recursive=False):
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            pattern = os.path.join(source, "**", "*.blend") if recursive else os.path.join(source, "*.blend")
+            files.extend(sorted(glob.glob(pattern, recursive=recursive)))
+        elif source.lower().endswith(".blend"):
+            files.append(source)
+        elif source.lower().endswith(".json"):
+            with open(source) as f:
+                base = os.path.dirname(os.path.abspath(source))
+                files.extend(os.path.join(base, path) for path in json.load(f))
+        else:
+            with open(source) as f:
+                base = os.path.dirname(os.path.abspath(source))
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        files.append(os.path.join(base, line))
+
+    unique = []
+    seen = set()
+    for path in files:
+        path = os.path.abspath(path)
+        if path not in seen:
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def source_root(sources):
+    # Deepest folder holding every source, or None when there is none (other
+    # drive on Windows)
+    try:
+        return os.path.commonpath([os.path.dirname(source) for source in sources])
+    except ValueError:
+        return None
+
+
+def output_path_for(source, output_dir, root=None):
+    # The source's path relative to root, under output_dir, so same-named
+    # files from different folders do not overwrite each other
+    relative = os.path.relpath(source, root) if root else os.path.basename(source)
+    return os.path.join(os.path.abspath(output_dir), relative)
+
+
+# ---------------------------------------------------------------------------
+# Controller
+
+
+def run_batch(args):
+    workers = load_submodule(load_addon(), "workers")
+
+    if not args.sources or not args.output:
+        print("batch: SOURCE and --output are required", file=sys.stderr)
+        return 2
+
+    sources = collect_sources(args.sources, recursive=args.recursive)
+    if not sources:
+        print("batch: no .blend files found", file=sys.stderr)
+        return 2
+
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = args.report or os.path.join(output_dir, "batch_report.json")
+
+    worker_args = []
+    if args.auto_rig:
+        worker_args += ["--auto-rig", args.auto_rig]
+    if args.keep_face_bones:
+        worker_args.append("--keep-face-bones")
+    worker_args += ["--profile", args.profile]
+    if args.profile_folder:
+        worker_args += ["--profile-folder", os.path.abspath(args.profile_folder)]
+    if args.no_parent or args.armature_only:
+        worker_args.append("--no-parent")
+    if args.no_alignment_check:
+        worker_args.append("--no-alignment-check")
+    worker_args += ["--max-missing-bones", args.max_missing_bones]
+    if args.armature_only:
+        worker_args += ["--armature-only", "--armature-pattern", args.armature_pattern]
+    worker_args += ["--mesh-pattern", args.mesh_pattern, "--weights", args.weights,
+                    "--proxy-vertices", args.proxy_vertices]
+    if args.weight_cache:
+        worker_args += ["--weight-cache", args.weight_cache]
+    if args.no_weight_cache:
+        worker_args.append("--no-weight-cache")
+    if args.memory_limit_mb:
+        worker_args += ["--memory-limit-mb", args.memory_limit_mb]
+    export_dir = os.path.abspath(args.export_dir or output_dir)
+    if args.export:
+        worker_args += ["--export", *args.export, "--export-preset", args.export_preset]
+        if args.export_max_influences is not None:
+            worker_args += ["--export-max-influences", args.export_max_influences]
+
+    jobs = args.jobs or workers.default_worker_count()
+    jobs = min(jobs, len(sources))
+    print(f"batch: converting {len(sources)} file(s) with {jobs} worker(s)")
+
+    start = time.perf_counter()
+    results = []
+    with workers.WorkerPool(max_workers=jobs, binary=args.blender) as pool:
+        futures = {}
+        root = source_root(sources)
+        targets = {}
+        for source in sources:
+            target = output_path_for(source, output_dir, root)
+            if os.path.abspath(target) == source:
+                results.append({"source": source, "status": "failed",
+                                "error": "Output path would overwrite the source file"})
+                continue
+            if os.path.normcase(target) in targets:
+                results.append({"source": source, "status": "failed",
+                                "error": f"Output path {target} is also the output of {targets[os.path.normcase(target)]}"})
+                continue
+            targets[os.path.normcase(target)] = source
+            source_args = worker_args
+            if args.export:
+                # Exports mirror the output layout too
+                relative = os.path.relpath(os.path.dirname(target), output_dir)
+                source_args = worker_args + ["--export-dir", os.path.normpath(os.path.join(export_dir, relative))]
+            if args.armature_only:
+                future = pool.submit(os.path.abspath(__file__),
+                                     ["--worker", "--target", target, "--source", source] + source_args,
+                                     timeout=args.timeout)
+            else:
+                future = pool.submit(os.path.abspath(__file__),
+                                     ["--worker", "--target", target] + source_args,
+                                     blend_file=source, timeout=args.timeout)
+            futures[future] = source
+
+        for index, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            result["source"] = result.get("source") or futures[future]
+            results.append(result)
+            status = result.get("status", "failed")
+            line = f"batch: [{index}/{len(futures)}] {status:>6} {result.get('wall_seconds', 0):8.2f}s  {futures[future]}"
+            if status != "ok":
+                line += f"  ({result.get('error', 'unknown error')})"
+            elif result.get("exports"):
+                line += f"  -> {', '.join(os.path.basename(path) for path in result['exports'])}"
+            print(line, flush=True)
+
+    failed = [r for r in results if r.get("status") != "ok"]
+    report = {
+        "sources": len(sources),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "workers": jobs,
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "results": sorted(results, key=lambda r: r.get("source") or ""),
+    }
+    workers.write_json_atomic(report_path, report)
+    print(f"batch: {report['succeeded']} succeeded, {report['failed']} failed, report written to {report_path}")
+    return 1 if failed else 0
+
+
+# ---------------------------------------------------------------------------
+# Worker
+
+
+def find_auto_rig(name, bone_mapping):
+    if name:
+        obj = bpy.data.objects.get(name)
+        if not obj or obj.type != 'ARMATURE':
+            raise RuntimeError(f"Armature '{name}' not found")
+        return obj
+
+    # Pick the armature carrying the most Auto-Rig Pro reference bones
+    ref_names = {name for name in bone_mapping.values() if name}
+    best, best_count = None, 0
+    for obj in bpy.context.scene.objects:
+        if obj.type != 'ARMATURE':
+            continue
+        count = sum(1 for bone_name in obj.data.bones.keys() if bone_name in ref_names)
+        if count > best_count:
+            best, best_count = obj, count
+    if not best:
+        raise RuntimeError("No Auto-Rig Pro armature with reference bones found")
+    return best
+
+
+def meshes_to_parent(pattern):
+    return [obj for obj in bpy.context.scene.objects
+            if obj.type == 'MESH'
+            and obj.visible_get()
+            and not obj.name.startswith("cs_")
+            and fnmatch.fnmatchcase(obj.name, pattern)]
+
+
+def run_step(steps, name, function):
+    start = time.perf_counter()
+    step = {"name": name}
+    steps.append(step)
+    try:
+        result = function()
+        if isinstance(result, set) and 'FINISHED' not in result:
+            raise RuntimeError(f"{name} returned {sorted(result)}")
+        step["status"] = "ok"
+    except Exception as e:
+        step["status"] = "failed"
+        step["error"] = str(e)
+        raise
+    finally:
+        step["seconds"] = round(time.perf_counter() - start, 4)
+
+
+def convert_current_file(addon, args, steps):
+    context = bpy.context
+    scene = context.scene
+    props = scene.rig_selection_props
+
+    if context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    props.mapping_profile = args.profile
+    props.profile_folder = args.profile_folder
+    props.auto_rig = find_auto_rig(args.auto_rig, addon.active_profile(props).mapping)
+    props.keep_face_bones = args.keep_face_bones
+    props.validate_before_generate = not args.no_alignment_check
+    props.max_missing_bones = args.max_missing_bones
+    props.weight_mode = args.weights.upper()
+    props.proxy_vertex_count = args.proxy_vertices
+    props.use_weight_cache = not args.no_weight_cache
+    props.weight_cache_dir = args.weight_cache
+
+    def add_metarig():
+        result = bpy.ops.object.add_metarig()
+        props.rigify_rig = context.view_layer.objects.active
+        return result
+
+    def generate_rig():
+        result = bpy.ops.object.generate_rig()
+        target = getattr(props.rigify_rig.data, "rigify_target_rig", None)
+        props.rig_controls = target or context.view_layer.objects.active
+        return result
+
+    def fill_mesh_list():
+        props.mesh_source = 'LIST'
+        props.meshes_to_parent.clear()
+        for obj in meshes_to_parent(args.mesh_pattern):
+            props.meshes_to_parent.add().obj = obj
+        return {'FINISHED'}
+
+    run_step(steps, "add_metarig", add_metarig)
+    run_step(steps, "align_rigs", bpy.ops.object.align_rigs)
+    # Face bone pruning and bone alignment in one edit-mode pass
+    run_step(steps, "prepare_metarig", bpy.ops.object.prepare_metarig)
+    run_step(steps, "apply_transforms", bpy.ops.object.apply_transforms)
+    run_step(steps, "generate_rig", generate_rig)
+    if not args.no_parent:
+        run_step(steps, "collect_meshes", fill_mesh_list)
+        if props.meshes_to_parent:
+            run_step(steps, "parent_with_weights", bpy.ops.object.parent_with_weights)
+
+    return {
+        "auto_rig": props.auto_rig.name,
+        "metarig": props.rigify_rig.name,
+        "rig": props.rig_controls.name if props.rig_controls else None,
+        "meshes": len(props.meshes_to_parent),
+    }
+
+
+def save_atomic(target):
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.getpid()}.{os.path.basename(target)}")
+    try:
+        bpy.ops.wm.save_as_mainfile(filepath=tmp_path, copy=True, check_existing=False)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def limit_memory(megabytes):
+    # Cap the address space of this process; allocations past it fail
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    limit = megabytes * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def write_result(args, result):
+    if args.result:
+        tmp_path = args.result + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, args.result)
+    else:
+        print(json.dumps(result, indent=2))
+
+
+def export_character(addon, args):
+    export = load_submodule(addon, "export")
+    props = bpy.context.scene.rig_selection_props
+    rig_obj = props.rig_controls
+    settings = export.settings_for(args.export_preset.upper(), max_influences=args.export_max_influences)
+    name = os.path.splitext(os.path.basename(args.target))[0]
+    return export.export_character(bpy.context, rig_obj, export.character_meshes(rig_obj, bpy.context.scene),
+                                   args.export_dir, name, [f.upper() for f in args.export], settings)
+
+
+def run_export_worker(args):
+    # Export the character of a background export job (see export.py)
+    start = time.perf_counter()
+    result = {"source": args.export_job}
+    try:
+        bpy.ops.wm.read_homefile(use_empty=True)
+        export = load_submodule(load_addon(), "export")
+        result["files"] = export.run_job(args.export_job)
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["peak_memory_mb"] = peak_memory_mb()
+    write_result(args, result)
+    return 0 if result["status"] == "ok" else 1
+
+
+def run_weight_worker(args):
+    # Solve the meshes of a parallel weighting job (see parallel_weights.py)
+    start = time.perf_counter()
+    result = {"source": args.weight_job}
+    try:
+        bpy.ops.wm.read_homefile(use_empty=True)
+        parallel_weights = load_submodule(load_addon(), "parallel_weights")
+        result["meshes"] = parallel_weights.solve_job(
+            args.weight_job, args.rig, args.mesh_names, args.output, args.weights.upper(), args.proxy_vertices)
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["peak_memory_mb"] = peak_memory_mb()
+    write_result(args, result)
+    return 0 if result["status"] == "ok" else 1
+
+
+def run_worker(args):
+    start = time.perf_counter()
+    steps = []
+    result = {"source": args.source or bpy.data.filepath, "output": args.target, "steps": steps}
+    try:
+        if args.armature_only:
+            bpy.ops.wm.read_homefile(use_empty=True)
+        addon = load_addon()
+        ensure_registered(addon)
+        if args.armature_only:
+            library = load_submodule(addon, "library")
+            profiles = load_submodule(addon, "profiles")
+            mapping = profiles.get(args.profile, args.profile_folder).mapping
+            run_step(steps, "load_armature", lambda: library.load_armature(
+                args.source, mapping, name=args.auto_rig or None, pattern=args.armature_pattern))
+        result.update(convert_current_file(addon, args, steps))
+        run_step(steps, "save", lambda: save_atomic(args.target))
+        if args.export:
+            # After saving: the export limits influences in this session only
+            run_step(steps, "export", lambda: result.update(exports=export_character(addon, args)))
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["peak_memory_mb"] = peak_memory_mb()
+    write_result(args, result)
+    return 0 if result["status"] == "ok" else 1
+
+
+def main():
+    args = parse_arguments(script_arguments())
+    if args.memory_limit_mb and (args.worker or args.weight_job or args.export_job):
+        limit_memory(args.memory_limit_mb)
+    if args.weight_job:
+        code = run_weight_worker(args)
+    elif args.export_job:
+        code = run_export_worker(args)
+    else:
+        code = run_worker(args) if args.worker else run_batch(args)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
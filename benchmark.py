@@ -0,0 +1,356 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Headless benchmark of the conversion stages on synthetic characters.
+#
+# Usage:
+#   blender -b --factory-startup --python benchmark.py -- [options]
+#
+# Every repeat starts from an empty file, builds an Auto-Rig Pro style
+# armature whose reference bones are the ones named in bone_mapping (plus
+# optional extra bones) and times the panel operators on it: Add Metarig,
+# face bone deletion, Align Rigs, Align Bones, Apply Transforms, Generate Rig
+# and Parent Meshes for each requested mesh size. Test meshes are tubes around
+# the reference bones, skinned to the Auto-Rig Pro rig. Medians are compared
+# with a stored baseline and the exit code is 1 when a stage got slower than
+# the regression threshold allows.
+
+import argparse
+import importlib.util
+import os
+import platform
+import statistics
+import sys
+import time
+
+import bpy
+import numpy as np
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(ADDON_DIR, "benchmark_baseline.json")
+
+# Rest positions (head, tail) of the Auto-Rig Pro reference bones for a
+# 1.8 m character; right side bones mirror the left ones
+ARP_REST_POSITIONS = {
+    "root_ref.x": ((0.0, 0.0, 1.0), (0.0, 0.0, 1.1)),
+    "spine_01_ref.x": ((0.0, 0.0, 1.1), (0.0, 0.0, 1.25)),
+    "spine_02_ref.x": ((0.0, 0.0, 1.25), (0.0, 0.0, 1.4)),
+    "spine_03_ref.x": ((0.0, 0.0, 1.4), (0.0, 0.0, 1.5)),
+    "neck_ref.x": ((0.0, 0.0, 1.5), (0.0, 0.0, 1.6)),
+    "head_ref.x": ((0.0, 0.0, 1.6), (0.0, 0.0, 1.8)),
+    "thigh_ref.l": ((0.1, 0.0, 1.0), (0.1, 0.0, 0.55)),
+    "leg_ref.l": ((0.1, 0.0, 0.55), (0.1, 0.02, 0.1)),
+    "foot_ref.l": ((0.1, 0.02, 0.1), (0.1, -0.12, 0.03)),
+    "toes_ref.l": ((0.1, -0.12, 0.03), (0.1, -0.2, 0.03)),
+    "foot_heel_ref.l": ((0.08, 0.05, 0.0), (0.12, 0.05, 0.0)),
+    "shoulder_ref.l": ((0.02, 0.0, 1.45), (0.17, 0.0, 1.47)),
+    "arm_ref.l": ((0.17, 0.0, 1.47), (0.45, 0.0, 1.47)),
+    "forearm_ref.l": ((0.45, 0.0, 1.47), (0.7, 0.0, 1.47)),
+    "hand_ref.l": ((0.7, 0.0, 1.47), (0.78, 0.0, 1.47)),
+    "thumb1_ref.l": ((0.72, -0.03, 1.46), (0.75, -0.06, 1.45)),
+    "thumb2_ref.l": ((0.75, -0.06, 1.45), (0.77, -0.08, 1.44)),
+    "thumb3_ref.l": ((0.77, -0.08, 1.44), (0.79, -0.1, 1.43)),
+}
+for _finger, _y in (("index", -0.03), ("middle", -0.01), ("ring", 0.01), ("pinky", 0.03)):
+    ARP_REST_POSITIONS[f"{_finger}1_base_ref.l"] = ((0.72, _y, 1.47), (0.78, _y, 1.47))
+    for _segment, (_start, _end) in enumerate(((0.78, 0.81), (0.81, 0.83), (0.83, 0.85)), 1):
+        ARP_REST_POSITIONS[f"{_finger}{_segment}_ref.l"] = ((_start, _y, 1.47), (_end, _y, 1.47))
+
+
+def load_batch():
+    # batch.py holds the addon loading helpers shared by the command line tools
+    spec = importlib.util.spec_from_file_location("arp_to_rigify_batch", os.path.join(ADDON_DIR, "batch.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="blender -b --factory-startup --python benchmark.py --",
+        description="Time the conversion stages on synthetic Auto-Rig Pro characters")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size of the synthetic character (1.0 = 1.8 m)")
+    parser.add_argument("--extra-bones", type=int, default=0,
+                        help="Unmapped bones added to the Auto-Rig Pro rig, to test larger rigs")
+    parser.add_argument("--vertices", type=int, nargs="*", default=[10000, 100000, 1000000],
+                        help="Vertex counts of the test meshes, one parenting stage each")
+    parser.add_argument("--weights", choices=["automatic", "proxy"], default="automatic",
+                        help="Weighting used for the parenting stages")
+    parser.add_argument("--proxy-vertices", type=int, default=30000, help="Target vertex count of weight proxies")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage, the median is reported")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="A stage regresses when its median exceeds the baseline by this factor")
+    parser.add_argument("--min-delta", type=float, default=0.005,
+                        help="Slowdowns below this many seconds are never reported as regressions")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--stages", action="store_true",
+                        help="Record the addon's per-stage profiling for every operator (adds a little overhead)")
+    return parser.parse_args(argv)
+
+
+def size_label(count):
+    if count >= 1000000 and count % 1000000 == 0:
+        return f"{count // 1000000}M"
+    if count >= 1000 and count % 1000 == 0:
+        return f"{count // 1000}k"
+    return str(count)
+
+
+# ---------------------------------------------------------------------------
+# Synthetic scenes
+
+
+def rest_positions(mapping, scale, extra_bones):
+    # {ARP bone: (head, tail)} covering every reference bone of the mapping
+    positions = {}
+    for name in sorted({name for name in mapping.values() if name}):
+        if name.endswith(".r"):
+            head, tail = ARP_REST_POSITIONS.get(name[:-2] + ".l", ((0.1, 0.0, 0.0), (0.1, 0.0, 0.1)))
+            head, tail = (-head[0], head[1], head[2]), (-tail[0], tail[1], tail[2])
+        else:
+            head, tail = ARP_REST_POSITIONS.get(name, ((0.0, 0.2, 0.0), (0.0, 0.2, 0.1)))
+        positions[name] = (head, tail)
+
+    # Extra bones fan out behind the head like a hair or accessory chain
+    for index in range(extra_bones):
+        angle = 2.0 * np.pi * index / max(extra_bones, 1)
+        head = (0.05 * np.cos(angle), 0.1, 1.7 + 0.05 * np.sin(angle))
+        positions[f"extra_{index:04d}_ref.x"] = (head, (head[0], head[1] + 0.05, head[2]))
+
+    return {name: (np.multiply(head, scale), np.multiply(tail, scale)) for name, (head, tail) in positions.items()}
+
+
+def build_arp_rig(context, positions):
+    armature = bpy.data.armatures.new("rig_arp")
+    rig = bpy.data.objects.new("rig_arp", armature)
+    context.scene.collection.objects.link(rig)
+    context.view_layer.objects.active = rig
+    bpy.ops.object.mode_set(mode='EDIT')
+    for name, (head, tail) in positions.items():
+        bone = armature.edit_bones.new(name)
+        bone.head = head
+        bone.tail = tail
+    bpy.ops.object.mode_set(mode='OBJECT')
+    return rig
+
+
+def tube_geometry(head, tail, vertex_budget, radius):
+    # Open tube around a bone: (coordinates, quad vertex indices)
+    axis = tail - head
+    length = np.linalg.norm(axis)
+    direction = axis / length
+    reference = np.array([0.0, 0.0, 1.0]) if abs(direction[2]) < 0.9 else np.array([1.0, 0.0, 0.0])
+    u = np.cross(direction, reference)
+    u /= np.linalg.norm(u)
+    v = np.cross(direction, u)
+
+    segments = max(8, int(np.sqrt(vertex_budget)))
+    rings = max(2, vertex_budget // segments)
+    angles = np.linspace(0.0, 2.0 * np.pi, segments, endpoint=False)
+    circle = radius * (np.cos(angles)[:, None] * u + np.sin(angles)[:, None] * v)
+    offsets = np.linspace(0.0, 1.0, rings)[:, None] * axis
+    coordinates = (head + offsets[:, None, :] + circle[None, :, :]).reshape(-1, 3)
+
+    ring = np.arange(rings - 1)[:, None] * segments
+    column = np.arange(segments)[None, :]
+    next_column = (column + 1) % segments
+    quads = np.stack([ring + column, ring + next_column,
+                      ring + segments + next_column, ring + segments + column], axis=-1)
+    return coordinates, quads.reshape(-1, 4)
+
+
+def build_skinned_mesh(context, weights, rig, positions, vertex_count, scale):
+    # Tubes around the reference bones with about vertex_count vertices in
+    # total, split by bone length; each tube is fully weighted to its bone
+    names = [name for name in positions if not name.startswith("extra_")]
+    lengths = np.array([np.linalg.norm(positions[name][1] - positions[name][0]) for name in names])
+    budgets = np.maximum(16, (vertex_count * lengths / lengths.sum()).astype(int))
+
+    coordinates, quads, groups = [], [], []
+    offset = 0
+    for name, budget, length in zip(names, budgets, lengths):
+        radius = float(np.clip(0.3 * length, 0.01 * scale, 0.12 * scale))
+        tube_coordinates, tube_quads = tube_geometry(positions[name][0], positions[name][1], int(budget), radius)
+        coordinates.append(tube_coordinates)
+        quads.append(tube_quads + offset)
+        groups.append((name, np.arange(offset, offset + len(tube_coordinates))))
+        offset += len(tube_coordinates)
+    coordinates = np.concatenate(coordinates)
+    quads = np.concatenate(quads)
+
+    mesh = bpy.data.meshes.new(f"bench_{size_label(vertex_count)}")
+    mesh.vertices.add(len(coordinates))
+    mesh.vertices.foreach_set("co", coordinates.astype(np.float32).ravel())
+    mesh.loops.add(quads.size)
+    mesh.loops.foreach_set("vertex_index", quads.astype(np.int32).ravel())
+    mesh.polygons.add(len(quads))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, quads.size, 4, dtype=np.int32))
+    mesh.update(calc_edges=True)
+
+    mesh_obj = bpy.data.objects.new(mesh.name, mesh)
+    context.scene.collection.objects.link(mesh_obj)
+    for name, indices in groups:
+        weights.write_group(mesh_obj, name, indices, np.ones(len(indices)))
+    weights.attach_to_armature(mesh_obj, rig)
+    return mesh_obj
+
+
+# ---------------------------------------------------------------------------
+# Runs
+
+
+def timed(timings, name, function):
+    start = time.perf_counter()
+    result = function()
+    timings[name] = time.perf_counter() - start
+    if isinstance(result, set) and 'FINISHED' not in result:
+        raise RuntimeError(f"{name} returned {sorted(result)}")
+
+
+def run_once(batch, addon, args):
+    # One full conversion of a freshly built character, returns {stage: seconds}
+    bpy.ops.wm.read_homefile(use_empty=True)
+    batch.ensure_registered(addon)
+    weights = batch.load_submodule(addon, "weights")
+    context = bpy.context
+    props = context.scene.rig_selection_props
+
+    positions = rest_positions(addon.bone_mapping, args.scale, args.extra_bones)
+    auto_rig = build_arp_rig(context, positions)
+    props.auto_rig = auto_rig
+    props.keep_face_bones = False
+    props.weight_mode = args.weights.upper()
+    props.proxy_vertex_count = args.proxy_vertices
+    props.use_weight_cache = False
+    props.profile_operators = args.stages
+
+    timings = {}
+
+    def add_metarig():
+        result = bpy.ops.object.add_metarig()
+        props.rigify_rig = context.view_layer.objects.active
+        return result
+
+    def generate_rig():
+        result = bpy.ops.object.generate_rig(force=True)
+        props.rig_controls = props.rigify_rig.data.rigify_target_rig
+        return result
+
+    timed(timings, "add_metarig", add_metarig)
+    timed(timings, "delete_face_bones", bpy.ops.object.handle_face_bones)
+    timed(timings, "align_rigs", bpy.ops.object.align_rigs)
+    timed(timings, "align_bones", lambda: bpy.ops.object.align_bones(full=True))
+    timed(timings, "apply_transforms", bpy.ops.object.apply_transforms)
+    timed(timings, "generate_rig", generate_rig)
+
+    for vertex_count in args.vertices:
+        mesh_obj = build_skinned_mesh(context, weights, auto_rig, positions, vertex_count, args.scale)
+        props.meshes_to_parent.clear()
+        props.meshes_to_parent.add().obj = mesh_obj
+        timed(timings, f"parent_{size_label(vertex_count)}", bpy.ops.object.parent_with_weights)
+        mesh = mesh_obj.data
+        bpy.data.objects.remove(mesh_obj)
+        bpy.data.meshes.remove(mesh)
+
+    return timings
+
+
+def summarize(runs):
+    stages = {}
+    for name in runs[0]:
+        values = [timings[name] for timings in runs]
+        stages[name] = {"median": statistics.median(values), "min": min(values), "runs": values}
+    return stages
+
+
+def compare(stages, baseline, threshold, min_delta):
+    # Stages slower than baseline * threshold (and by more than min_delta)
+    regressions = []
+    for name, entry in stages.items():
+        reference = baseline.get("stages", {}).get(name)
+        if not reference:
+            continue
+        limit = max(reference["median"] * threshold, reference["median"] + min_delta)
+        if entry["median"] > limit:
+            regressions.append((name, reference["median"], entry["median"]))
+    return regressions
+
+
+def main():
+    args = parse_arguments(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    batch = load_batch()
+    addon = batch.load_addon()
+    workers = batch.load_submodule(addon, "workers")
+    profiling = batch.load_submodule(addon, "profiling")
+
+    config = {
+        "scale": args.scale,
+        "extra_bones": args.extra_bones,
+        "vertices": args.vertices,
+        "weights": args.weights,
+        "proxy_vertices": args.proxy_vertices,
+    }
+    print(f"benchmark: {args.repeat} run(s) of {config}")
+
+    runs = []
+    for index in range(args.repeat):
+        runs.append(run_once(batch, addon, args))
+        print(f"benchmark: run {index + 1}/{args.repeat} took {sum(runs[-1].values()):.2f}s", flush=True)
+
+    results = {
+        "environment": {
+            "blender": bpy.app.version_string,
+            "addon": ".".join(str(part) for part in addon.bl_info["version"]),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": config,
+        "stages": summarize(runs),
+    }
+    if args.stages:
+        results["profiles"] = list(profiling.history)
+
+    baseline = workers.read_json(args.baseline) if os.path.exists(args.baseline) else None
+    if baseline and baseline.get("config") != config:
+        print("benchmark: baseline was recorded with a different configuration, not comparing")
+        baseline = None
+
+    print(f"{'stage':<24}{'median':>10}{'min':>10}{'baseline':>10}{'ratio':>8}")
+    for name, entry in results["stages"].items():
+        reference = (baseline or {}).get("stages", {}).get(name)
+        line = f"{name:<24}{entry['median']:>9.3f}s{entry['min']:>9.3f}s"
+        if reference:
+            line += f"{reference['median']:>9.3f}s{entry['median'] / max(reference['median'], 1e-9):>8.2f}"
+        print(line)
+
+    regressions = compare(results["stages"], baseline, args.threshold, args.min_delta) if baseline else []
+    results["regressions"] = [{"stage": name, "baseline": before, "median": after}
+                              for name, before, after in regressions]
+    for name, before, after in regressions:
+        print(f"benchmark: REGRESSION {name}: {before:.3f}s -> {after:.3f}s (threshold x{args.threshold})")
+
+    if args.output:
+        workers.write_json_atomic(args.output, results)
+    if args.update_baseline:
+        workers.write_json_atomic(args.baseline, results)
+        print(f"benchmark: baseline written to {args.baseline}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
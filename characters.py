@@ -0,0 +1,156 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Discovery and batched conversion of every Auto-Rig Pro character in a scene.
+#
+# Characters are the armatures carrying Auto-Rig Pro reference bones. convert()
+# runs each step for all characters before moving to the next one: metarigs
+# are added, placed and transformed as data, and every metarig is pruned and
+# aligned in a single multi-object trip through edit mode, so the cost of mode
+# switches and scene updates does not grow with the number of characters.
+# Only Rigify generation runs once per character, after an optional alignment
+# check (validation.check). A character that fails a step is marked and left
+# out of the following steps.
+
+import time
+
+import bpy
+
+from . import align, api, face, library, profiling, validation
+
+# Reference bones an armature needs to count as an Auto-Rig Pro character
+MIN_REFERENCE_BONES = 10
+
+
+def discover(scene, mapping):
+    # Auto-Rig Pro armatures of the scene, by name
+    ref_names = library.reference_names(mapping)
+    required = min(MIN_REFERENCE_BONES, len(ref_names))
+    return sorted((obj for obj in scene.objects
+                   if obj.type == 'ARMATURE' and library.reference_bone_count(obj.data, ref_names) >= required),
+                  key=lambda obj: obj.name)
+
+
+def create_metarig(auto_rig):
+    # Human metarig named after auto_rig (needs Rigify, RuntimeError without)
+    try:
+        bpy.ops.object.armature_human_metarig_add()
+    except AttributeError:
+        raise RuntimeError("Rigify addon must be enabled") from None
+    metarig = bpy.context.view_layer.objects.active
+    metarig.name = f"{auto_rig.name}_metarig"
+    return metarig
+
+
+def _fail(item, step, error):
+    item.state = 'FAILED'
+    item.status = f"{step} failed: {error}"
+
+
+def convert(scene, items, mapping, prune=(), skip_unchanged=True, limits=None,
+            match_confidence=None, match_excluded=(), fit_face_bones=()):
+    # Convert the characters of items (CharacterItem entries), with the same
+    # options as the panel: with match_confidence, each character's mapping
+    # is extended with its matched bones (api.matched_mapping, match_excluded
+    # left alone), and fit_face_bones are fitted to the facial markers. With
+    # limits (ValidationReport.failures() arguments), characters whose
+    # alignment is off are not generated. Returns the number of characters
+    # that made it through every step.
+    items = [item for item in items if item.auto_rig and item.auto_rig.name in scene.objects]
+    for item in items:
+        item.state = 'PENDING'
+        item.status = "Waiting"
+    profiling.count(characters=len(items))
+
+    def active():
+        return [item for item in items if item.state != 'FAILED']
+
+    if bpy.context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    with profiling.stage("add metarigs"):
+        for item in active():
+            if item.metarig and item.metarig.name in scene.objects:
+                continue
+            try:
+                item.metarig = create_metarig(item.auto_rig)
+            except RuntimeError as e:
+                _fail(item, "Add metarig", e)
+
+    with profiling.stage("align rigs"):
+        for item in active():
+            api.align_rig(item.auto_rig, item.metarig)
+
+    # Mapping of each character, by ARP rig name
+    mappings = {}
+    with profiling.stage("match unmapped bones"):
+        for item in active():
+            if match_confidence is None:
+                mappings[item.auto_rig.name] = mapping
+                continue
+            try:
+                mappings[item.auto_rig.name] = api.matched_mapping(
+                    item.auto_rig, item.metarig, mapping, match_confidence, excluded=match_excluded)
+            except (TypeError, ValueError) as e:
+                _fail(item, "Match bones", e)
+
+    metarigs = [item.metarig for item in active()]
+    if metarigs:
+        with align.EditSession(metarigs[0], others=metarigs[1:]):
+            for item in active():
+                try:
+                    edit_bones = item.metarig.data.edit_bones
+                    align.prune_edit_bones(edit_bones, prune)
+                    item_mapping = mappings[item.auto_rig.name]
+                    aligned, missing = align.realign_edit_bones(item.metarig, item.auto_rig, item_mapping)
+                    item.status = f"Aligned {len(aligned)} bones" + (f", {len(missing)} missing" if missing else "")
+                except (KeyError, ValueError) as e:
+                    _fail(item, "Align bones", e)
+                    continue
+                if fit_face_bones:
+                    try:
+                        face.fit_edit_bones(item.metarig, item.auto_rig, item_mapping, fit_face_bones)
+                    except (KeyError, ValueError) as e:
+                        _fail(item, "Fit face bones", e)
+
+    with profiling.stage("apply transforms"):
+        for item in active():
+            try:
+                api.apply_transforms(item.metarig)
+            except (TypeError, ValueError) as e:
+                _fail(item, "Apply transforms", e)
+
+    if limits is not None:
+        for item in active():
+            failures = validation.check(item.metarig, item.auto_rig, mappings[item.auto_rig.name]).failures(*limits)
+            if failures:
+                _fail(item, "Alignment check", "; ".join(failures))
+
+    converted = 0
+    for item in active():
+        start = time.perf_counter()
+        with profiling.stage(f"generate '{item.auto_rig.name}'"):
+            try:
+                rig, generated, _previous, _digests = api.generate_rig(item.metarig, skip_unchanged)
+            except Exception as e:
+                _fail(item, "Generate rig", e)
+                continue
+        item.rig = rig
+        seconds = time.perf_counter() - start
+        item.state = 'DONE' if generated else 'SKIPPED'
+        item.status = f"Generated in {seconds:.1f} s" if generated else "Unchanged, generation skipped"
+        converted += 1
+    return converted
@@ -0,0 +1,217 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Export of converted characters to FBX and glTF for game engines.
+#
+# export_character() exports a generated rig and its meshes in the current
+# session with an engine preset (deform bones only, influences per vertex,
+# scale, axes, leaf bones, animation). Weights are limited with
+# weights.clean_up_weights, so it is meant for a session that is thrown away
+# afterwards: a batch worker, or a worker of ExportJobs.
+#
+# ExportJobs keeps the interactive session free. Each character (rig and
+# meshes) is written to a .blend with bpy.data.libraries.write, with file
+# paths made absolute so textures are still found, together with a small
+# JSON job, and exported by a background Blender process
+# (`blender -b --python batch.py -- --export-job ...`). Characters are
+# exported in parallel and their results are handed back as each one
+# finishes. Files are written to a temporary name and renamed once complete,
+# so an engine watching the folder never picks up half a file.
+
+import json
+import os
+import shutil
+import tempfile
+from concurrent import futures
+
+import bpy
+
+from . import weights, workers
+
+FORMAT_EXTENSIONS = {"FBX": ".fbx", "GLTF": ".glb"}
+
+# Engine presets. max_influences 0 keeps every influence.
+PRESETS = {
+    "GENERIC": {"deform_only": True, "max_influences": 4, "scale": 1.0, "axis_forward": '-Z', "axis_up": 'Y',
+                "add_leaf_bones": False, "animations": False},
+    "UNREAL": {"deform_only": True, "max_influences": 8, "scale": 1.0, "axis_forward": '-Y', "axis_up": 'Z',
+               "add_leaf_bones": False, "animations": True},
+    "UNITY": {"deform_only": True, "max_influences": 4, "scale": 1.0, "axis_forward": '-Z', "axis_up": 'Y',
+              "add_leaf_bones": False, "animations": True},
+    "GODOT": {"deform_only": True, "max_influences": 4, "scale": 1.0, "axis_forward": '-Z', "axis_up": 'Y',
+              "add_leaf_bones": False, "animations": True},
+}
+
+BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch.py")
+
+
+def settings_for(preset, **overrides):
+    # Settings of preset with overrides applied (None values are ignored)
+    settings = dict(PRESETS[preset])
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    return settings
+
+
+def character_meshes(rig_obj, scene):
+    # Meshes of scene parented to rig_obj or deformed by it
+    return [obj for obj in scene.objects if obj.type == 'MESH' and (
+        obj.parent == rig_obj or any(m.type == 'ARMATURE' and m.object == rig_obj for m in obj.modifiers))]
+
+
+def _export_file(filepath, export):
+    # Export to a temporary file next to filepath and move it into place
+    directory, filename = os.path.split(filepath)
+    tmp_path = os.path.join(directory, f".{os.getpid()}.{filename}")
+    try:
+        result = export(tmp_path)
+        if 'FINISHED' not in result:
+            raise RuntimeError(f"Export of {filename} returned {sorted(result)}")
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def export_character(context, rig_obj, meshes, directory, name, formats, settings):
+    # Export rig_obj and meshes as <directory>/<name>.fbx / .glb. Returns the
+    # paths written.
+    os.makedirs(directory, exist_ok=True)
+    if context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    if settings["max_influences"]:
+        deform_names = set(weights.deform_bone_names(rig_obj))
+        for mesh_obj in meshes:
+            weights.clean_up_weights(mesh_obj, deform_names, settings["max_influences"],
+                                     min_weight=0.0, normalize=True, remove_empty=False)
+
+    bpy.ops.object.select_all(action='DESELECT')
+    for obj in [rig_obj, *meshes]:
+        obj.hide_set(False)
+        obj.select_set(True)
+    context.view_layer.objects.active = rig_obj
+
+    written = []
+    for export_format in formats:
+        filepath = os.path.join(directory, name + FORMAT_EXTENSIONS[export_format])
+        if export_format == 'FBX':
+            _export_file(filepath, lambda path: bpy.ops.export_scene.fbx(
+                filepath=path, use_selection=True, object_types={'ARMATURE', 'MESH'},
+                use_armature_deform_only=settings["deform_only"], add_leaf_bones=settings["add_leaf_bones"],
+                bake_anim=settings["animations"], global_scale=settings["scale"],
+                axis_forward=settings["axis_forward"], axis_up=settings["axis_up"]))
+        else:
+            _export_file(filepath, lambda path: bpy.ops.export_scene.gltf(
+                filepath=path, export_format='GLB', use_selection=True,
+                export_def_bones=settings["deform_only"], export_animations=settings["animations"],
+                export_all_influences=not settings["max_influences"] or settings["max_influences"] > 4))
+        written.append(filepath)
+    return written
+
+
+def run_job(job_path):
+    # Worker side: append the character of an export job and export it.
+    # Returns the paths written.
+    with open(job_path) as f:
+        job = json.load(f)
+    with bpy.data.libraries.load(job["blend"], link=False) as (data_from, data_to):
+        data_to.objects = [job["rig"]] + job["meshes"]
+    rig_obj, *meshes = data_to.objects
+    if rig_obj is None:
+        raise RuntimeError(f"Rig '{job['rig']}' not found in {job['blend']}")
+    meshes = [obj for obj in meshes if obj is not None]
+    scene = bpy.context.scene
+    for obj in [rig_obj, *meshes]:
+        if obj.name not in scene.collection.objects:
+            scene.collection.objects.link(obj)
+    return export_character(bpy.context, rig_obj, meshes, job["directory"], job["name"],
+                            job["formats"], job["settings"])
+
+
+class ExportJobs:
+    # Characters exported by worker processes. start() writes and submits
+    # one job per (name, rig, meshes); poll() (non-blocking) and wait()
+    # (blocking) hand back (name, files, error) as characters finish.
+    # close() removes the job files.
+
+    def __init__(self, characters, directory, formats, settings, max_workers=0, timeout=None):
+        self.characters = list(characters)
+        self.directory = bpy.path.abspath(directory)
+        self.formats = list(formats)
+        self.settings = dict(settings)
+        self.timeout = timeout
+        self.max_workers = max(1, min(max_workers or workers.default_worker_count(), len(self.characters)))
+        self.job_directory = None
+        self._pool = None
+        self._pending = {}
+
+    def start(self):
+        self.job_directory = tempfile.mkdtemp(prefix="arp_to_rigify_export_")
+        self._pool = workers.WorkerPool(max_workers=self.max_workers)
+        used = set()
+        for index, (name, rig_obj, meshes) in enumerate(self.characters):
+            # Characters sharing a name get numbered files instead of one file
+            filename = bpy.path.clean_name(name)
+            suffix = 1
+            while filename.lower() in used:
+                filename = f"{bpy.path.clean_name(name)}_{suffix:03d}"
+                suffix += 1
+            used.add(filename.lower())
+            blend_path = os.path.join(self.job_directory, f"character_{index:03d}.blend")
+            # Absolute paths, so images still resolve from the job directory
+            bpy.data.libraries.write(blend_path, {rig_obj, *meshes}, path_remap='ABSOLUTE', fake_user=True)
+            job_path = os.path.join(self.job_directory, f"character_{index:03d}.json")
+            workers.write_json_atomic(job_path, {
+                "blend": blend_path, "rig": rig_obj.name, "meshes": [obj.name for obj in meshes],
+                "name": filename, "directory": self.directory,
+                "formats": self.formats, "settings": self.settings,
+            })
+            future = self._pool.submit(BATCH_SCRIPT, ["--export-job", job_path], timeout=self.timeout)
+            self._pending[future] = name
+        return self
+
+    @property
+    def done(self):
+        return not self._pending
+
+    def poll(self):
+        collected = []
+        for future in [future for future in self._pending if future.done()]:
+            name = self._pending.pop(future)
+            result = future.result()
+            if result.get("status") == "ok":
+                collected.append((name, result.get("files", []), None))
+            else:
+                collected.append((name, [], result.get("error", "unknown error")))
+        return collected
+
+    def wait(self):
+        while self._pending:
+            futures.wait(list(self._pending), return_when=futures.FIRST_COMPLETED)
+            yield from self.poll()
+
+    def cancel(self):
+        if self._pool is not None:
+            self._pool.cancel()
+        self._pending.clear()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=not self._pending, cancel=bool(self._pending))
+            self._pool = None
+        if self.job_directory:
+            shutil.rmtree(self.job_directory, ignore_errors=True)
+            self.job_directory = None
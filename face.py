@@ -0,0 +1,271 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Fitting of the metarig face bones to the Auto-Rig Pro facial markers.
+#
+# The stock face is first scaled and moved onto the ARP head (the metarig
+# "face" bone and eyes against the ARP head and eye bones). Its connected
+# chains (lids, lips, brows, jaw, cheeks, nose, ears...) are then refined on
+# the ARP facial reference bones, the markers:
+#   - the marker heads go into a mathutils KD-tree. Each chain collects the
+#     markers within reach of its points and every marker goes to the chain it
+#     is closest to, unless its name ties it to a chain (CHAIN_MARKERS)
+#   - each marker is projected on its chain, giving a parameter along it, and
+#     one least-squares solve gives a smooth polynomial offset of the chain
+#     (all three axes at once) that best moves the chain onto its markers.
+#     The degree follows the number of markers, so one marker shifts the chain
+#     and many bend it, with a small ridge term keeping sparse fits calm
+# Chains without markers keep the head fit. Everything runs on NumPy arrays
+# per chain, and the result is written with one foreach_set per attribute.
+
+import fnmatch
+
+import numpy as np
+from mathutils import kdtree
+
+from . import align, profiling
+
+# Metarig bone holding the face, and face bones paired with ARP bones for the
+# head fit (the head bone comes from the mapping)
+FACE_ROOT = "face"
+HEAD_BONE = "spine.006"
+FACE_ANCHORS = {"eye.L": "eye_ref.l", "eye.R": "eye_ref.r"}
+
+# ARP bones that can be facial markers: reference bones under the head
+MARKER_PATTERN = "*_ref*"
+
+# Chain (metarig name without side and number) -> ARP marker name patterns,
+# {side} being the ARP side suffix (.l, .r, .x in the middle)
+CHAIN_MARKERS = {
+    "lid.T": ("eyelid_top*{side}",),
+    "lid.B": ("eyelid_bot*{side}",),
+    "brow.T": ("eyebrow*{side}",),
+    "lip.T": ("lips_top*{side}", "lips_top*.x", "lips_corner*{side}"),
+    "lip.B": ("lips_bot*{side}", "lips_bot*.x", "lips_corner*{side}"),
+    "cheek.T": ("cheek_inflate*{side}",),
+    "cheek.B": ("cheek_smile*{side}",),
+    "nose": ("nose*.x",),
+    "chin": ("chin*.x",),
+    "ear": ("ear*{side}",),
+    "tongue": ("tong*.x",),
+}
+ARP_SIDES = {"L": ".l", "R": ".r", "": ".x"}
+
+# Reach of a chain for unnamed markers, as a fraction of the face size
+MARKER_RADIUS = 0.12
+
+# Highest degree of the chain offset, ridge weight and projection passes
+MAX_DEGREE = 3
+SMOOTHING = 1e-3
+PASSES = 2
+
+
+def _split(name):
+    # ("lid.T", "L") for lid.T.L.002, ("nose", "") for nose.001
+    parts = [part for part in name.split(".") if not part.isdigit()]
+    side = parts.pop() if len(parts) > 1 and parts[-1] in ("L", "R") else ""
+    return ".".join(parts), side
+
+
+def face_chains(edit_bones, names):
+    # Chains of connected bones among names, each listed from its root
+    names = set(names)
+    chains = []
+    for bone in edit_bones:
+        if bone.name not in names:
+            continue
+        if bone.use_connect and bone.parent and bone.parent.name in names:
+            continue
+        chain = [bone.name]
+        while True:
+            bone = next((child for child in bone.children if child.use_connect and child.name in names), None)
+            if bone is None:
+                break
+            chain.append(bone.name)
+        chains.append(chain)
+    return chains
+
+
+def _chord_parameters(points):
+    lengths = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    cumulative = np.concatenate(([0.0], np.cumsum(lengths)))
+    return cumulative / max(cumulative[-1], 1e-9)
+
+
+def project(points, polyline):
+    # Chord-length parameter (0 to 1) of the closest point of polyline to
+    # each of points, and the distance to it
+    starts = polyline[:-1]
+    vectors = polyline[1:] - starts
+    lengths2 = np.maximum((vectors ** 2).sum(axis=1), 1e-18)
+    relative = points[:, None, :] - starts[None]
+    along = np.clip((relative * vectors).sum(axis=-1) / lengths2, 0.0, 1.0)
+    distances = np.linalg.norm(relative - along[..., None] * vectors, axis=-1)
+    segment = distances.argmin(axis=1)
+    rows = np.arange(len(points))
+    parameters = _chord_parameters(polyline)
+    t = parameters[segment] + along[rows, segment] * np.diff(parameters)[segment]
+    return t, distances[rows, segment]
+
+
+def evaluate(polyline, t):
+    # Points of polyline at chord-length parameters t
+    parameters = _chord_parameters(polyline)
+    return np.stack([np.interp(t, parameters, polyline[:, axis]) for axis in range(3)], axis=1)
+
+
+def fit_chain(points, markers, max_degree=MAX_DEGREE, smoothing=SMOOTHING, passes=PASSES):
+    # points (chain joints, root first) moved by the polynomial offset that
+    # best brings the chain onto markers, in one least-squares solve per pass
+    points = np.asarray(points, dtype=np.float64)
+    markers = np.asarray(markers, dtype=np.float64)
+    degree = min(max_degree, len(markers) - 1)
+    joints = np.vander(_chord_parameters(points), degree + 1, increasing=True)
+    ridge = np.sqrt(smoothing) * np.identity(degree + 1)
+    for _ in range(passes):
+        t, _distances = project(markers, points)
+        basis = np.vstack((np.vander(t, degree + 1, increasing=True), ridge))
+        residual = np.vstack((markers - evaluate(points, t), np.zeros((degree + 1, 3))))
+        offset, *_ = np.linalg.lstsq(basis, residual, rcond=None)
+        points = points + joints @ offset
+    return points
+
+
+def fit_scale_translation(source_points, target_points):
+    # (scale, translation) that best maps source_points onto target_points,
+    # the rest pose of both rigs faces the same way so no rotation is fitted
+    source_mean = source_points.mean(axis=0)
+    target_mean = target_points.mean(axis=0)
+    source_centered = source_points - source_mean
+    variance = (source_centered ** 2).sum()
+    scale = (source_centered * (target_points - target_mean)).sum() / variance if variance > 1e-12 else 1.0
+    return scale, target_mean - scale * source_mean
+
+
+def _marker_chain(name, chain_keys):
+    # Key of the chain the name of an ARP marker points to, or None
+    for key in chain_keys:
+        base, side = key
+        for pattern in CHAIN_MARKERS.get(base, ()):
+            if fnmatch.fnmatchcase(name.replace("_ref", ""), pattern.format(side=ARP_SIDES[side])):
+                return key
+    return None
+
+
+def _assign_markers(markers, marker_points, chains, polylines, radius=MARKER_RADIUS):
+    # {chain index: marker rows}: markers named after a chain go to the
+    # nearest chain with that name, the others to the nearest chain within
+    # reach, found through a KD-tree over the markers
+    assigned = {}
+    tree = kdtree.KDTree(len(markers))
+    for row, point in enumerate(marker_points):
+        tree.insert(point, row)
+    tree.balance()
+    points = np.concatenate(polylines)
+    reach = radius * max(float(np.ptp(points, axis=0).max()), 1e-6)
+
+    # Nearest chain of every marker within reach of a chain
+    best = {}
+    for index, polyline in enumerate(polylines):
+        found = sorted({row for point in polyline for _co, row, _distance in tree.find_range(point, reach)})
+        if not found:
+            continue
+        _t, distances = project(marker_points[found], polyline)
+        for row, distance in zip(found, distances):
+            if row not in best or distance < best[row][0]:
+                best[row] = (distance, index)
+
+    # Markers named after a chain go to the nearest chain with that name
+    chain_keys = {}
+    for index, chain in enumerate(chains):
+        chain_keys.setdefault(_split(chain[0]), []).append(index)
+    for row, name in enumerate(markers):
+        key = _marker_chain(name, chain_keys)
+        if key is not None:
+            candidates = chain_keys[key]
+            distances = [project(marker_points[[row]], polylines[index])[1][0] for index in candidates]
+            assigned.setdefault(candidates[int(np.argmin(distances))], []).append(row)
+        elif row in best:
+            assigned.setdefault(best[row][1], []).append(row)
+
+    return assigned
+
+
+def fit_edit_bones(metarig, source_rig, mapping, names, radius=MARKER_RADIUS):
+    # Fit the face bones among names to the ARP facial markers. Must be called
+    # with metarig in edit mode. Returns (fitted names, chains fitted to
+    # markers, markers used); raises ValueError without an ARP head.
+    edit_bones = metarig.data.edit_bones
+    names = [name for name in names if name in edit_bones]
+    if not names:
+        return [], 0, 0
+    face_names, face_heads, face_tails = align.read_mapped_rest_positions(metarig, {name: name for name in names})
+    face_index = {name: row for row, name in enumerate(face_names)}
+
+    bones = source_rig.data.edit_bones if source_rig.mode == 'EDIT' else source_rig.data.bones
+    source_names, source_heads, source_tails = align.read_mapped_rest_positions(
+        source_rig, {name: name for name in bones.keys()})
+    source_index = {name: row for row, name in enumerate(source_names)}
+    head = mapping.get(HEAD_BONE)
+    if head not in source_index:
+        raise ValueError(f"Auto-Rig Pro head bone '{head}' not found, the face cannot be fitted")
+
+    # Stock face scaled and moved onto the ARP head
+    with profiling.stage("fit face to head"):
+        anchors = [(FACE_ROOT, head)] + list(FACE_ANCHORS.items())
+        anchors = [(target, source) for target, source in anchors if target in face_index and source in source_index]
+        if not anchors:
+            raise ValueError(f"Metarig bone '{FACE_ROOT}' not found, the face cannot be fitted")
+        target_rows = [face_index[target] for target, _source in anchors]
+        source_rows = [source_index[source] for _target, source in anchors]
+        scale, translation = fit_scale_translation(
+            np.concatenate((face_heads[target_rows], face_tails[target_rows])),
+            np.concatenate((source_heads[source_rows], source_tails[source_rows])))
+        heads = face_heads * scale + translation
+        tails = face_tails * scale + translation
+
+    # Facial markers: reference bones under the ARP head that the mapping
+    # and the head fit do not use
+    parents = {bone.name: bone.parent.name if bone.parent else None for bone in bones}
+    used = set(mapping.values()) | {source for _target, source in anchors}
+
+    def under_head(name):
+        name = parents.get(name)
+        while name is not None and name != head:
+            name = parents.get(name)
+        return name == head
+
+    markers = [name for name in source_names
+               if name not in used and fnmatch.fnmatchcase(name, MARKER_PATTERN) and under_head(name)]
+    chains = face_chains(edit_bones, names)
+    polylines = [np.concatenate((heads[[face_index[name] for name in chain]],
+                                 tails[[face_index[chain[-1]]]])) for chain in chains]
+    profiling.count(chains=len(chains), markers=len(markers))
+    assigned = {}
+    if markers:
+        assigned = _assign_markers(markers, source_heads[[source_index[name] for name in markers]],
+                                   chains, polylines, radius)
+
+    with profiling.stage("fit chains", chains=len(assigned)):
+        marker_points = source_heads[[source_index[name] for name in markers]]
+        for index, rows in assigned.items():
+            points = fit_chain(polylines[index], marker_points[rows])
+            chain_rows = [face_index[name] for name in chains[index]]
+            heads[chain_rows] = points[:-1]
+            tails[chain_rows] = points[1:]
+
+    align.write_edit_bone_positions(metarig, face_names, heads, tails)
+    return face_names, len(assigned), sum(len(rows) for rows in assigned.values())
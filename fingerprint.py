@@ -0,0 +1,177 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Content fingerprints of meshes and skeletons.
+#
+# Data is read in bulk with foreach_get and hashed as raw bytes, so
+# fingerprinting a mesh costs a few memory copies rather than a Python loop.
+# Metarig fingerprints are stored on the generated rig so an unchanged metarig
+# does not have to be generated again.
+
+import hashlib
+import json
+
+import bpy
+import numpy as np
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _read(collection, attribute, dtype, width=1):
+    values = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attribute, values)
+    return values
+
+
+def _update_matrix(hasher, matrix):
+    hasher.update(np.array(matrix, dtype=np.float32).round(6).tobytes())
+
+
+def mesh_fingerprint(mesh_obj, relative_to=None):
+    # Vertex positions and face topology of the mesh data; relative_to adds the
+    # object's transform in that object's space (weights depend on placement)
+    mesh = mesh_obj.data
+    hasher = _hasher()
+    hasher.update(len(mesh.vertices).to_bytes(8, "little"))
+    hasher.update(_read(mesh.vertices, "co", np.float32, 3).tobytes())
+    hasher.update(_read(mesh.polygons, "loop_start", np.int32).tobytes())
+    hasher.update(_read(mesh.loops, "vertex_index", np.int32).tobytes())
+    hasher.update(_read(mesh.edges, "vertices", np.int32, 2).tobytes())
+    if relative_to is not None:
+        _update_matrix(hasher, relative_to.matrix_world.inverted() @ mesh_obj.matrix_world)
+    return hasher.hexdigest()
+
+
+def deform_skeleton_fingerprint(rig_obj):
+    # Names and rest heads/tails of the deform bones
+    bones = rig_obj.data.bones
+    deform = _read(bones, "use_deform", bool)
+    heads = _read(bones, "head_local", np.float32, 3).reshape(-1, 3)[deform]
+    tails = _read(bones, "tail_local", np.float32, 3).reshape(-1, 3)[deform]
+    names = [name for name, used in zip(bones.keys(), deform) if used]
+    return bone_positions_fingerprint(names, heads, tails)
+
+
+def bone_positions_fingerprint(names, heads, tails):
+    # Bone names with their (N, 3) head and tail arrays
+    hasher = _hasher()
+    hasher.update("\0".join(names).encode())
+    hasher.update(np.asarray(heads, dtype=np.float32).round(6).tobytes())
+    hasher.update(np.asarray(tails, dtype=np.float32).round(6).tobytes())
+    return hasher.hexdigest()
+
+
+def combine(*parts):
+    hasher = _hasher()
+    for part in parts:
+        hasher.update(str(part).encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+# Custom properties on the generated rig recording what it was generated from
+RIG_FINGERPRINT_PROP = "arp_to_rigify_fingerprint"
+RIG_BONES_PROP = "arp_to_rigify_bone_fingerprints"
+
+# Armature settings that point at generation outputs rather than inputs
+_IGNORED_RIGIFY_SETTINGS = {"rigify_target_rig", "rigify_rig_ui", "rigify_widgets_collection"}
+
+
+def _rna_values(struct, prefix="", depth=0):
+    # Stable text form of the RNA properties of a struct (rigify parameters)
+    values = []
+    if struct is None or depth > 2:
+        return values
+    for prop in struct.bl_rna.properties:
+        identifier = prop.identifier
+        if identifier == "rna_type" or not identifier.startswith(prefix) or identifier in _IGNORED_RIGIFY_SETTINGS:
+            continue
+        value = getattr(struct, identifier, None)
+        if prop.type == 'POINTER':
+            value = getattr(value, "name", None) if isinstance(value, bpy.types.ID) else _rna_values(value, depth=depth + 1)
+        elif prop.type == 'COLLECTION':
+            value = [_rna_values(item, depth=depth + 1) for item in value]
+        elif hasattr(value, "__len__") and not isinstance(value, str):
+            value = [round(v, 6) if isinstance(v, float) else v for v in value]
+        elif isinstance(value, float):
+            value = round(value, 6)
+        values.append((identifier, value))
+    return values
+
+
+def metarig_bone_fingerprints(metarig):
+    # {bone name: digest} of each bone's rest data and rigify settings
+    bones = metarig.data.bones
+    pose_bones = metarig.pose.bones
+    heads = _read(bones, "head_local", np.float32, 3).reshape(-1, 3).round(6)
+    tails = _read(bones, "tail_local", np.float32, 3).reshape(-1, 3).round(6)
+    matrices = _read(bones, "matrix_local", np.float32, 16).reshape(-1, 16).round(6)
+
+    digests = {}
+    for index, bone in enumerate(bones):
+        hasher = _hasher()
+        hasher.update(heads[index].tobytes())
+        hasher.update(tails[index].tobytes())
+        hasher.update(matrices[index].tobytes())
+        pose_bone = pose_bones.get(bone.name)
+        settings = (
+            bone.parent.name if bone.parent else "",
+            bone.use_connect,
+            bone.use_deform,
+            [collection.name for collection in getattr(bone, "collections", [])],
+            getattr(pose_bone, "rigify_type", ""),
+            _rna_values(getattr(pose_bone, "rigify_parameters", None)),
+        )
+        hasher.update(repr(settings).encode())
+        digests[bone.name] = hasher.hexdigest()
+    return digests
+
+
+def metarig_fingerprint(metarig, bone_digests=None):
+    bone_digests = bone_digests if bone_digests is not None else metarig_bone_fingerprints(metarig)
+    hasher = _hasher()
+    for name in sorted(bone_digests):
+        hasher.update(name.encode())
+        hasher.update(bone_digests[name].encode())
+    _update_matrix(hasher, metarig.matrix_world)
+    hasher.update(repr(_rna_values(metarig.data, prefix="rigify_")).encode())
+    return hasher.hexdigest()
+
+
+def stored_fingerprint(rig_obj):
+    # (digest, {bone: digest}) stored on a generated rig, or (None, {})
+    if rig_obj is None or RIG_FINGERPRINT_PROP not in rig_obj:
+        return None, {}
+    try:
+        bones = json.loads(rig_obj.get(RIG_BONES_PROP, "{}"))
+    except ValueError:
+        bones = {}
+    return rig_obj[RIG_FINGERPRINT_PROP], bones
+
+
+def store_fingerprint(rig_obj, digest, bone_digests):
+    rig_obj[RIG_FINGERPRINT_PROP] = digest
+    rig_obj[RIG_BONES_PROP] = json.dumps(bone_digests, sort_keys=True)
+
+
+def diff_bones(previous, current):
+    # (added, removed, changed) bone names between two {bone: digest} maps
+    added = sorted(set(current) - set(previous))
+    removed = sorted(set(previous) - set(current))
+    changed = sorted(name for name in set(current) & set(previous) if current[name] != previous[name])
+    return added, removed, changed
@@ -0,0 +1,92 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Loading only the Auto-Rig Pro armature out of a .blend file.
+#
+# bpy.data.libraries.load appends just the requested datablocks and their
+# dependencies, so the meshes, images and actions of a production file are
+# never read. Without an object name, the armature datablocks (bones only)
+# are appended first to find the one carrying the most reference bones, then
+# the object using it is appended and linked to the scene.
+
+import fnmatch
+
+import bpy
+
+
+def reference_names(mapping):
+    return {name for name in mapping.values() if name}
+
+
+def reference_bone_count(armature, ref_names):
+    return sum(1 for name in armature.bones.keys() if name in ref_names)
+
+
+def best_armature_name(filepath, mapping):
+    # Name of the armature datablock with the most reference bones, or None
+    with bpy.data.libraries.load(filepath, link=False) as (data_from, data_to):
+        data_to.armatures = list(data_from.armatures)
+
+    ref_names = reference_names(mapping)
+    best, best_count = None, 0
+    for armature in data_to.armatures:
+        if armature is None:
+            continue
+        count = reference_bone_count(armature, ref_names)
+        if count > best_count:
+            best, best_count = armature.name, count
+        bpy.data.armatures.remove(armature)
+    return best
+
+
+def load_armature(filepath, mapping, name=None, pattern="*rig*", scene=None):
+    # Append the Auto-Rig Pro armature object of filepath into scene and
+    # return it. name picks the object; otherwise the object named like the
+    # best armature datablock, or else the armatures whose object name
+    # matches pattern, are tried. Raises RuntimeError when none is found.
+    scene = scene or bpy.context.scene
+    ref_names = reference_names(mapping)
+    data_name = None if name else best_armature_name(filepath, mapping)
+
+    with bpy.data.libraries.load(filepath, link=False) as (data_from, data_to):
+        if name:
+            wanted = [name] if name in data_from.objects else []
+        elif data_name in data_from.objects:
+            wanted = [data_name]
+        else:
+            wanted = fnmatch.filter(data_from.objects, pattern)
+        data_to.objects = wanted
+
+    candidates = [obj for obj in data_to.objects if obj is not None]
+    best, best_count = None, -1
+    for obj in candidates:
+        if obj.type != 'ARMATURE':
+            continue
+        count = reference_bone_count(obj.data, ref_names)
+        if (name or count) and count > best_count:
+            best, best_count = obj, count
+
+    # Anything else that came along is dropped right away
+    for obj in candidates:
+        if obj != best:
+            bpy.data.objects.remove(obj)
+
+    if best is None:
+        if name:
+            raise RuntimeError(f"Armature '{name}' not found in {filepath}")
+        raise RuntimeError(f"No Auto-Rig Pro armature with reference bones found in {filepath}")
+    scene.collection.objects.link(best)
+    return best
@@ -0,0 +1,199 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Live sync of Auto-Rig Pro reference bone edits into the metarig.
+#
+# A depsgraph_update_post handler only checks whether the Auto-Rig Pro rig was
+# among the updated IDs and schedules a timer; the timer realigns the bones
+# whose source moved (align.realign_edit_bones). While an edit is in progress
+# a sync runs at most once per interval, and one more runs after the last
+# edit, so dragging a marker costs one comparison per depsgraph update rather
+# than one realignment per frame.
+#
+# Bone rest positions can only be written in edit mode. While the Auto-Rig
+# Pro rig is edited on its own, the metarig cannot be entered without taking
+# the user out of their edit session, so the sync waits: the timer checks the
+# mode again every WAIT_INTERVAL and syncs once the user is back in object
+# mode, and waiting() lets the panel say so. Editing both armatures together
+# (multi-object edit mode) syncs live.
+
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+from . import align
+
+# Shortest delay between an edit and the sync it triggers
+MIN_DELAY = 0.02
+
+# Delay between two mode checks while a sync waits for object mode
+WAIT_INTERVAL = 0.5
+
+# Returns the bone mapping of a scene's props, set by register()
+_mapping_for = None
+
+# Scene whose edits are waiting for a sync, whether that sync waits for the
+# user to leave edit mode, why the last sync failed ("" if it did not), and
+# when the last sync finished
+_pending_scene = None
+_waiting = False
+_error = ""
+_last_sync = 0.0
+
+
+def waiting():
+    # True while edits wait for the user to leave edit mode
+    return _waiting
+
+
+def error():
+    # Why the last sync was skipped, "" when it went through
+    return _error
+
+
+def _watched(props):
+    auto_rig = props.auto_rig
+    if not (props.live_sync and auto_rig and props.rigify_rig):
+        return None
+    return auto_rig
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    global _pending_scene
+    if _pending_scene is not None:
+        return
+    auto_rig = _watched(scene.rig_selection_props)
+    if auto_rig is None:
+        return
+    for changed in depsgraph.updates:
+        original = changed.id.original
+        if original == auto_rig or original == auto_rig.data:
+            break
+    else:
+        return
+
+    _pending_scene = scene.name
+    interval = scene.rig_selection_props.live_sync_interval
+    delay = max(MIN_DELAY, interval - (time.perf_counter() - _last_sync))
+    bpy.app.timers.register(_sync, first_interval=delay)
+
+
+def _sync():
+    global _pending_scene, _waiting, _error, _last_sync
+    scene = bpy.data.scenes.get(_pending_scene or "")
+    if scene is None or _watched(scene.rig_selection_props) is None:
+        _pending_scene = None
+        _waiting = False
+        return None
+
+    props = scene.rig_selection_props
+    try:
+        aligned = sync_metarig(bpy.context, props.auto_rig, props.rigify_rig, _mapping_for(props))
+    except (OSError, RuntimeError, ValueError) as e:
+        # Typically a mode switch that is not possible right now, the next
+        # edit tries again
+        if str(e) != _error:
+            _error = str(e)
+            _redraw_panels()
+        aligned = []
+    else:
+        if _error and aligned is not None:
+            _error = ""
+            _redraw_panels()
+    if aligned is None:
+        # Keep the edits pending (the handler schedules nothing meanwhile)
+        # and look again later
+        if not _waiting:
+            _waiting = True
+            _redraw_panels()
+        return WAIT_INTERVAL
+    _pending_scene = None
+    if _waiting:
+        _waiting = False
+        _redraw_panels()
+    _last_sync = time.perf_counter()
+    return None
+
+
+def _redraw_panels():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+def sync_metarig(context, auto_rig, metarig, mapping):
+    # Realign the metarig bones whose Auto-Rig Pro bone moved. A metarig in
+    # edit mode (multi-object editing with the ARP rig) is written directly;
+    # otherwise it takes a trip through edit mode, which is only done from
+    # object mode so the user's own mode is never interrupted. Returns the
+    # aligned names, or None if the sync had to wait.
+    if metarig.mode == 'EDIT':
+        aligned, _missing = align.realign_edit_bones(metarig, auto_rig, mapping)
+        if aligned:
+            metarig.data.update_tag()
+        return aligned
+    if context.mode != 'OBJECT':
+        return None
+
+    with align.EditSession(metarig) as session:
+        aligned, _missing = session.realign(auto_rig, mapping)
+    return aligned
+
+
+def _stop_timer():
+    global _pending_scene, _waiting, _error
+    if bpy.app.timers.is_registered(_sync):
+        bpy.app.timers.unregister(_sync)
+    _pending_scene = None
+    _waiting = False
+    _error = ""
+
+
+def update():
+    # Install the depsgraph handler while any scene has live sync enabled
+    handlers = bpy.app.handlers.depsgraph_update_post
+    enabled = any(getattr(s.rig_selection_props, "live_sync", False) for s in bpy.data.scenes)
+    if enabled and _on_depsgraph_update not in handlers:
+        handlers.append(_on_depsgraph_update)
+    elif not enabled:
+        if _on_depsgraph_update in handlers:
+            handlers.remove(_on_depsgraph_update)
+        _stop_timer()
+
+
+@persistent
+def _on_load_post(*_args):
+    # Loading a file drops the timer, so a pending sync would block the
+    # handler for good
+    _stop_timer()
+    update()
+
+
+def register(mapping_for):
+    global _mapping_for
+    _mapping_for = mapping_for
+    bpy.app.handlers.load_post.append(_on_load_post)
+
+
+def unregister():
+    for handlers, handler in ((bpy.app.handlers.depsgraph_update_post, _on_depsgraph_update),
+                              (bpy.app.handlers.load_post, _on_load_post)):
+        if handler in handlers:
+            handlers.remove(handler)
+    _stop_timer()
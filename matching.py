@@ -0,0 +1,231 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Spatial matching of the metarig bones the bone mapping does not cover.
+#
+# A similarity transform (scale, rotation, translation) fitted on the mapped
+# bone pairs predicts where each unmapped metarig bone sits on the Auto-Rig Pro
+# rig. The heads of the candidate ARP bones go into a mathutils KD-tree, so
+# each unmapped bone only scores its few nearest candidates on head and tail
+# distance, direction and hierarchy instead of scanning every bone. Each ARP
+# bone is given to at most one metarig bone, best confidence first.
+#
+# The result is cached on the ARP rig as JSON, keyed by a fingerprint of the
+# bones it was computed from. Matching predicts from the metarig's own layout,
+# so it works best before the bones are aligned.
+
+import fnmatch
+import json
+
+import numpy as np
+from mathutils import kdtree
+
+from . import align, fingerprint, profiling
+
+# Custom property on the ARP rig holding the last matches
+MATCHES_PROP = "arp_to_rigify_matches"
+
+# ARP bones that can be matched (reference bones)
+CANDIDATE_PATTERN = "*_ref*"
+
+# Nearest candidates scored per unmapped bone
+NEIGHBOURS = 8
+
+# Head/tail error, as a fraction of the rig's size, at which the position
+# part of the confidence drops to 1/e
+DISTANCE_FALLOFF = 0.04
+
+# Confidence factor of a candidate outside the ARP chain of the metarig bone's
+# nearest mapped ancestor
+HIERARCHY_PENALTY = 0.8
+
+# Metarig bones placed by other means (see align.position_spine_004)
+SKIPPED_BONES = {"spine.004"}
+
+# Matches below this confidence are reported but not used by default
+MIN_CONFIDENCE = 0.5
+
+
+def _rest_positions(rig):
+    # Names, world heads and tails of every bone of rig
+    bones = rig.data.edit_bones if rig.mode == 'EDIT' else rig.data.bones
+    return align.read_mapped_rest_positions(rig, {name: name for name in bones.keys()})
+
+
+def _parents(rig):
+    bones = rig.data.edit_bones if rig.mode == 'EDIT' else rig.data.bones
+    return {bone.name: bone.parent.name if bone.parent else None for bone in bones}
+
+
+def _descends_from(parents, name, ancestor):
+    name = parents.get(name)
+    while name is not None:
+        if name == ancestor:
+            return True
+        name = parents.get(name)
+    return False
+
+
+def fit_similarity(source_points, target_points):
+    # 4x4 matrix of the scale, rotation and translation that best maps
+    # source_points onto target_points (Umeyama). Translation only when the
+    # points cannot define a rotation.
+    source_points = np.asarray(source_points, dtype=np.float64)
+    target_points = np.asarray(target_points, dtype=np.float64)
+    matrix = np.identity(4)
+    if not len(source_points):
+        return matrix
+
+    source_mean = source_points.mean(axis=0)
+    target_mean = target_points.mean(axis=0)
+    source_centered = source_points - source_mean
+    target_centered = target_points - target_mean
+    variance = (source_centered ** 2).sum() / len(source_points)
+    if len(source_points) < 3 or variance < 1e-12:
+        matrix[:3, 3] = target_mean - source_mean
+        return matrix
+
+    u, s, vt = np.linalg.svd(target_centered.T @ source_centered / len(source_points))
+    d = np.ones(3)
+    d[2] = np.sign(np.linalg.det(u) * np.linalg.det(vt)) or 1.0
+    rotation = u @ np.diag(d) @ vt
+    scale = (s * d).sum() / variance
+    matrix[:3, :3] = scale * rotation
+    matrix[:3, 3] = target_mean - scale * rotation @ source_mean
+    return matrix
+
+
+def _directions(heads, tails):
+    vectors = tails - heads
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(lengths, 1e-9)
+
+
+def match_bones(source_rig, metarig, mapping, pattern=CANDIDATE_PATTERN, neighbours=NEIGHBOURS, excluded=()):
+    # Match the metarig bones with an empty or unresolved source in mapping
+    # (bones missing from mapping and excluded ones, e.g. face bones, are
+    # left alone) to ARP bones whose names match pattern and that mapping does
+    # not use. Returns [(metarig bone, ARP bone, confidence)] sorted by
+    # metarig bone.
+    source_names, source_heads, source_tails = _rest_positions(source_rig)
+    target_names, target_heads, target_tails = _rest_positions(metarig)
+    source_index = {name: row for row, name in enumerate(source_names)}
+    target_index = {name: row for row, name in enumerate(target_names)}
+
+    mapped = {target: source for target, source in mapping.items()
+              if source in source_index and target in target_index}
+    excluded = SKIPPED_BONES.union(excluded)
+    unmapped = [name for name in mapping if name in target_index and name not in mapped and name not in excluded]
+    used = set(mapping.values())
+    candidates = [row for row, name in enumerate(source_names)
+                  if name not in used and fnmatch.fnmatchcase(name, pattern)]
+    profiling.count(bones=len(unmapped), candidates=len(candidates))
+    if not unmapped or not candidates:
+        return []
+
+    # Where the unmapped bones would land if the metarig were fitted as a whole
+    with profiling.stage("fit metarig to ARP rig", bones=len(mapped)):
+        target_rows = [target_index[name] for name in mapped]
+        source_rows = [source_index[name] for name in mapped.values()]
+        matrix = fit_similarity(np.concatenate((target_heads[target_rows], target_tails[target_rows])),
+                                np.concatenate((source_heads[source_rows], source_tails[source_rows])))
+        rows = [target_index[name] for name in unmapped]
+        predicted_heads = align.transform_points(target_heads[rows], matrix)
+        predicted_tails = align.transform_points(target_tails[rows], matrix)
+
+    with profiling.stage("build KD-tree", bones=len(candidates)):
+        tree = kdtree.KDTree(len(candidates))
+        for i, row in enumerate(candidates):
+            tree.insert(source_heads[row], i)
+        tree.balance()
+        candidate_rows = np.array(candidates)
+        points = np.concatenate((source_heads[candidate_rows], source_tails[candidate_rows]))
+        size = max(float(np.ptp(points, axis=0).max()), 1e-6)
+
+    source_parents = _parents(source_rig)
+    target_parents = _parents(metarig)
+    scored = []
+    with profiling.stage("score candidates", bones=len(unmapped)):
+        for i, name in enumerate(unmapped):
+            found = [index for _co, index, _distance in tree.find_n(predicted_heads[i], neighbours)]
+            rows = candidate_rows[found]
+            error = (np.linalg.norm(source_heads[rows] - predicted_heads[i], axis=1)
+                     + np.linalg.norm(source_tails[rows] - predicted_tails[i], axis=1)) / (2.0 * size)
+            alignment = _directions(source_heads[rows], source_tails[rows]) @ _directions(predicted_heads[i], predicted_tails[i])
+            confidence = np.exp(-error / DISTANCE_FALLOFF) * (0.5 + 0.5 * np.clip(alignment, 0.0, 1.0))
+
+            # The nearest mapped ancestor's ARP bone should be an ancestor of the match
+            ancestor = target_parents.get(name)
+            while ancestor is not None and ancestor not in mapped:
+                ancestor = target_parents.get(ancestor)
+            if ancestor is not None:
+                for j, row in enumerate(rows):
+                    if not _descends_from(source_parents, source_names[row], mapped[ancestor]):
+                        confidence[j] *= HIERARCHY_PENALTY
+
+            scored.extend((float(value), name, source_names[row]) for value, row in zip(confidence, rows))
+
+    matches = {}
+    taken = set()
+    for confidence, target, source in sorted(scored, reverse=True):
+        if target in matches or source in taken:
+            continue
+        matches[target] = (target, source, round(confidence, 3))
+        taken.add(source)
+    return [matches[name] for name in sorted(matches)]
+
+
+def _cache_key(source_rig, metarig, mapping, pattern, excluded):
+    # Both rigs' rest positions, since candidates are scored against the
+    # metarig's placement
+    return fingerprint.combine(fingerprint.bone_positions_fingerprint(*_rest_positions(source_rig)),
+                               metarig.name, fingerprint.bone_positions_fingerprint(*_rest_positions(metarig)),
+                               sorted(mapping.items()), pattern, sorted(excluded))
+
+
+def stored_matches(source_rig):
+    # Matches cached on source_rig, or an empty list
+    try:
+        return [tuple(match) for match in json.loads(source_rig.get(MATCHES_PROP, ""))["matches"]]
+    except (ValueError, KeyError, TypeError):
+        return []
+
+
+def resolve(source_rig, metarig, mapping, pattern=CANDIDATE_PATTERN, use_cache=True, excluded=()):
+    # match_bones() through the cache on source_rig. Returns (matches, cached).
+    key = _cache_key(source_rig, metarig, mapping, pattern, excluded)
+    if use_cache:
+        try:
+            cached = json.loads(source_rig.get(MATCHES_PROP, ""))
+        except ValueError:
+            cached = None
+        if cached and cached.get("key") == key:
+            return [tuple(match) for match in cached["matches"]], True
+
+    with profiling.stage("match unmapped bones"):
+        matches = match_bones(source_rig, metarig, mapping, pattern, excluded=excluded)
+    source_rig[MATCHES_PROP] = json.dumps({"key": key, "matches": matches})
+    return matches, False
+
+
+def extend_mapping(mapping, matches, min_confidence=MIN_CONFIDENCE):
+    # mapping with the matches at or above min_confidence filled in (matches
+    # only cover bones that mapping leaves empty or unresolved)
+    extended = dict(mapping)
+    for target, source, confidence in matches:
+        if confidence >= min_confidence:
+            extended[target] = source
+    return extended
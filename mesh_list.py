@@ -0,0 +1,160 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Membership and upkeep of the list of meshes to parent.
+#
+# With the 'LIST' source the meshes are the pointers of meshes_to_parent. With
+# 'COLLECTIONS' they are read from the chosen collections only when an
+# operator needs them, so nothing is copied and membership follows the
+# collections. Stale list entries (deleted objects, objects no longer in the
+# scene) are pruned in one pass: the surviving pointers are gathered and the
+# collection property is rebuilt, where removing entries one by one would
+# shift the rest of the list each time. The depsgraph handler only checks
+# whether objects were updated at all and schedules a timer; the timer
+# compares the session ids of the scene's objects with the last ones seen and
+# prunes when any went away (even if others were added in the same burst), so
+# scene data is never written from inside the handler and a burst of updates
+# costs one check.
+
+import bpy
+from bpy.app.handlers import persistent
+
+# Delay between an object update and the check it triggers
+CHECK_DELAY = 0.5
+
+# Session ids of the scene objects at the last check, by scene name, and the
+# scenes waiting for one
+_scene_objects = {}
+_pending_scenes = set()
+
+
+def is_empty(props):
+    if props.mesh_source == 'COLLECTIONS':
+        return not any(item.collection for item in props.mesh_collections)
+    return not props.meshes_to_parent
+
+
+def collection_meshes(props, scene):
+    # Meshes of the chosen collections that are in scene, each once, in
+    # collection order
+    in_scene = set(scene.objects.keys())
+    meshes = []
+    seen = set()
+    for item in props.mesh_collections:
+        collection = item.collection
+        if collection is None:
+            continue
+        objects = collection.all_objects if props.include_child_collections else collection.objects
+        for obj in objects:
+            if obj.type == 'MESH' and obj.name not in seen and obj.name in in_scene:
+                seen.add(obj.name)
+                meshes.append(obj)
+    return meshes
+
+
+def meshes(props, scene):
+    # The meshes to parent, from the list or the collections
+    if props.mesh_source == 'COLLECTIONS':
+        return collection_meshes(props, scene)
+    return [item.obj for item in props.meshes_to_parent
+            if item.obj and item.obj.type == 'MESH' and item.obj.name in scene.objects]
+
+
+def prune(props, scene):
+    # Drop list entries whose object is gone from scene, or listed twice, in
+    # one rebuild. Returns the number of entries removed.
+    items = props.meshes_to_parent
+    in_scene = set(scene.objects.keys())
+    kept = []
+    seen = set()
+    for item in items:
+        obj = item.obj
+        if obj is not None and obj.name in in_scene and obj.name not in seen:
+            seen.add(obj.name)
+            kept.append(obj)
+    removed = len(items) - len(kept)
+    if removed:
+        active = items[props.active_mesh_index].obj if 0 <= props.active_mesh_index < len(items) else None
+        items.clear()
+        for obj in kept:
+            items.add().obj = obj
+        props.active_mesh_index = kept.index(active) if active in kept else min(props.active_mesh_index, max(len(kept) - 1, 0))
+    return removed
+
+
+def add(props, scene, objects):
+    # Append the meshes of objects that are not listed yet, after pruning.
+    # Returns (added, pruned).
+    pruned = prune(props, scene)
+    listed = {item.obj.name for item in props.meshes_to_parent}
+    added = 0
+    for obj in objects:
+        if obj.type == 'MESH' and obj.name not in listed:
+            listed.add(obj.name)
+            props.meshes_to_parent.add().obj = obj
+            added += 1
+    return added, pruned
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    if not depsgraph.id_type_updated('OBJECT'):
+        return
+    _pending_scenes.add(scene.name)
+    if not bpy.app.timers.is_registered(_check_scenes):
+        bpy.app.timers.register(_check_scenes, first_interval=CHECK_DELAY)
+
+
+def _check_scenes():
+    for name in list(_pending_scenes):
+        _pending_scenes.discard(name)
+        scene = bpy.data.scenes.get(name)
+        if scene is None:
+            continue
+        current = {obj.session_uid for obj in scene.objects}
+        previous = _scene_objects.get(name)
+        _scene_objects[name] = current
+        if previous is not None and not previous <= current:
+            props = scene.rig_selection_props
+            if props.meshes_to_parent:
+                prune(props, scene)
+    return None
+
+
+def _stop_timer():
+    if bpy.app.timers.is_registered(_check_scenes):
+        bpy.app.timers.unregister(_check_scenes)
+    _pending_scenes.clear()
+
+
+@persistent
+def _on_load_post(*_args):
+    _stop_timer()
+    _scene_objects.clear()
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update)
+    bpy.app.handlers.load_post.append(_on_load_post)
+
+
+def unregister():
+    for handlers, handler in ((bpy.app.handlers.depsgraph_update_post, _on_depsgraph_update),
+                              (bpy.app.handlers.load_post, _on_load_post)):
+        if handler in handlers:
+            handlers.remove(handler)
+    _stop_timer()
+    _scene_objects.clear()
@@ -0,0 +1,230 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Automatic weights solved by a pool of background Blender processes.
+#
+# Meshes are packed into jobs by vertex count, largest first. Each job is a
+# small .blend written with bpy.data.libraries.write: a bare object sharing
+# the rig's armature data and a copy of every mesh of the job, without
+# materials or modifiers, at the same world placement. A worker
+# (`blender -b --python batch.py -- --weight-job ...`) appends them, solves
+# each mesh and writes the deform weights as compact .npz files: int32
+# vertices, uint16 groups and the weights as uint16 multiples of
+# weights.WEIGHT_QUANTUM, which is exactly what write_group() keeps. Results
+# are picked up as jobs finish and applied with weights.apply_weights().
+#
+# A mesh that fails is reported on its own. A job that dies without a result
+# (crash, memory limit, timeout) is split and its meshes are retried one per
+# worker, so one bad mesh does not take its job mates down with it.
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent import futures
+
+import bpy
+import numpy as np
+
+from . import weights, workers
+
+# Jobs made per worker, so results come back while the pool is still busy
+JOBS_PER_WORKER = 3
+
+# Name of the temporary objects written to job files
+JOB_OBJECT_PREFIX = "arp_weight_job"
+
+BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch.py")
+
+
+def save_weights(filepath, group_names, vertices, groups, values):
+    # Compact form of sparse weight triplets (see the module comment)
+    np.savez_compressed(
+        filepath,
+        group_names=np.array(group_names, dtype=str),
+        vertices=np.asarray(vertices, dtype=np.int32),
+        groups=np.asarray(groups, dtype=np.uint16),
+        weights=np.round(np.asarray(values, dtype=np.float64) / weights.WEIGHT_QUANTUM).astype(np.uint16),
+    )
+
+
+def load_weights(filepath):
+    # (group_names, vertices, groups, weights) saved by save_weights()
+    with np.load(filepath, allow_pickle=False) as data:
+        return (list(data["group_names"]), data["vertices"], data["groups"].astype(np.int32),
+                data["weights"].astype(np.float32) * np.float32(weights.WEIGHT_QUANTUM))
+
+
+def plan_jobs(meshes, job_count):
+    # Split meshes into at most job_count lists of similar vertex totals
+    # (largest mesh first into the lightest job), heaviest job first
+    jobs = [[] for _ in range(max(1, min(job_count, len(meshes))))]
+    totals = [0] * len(jobs)
+    for mesh_obj in sorted(meshes, key=lambda obj: len(obj.data.vertices), reverse=True):
+        lightest = totals.index(min(totals))
+        jobs[lightest].append(mesh_obj)
+        totals[lightest] += len(mesh_obj.data.vertices)
+    order = sorted(range(len(jobs)), key=lambda index: totals[index], reverse=True)
+    return [jobs[index] for index in order if jobs[index]]
+
+
+def write_job(filepath, rig_obj, meshes):
+    # Write rig_obj's armature and copies of meshes to filepath. Returns
+    # (rig name, mesh names) of the objects in the file, in meshes order.
+    rig = bpy.data.objects.new(f"{JOB_OBJECT_PREFIX}_rig", rig_obj.data)
+    rig.matrix_world = rig_obj.matrix_world
+    copies = []
+    try:
+        for mesh_obj in meshes:
+            mesh = mesh_obj.data.copy()
+            mesh.materials.clear()
+            copy = bpy.data.objects.new(f"{JOB_OBJECT_PREFIX}_mesh", mesh)
+            copy.matrix_world = mesh_obj.matrix_world
+            copies.append(copy)
+        bpy.data.libraries.write(filepath, {rig, *copies}, fake_user=True)
+        return rig.name, [copy.name for copy in copies]
+    finally:
+        for copy in copies:
+            mesh = copy.data
+            bpy.data.objects.remove(copy)
+            bpy.data.meshes.remove(mesh)
+        bpy.data.objects.remove(rig)
+
+
+def solve_job(filepath, rig_name, mesh_names, output_dir, method='AUTOMATIC', proxy_vertices=30000):
+    # Worker side: weight the meshes of a job file and save their deform
+    # weights to output_dir. Returns {mesh name: result}, one failed mesh
+    # does not stop the others.
+    context = bpy.context
+    with bpy.data.libraries.load(filepath, link=False) as (data_from, data_to):
+        data_to.objects = [rig_name] + list(mesh_names)
+    rig_obj, *mesh_objs = data_to.objects
+    if rig_obj is None:
+        raise RuntimeError(f"Rig '{rig_name}' not found in {filepath}")
+    for obj in data_to.objects:
+        if obj is not None:
+            context.scene.collection.objects.link(obj)
+    deform_names = set(weights.deform_bone_names(rig_obj))
+
+    results = {}
+    for name, mesh_obj in zip(mesh_names, mesh_objs):
+        start = time.perf_counter()
+        try:
+            if mesh_obj is None:
+                raise RuntimeError(f"Mesh '{name}' not found in {filepath}")
+            if method == 'PROXY':
+                weights.parent_with_proxy_weights(context, mesh_obj, rig_obj, proxy_vertices)
+            else:
+                weights.parent_with_automatic_weights(context, mesh_obj, rig_obj)
+            job_name = os.path.splitext(os.path.basename(filepath))[0]
+            path = os.path.join(output_dir, f"{job_name}_{name}.npz")
+            save_weights(path, *weights.deform_weights(mesh_obj, deform_names))
+            results[name] = {"status": "ok", "file": path}
+        except Exception as e:
+            results[name] = {"status": "failed", "error": str(e)}
+        results[name]["seconds"] = round(time.perf_counter() - start, 3)
+    return results
+
+
+class WeightJobs:
+    # Automatic weights of meshes computed by worker processes. start() ships
+    # the jobs; poll() (non-blocking) and wait() (blocking) hand back
+    # (mesh, (group_names, vertices, groups, weights) or None, error) for
+    # every mesh as its job finishes. close() removes the job files.
+
+    def __init__(self, rig_obj, meshes, method='AUTOMATIC', proxy_vertices=30000,
+                 max_workers=0, memory_limit_mb=0, timeout=None):
+        self.rig_obj = rig_obj
+        self.meshes = list(meshes)
+        self.method = method
+        self.proxy_vertices = proxy_vertices
+        self.memory_limit_mb = memory_limit_mb
+        self.timeout = timeout
+        self.max_workers = max(1, min(max_workers or workers.default_worker_count(), len(self.meshes)))
+        self.directory = None
+        self._pool = None
+        self._pending = {}
+
+    def start(self):
+        self.directory = tempfile.mkdtemp(prefix="arp_to_rigify_weights_")
+        self._pool = workers.WorkerPool(max_workers=self.max_workers)
+        for index, job in enumerate(plan_jobs(self.meshes, self.max_workers * JOBS_PER_WORKER)):
+            filepath = os.path.join(self.directory, f"job_{index:03d}.blend")
+            rig_name, names = write_job(filepath, self.rig_obj, job)
+            self._submit(filepath, rig_name, dict(zip(names, job)))
+        return self
+
+    def _submit(self, filepath, rig_name, meshes):
+        args = ["--weight-job", filepath, "--rig", rig_name, "--output", self.directory,
+                "--weights", self.method.lower(), "--proxy-vertices", self.proxy_vertices]
+        if self.memory_limit_mb:
+            args += ["--memory-limit-mb", self.memory_limit_mb]
+        args += ["--mesh-names", *meshes]
+        future = self._pool.submit(BATCH_SCRIPT, args, timeout=self.timeout)
+        self._pending[future] = (filepath, rig_name, meshes)
+
+    @property
+    def done(self):
+        return not self._pending
+
+    def _collect(self, future):
+        filepath, rig_name, meshes = self._pending.pop(future)
+        result = future.result()
+        per_mesh = result.get("meshes") or {}
+        if not per_mesh and len(meshes) > 1 and result.get("status") != "cancelled":
+            # The worker died before reporting, retry each mesh on its own
+            for name, mesh_obj in meshes.items():
+                self._submit(filepath, rig_name, {name: mesh_obj})
+            return []
+
+        collected = []
+        for name, mesh_obj in meshes.items():
+            outcome = per_mesh.get(name) or result
+            if outcome.get("status") == "ok":
+                try:
+                    collected.append((mesh_obj, load_weights(outcome["file"]), None))
+                    continue
+                except (OSError, KeyError, ValueError) as e:
+                    outcome = {"error": f"Unreadable weights: {e}"}
+            error = outcome.get("error", "unknown error")
+            if self.memory_limit_mb and not per_mesh:
+                error += f" (memory limit {self.memory_limit_mb} MB)"
+            collected.append((mesh_obj, None, error))
+        return collected
+
+    def poll(self):
+        collected = []
+        for future in [future for future in self._pending if future.done()]:
+            collected += self._collect(future)
+        return collected
+
+    def wait(self):
+        while self._pending:
+            futures.wait(list(self._pending), return_when=futures.FIRST_COMPLETED)
+            yield from self.poll()
+
+    def cancel(self):
+        if self._pool is not None:
+            self._pool.cancel()
+        self._pending.clear()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=not self._pending, cancel=bool(self._pending))
+            self._pool = None
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
@@ -0,0 +1,226 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Bone mapping profiles.
+#
+# The built-in "default" profile is the addon's bone_mapping and face_bones.
+# Other profiles are .json or .toml files named after the profile, found in
+# the arp_to_rigify_profiles folder of Blender's user config and in an
+# optional extra folder. A profile can inherit another one and override it:
+#
+#     {
+#         "inherits": "default",
+#         "description": "Three spine segments",
+#         "mapping": {"spine.003": "spine_03_ref.x", "breast.L": null},
+#         "face_bones_remove": ["jaw"]
+#     }
+#
+# "mapping" entries replace the inherited ones (null removes the entry),
+# "face_bones" replaces the inherited list and "face_bones_add" /
+# "face_bones_remove" edit it. "controls" (Auto-Rig Pro control -> Rigify
+# control, null to leave a control out) adjusts the controls action
+# retargeting derives from the mapping (see retarget.control_mapping).
+# Folders are only listed until a profile is used; it is then parsed,
+# validated and compiled once into a MappingProfile, which later lookups
+# return from the cache.
+
+import json
+import os
+from types import MappingProxyType
+
+import bpy
+
+DEFAULT_PROFILE = "default"
+PROFILE_EXTENSIONS = (".json", ".toml")
+
+# Folder of Blender's user config holding the profiles
+USER_FOLDER = "arp_to_rigify_profiles"
+
+PROFILE_KEYS = {"description", "inherits", "mapping", "face_bones", "face_bones_add", "face_bones_remove", "controls"}
+
+# Compiled profiles by (name, search key), and (folders, profile files) per
+# search key; folders are only looked up when a search key is first seen
+_compiled = {}
+_catalogs = {}
+
+
+class MappingProfile:
+    # A compiled, read-only profile: mapping (Rigify bone -> ARP bone),
+    # inverse (ARP bone -> Rigify bone), prune (face bones to delete),
+    # reference_names (ARP bones the mapping uses), mirror_pairs (the
+    # left/right Rigify bone pairs of the mapping, mirror for lookups) and
+    # controls (retargeting overrides, "" for controls left out)
+
+    def __init__(self, name, description, mapping, face_bones, controls=None, files=()):
+        self.name = name
+        self.description = description
+        self.mapping = MappingProxyType(dict(mapping))
+        self.inverse = MappingProxyType({source: target for target, source in mapping.items() if source})
+        self.prune = frozenset(face_bones)
+        self.reference_names = frozenset(self.inverse)
+        self.mirror_pairs = tuple(mirror_pairs(mapping))
+        self.mirror = MappingProxyType({**dict(self.mirror_pairs), **{right: left for left, right in self.mirror_pairs}})
+        self.controls = MappingProxyType(dict(controls or {}))
+        self.files = tuple(files)
+
+
+def mirror_pairs(names):
+    # (left, right) pairs of names that both exist, by Blender's side naming
+    names = set(names)
+    pairs = []
+    for name in sorted(names):
+        other = bpy.utils.flip_name(name)
+        if name < other and other in names:
+            pairs.append((name, other))
+    return pairs
+
+
+def folders(extra=""):
+    # Folders searched for profile files, in increasing priority
+    result = []
+    user = bpy.utils.user_resource('CONFIG', path=USER_FOLDER)
+    if user:
+        result.append(user)
+    if extra:
+        result.append(bpy.path.abspath(extra))
+    return tuple(result)
+
+
+def _search_key(extra):
+    # Relative folders depend on where the .blend file is
+    return (extra, bpy.data.filepath) if extra.startswith("//") else (extra, "")
+
+
+def catalog(extra=""):
+    # Profile name -> file; only the folders are listed, nothing is parsed
+    key = _search_key(extra)
+    cached = _catalogs.get(key)
+    if cached is None:
+        search = folders(extra)
+        found = {}
+        for folder in search:
+            if not os.path.isdir(folder):
+                continue
+            for filename in sorted(os.listdir(folder)):
+                name, extension = os.path.splitext(filename)
+                if extension.lower() in PROFILE_EXTENSIONS and name != DEFAULT_PROFILE:
+                    found[name] = os.path.join(folder, filename)
+        cached = _catalogs[key] = (search, found)
+    return cached[1]
+
+
+def names(extra=""):
+    return [DEFAULT_PROFILE] + sorted(catalog(extra))
+
+
+def _parse(filepath):
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML profiles need Python 3.11 or newer, use JSON instead") from None
+        with open(filepath, "rb") as f:
+            return tomllib.load(f)
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def validate(data, where):
+    # Raise ValueError when data is not a well-formed profile
+    def fail(message):
+        raise ValueError(f"{where}: {message}")
+
+    if not isinstance(data, dict):
+        fail("a profile must be an object")
+    unknown = set(data) - PROFILE_KEYS
+    if unknown:
+        fail(f"unknown keys {', '.join(sorted(unknown))}")
+    if not isinstance(data.get("inherits", ""), str) or not isinstance(data.get("description", ""), str):
+        fail("'inherits' and 'description' must be strings")
+    for key, label in (("mapping", "Rigify bone -> Auto-Rig Pro bone"), ("controls", "Auto-Rig Pro control -> Rigify control")):
+        entries = data.get(key, {})
+        if not isinstance(entries, dict):
+            fail(f"'{key}' must be an object of {label}")
+        for name, value in entries.items():
+            if value is not None and not isinstance(value, str):
+                fail(f"{key} entry of '{name}' must be a bone name, \"\" or null")
+    for key in ("face_bones", "face_bones_add", "face_bones_remove"):
+        value = data.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+            fail(f"'{key}' must be a list of bone names")
+
+
+def _load(name, extra, chain):
+    # (description, mapping, face bones, controls, files) of name with its
+    # ancestors applied
+    if name == DEFAULT_PROFILE:
+        from . import bone_mapping, face_bones
+        return "Built-in Auto-Rig Pro to Rigify mapping", dict(bone_mapping), list(face_bones), {}, []
+    if name in chain:
+        raise ValueError(f"Profile '{name}' inherits itself ({' -> '.join(chain + (name,))})")
+    filepath = catalog(extra).get(name)
+    if filepath is None:
+        raise ValueError(f"Mapping profile '{name}' not found")
+
+    try:
+        data = _parse(filepath)
+    except ValueError as e:
+        raise ValueError(f"{filepath}: {e}") from e
+    validate(data, filepath)
+
+    description, mapping, face_bones, controls, files = _load(data.get("inherits") or DEFAULT_PROFILE, extra, chain + (name,))
+    for target, source in data.get("mapping", {}).items():
+        if source is None:
+            mapping.pop(target, None)
+        else:
+            mapping[target] = source
+    if "face_bones" in data:
+        face_bones = list(data["face_bones"])
+    removed = set(data.get("face_bones_remove", ()))
+    face_bones = [bone for bone in face_bones if bone not in removed]
+    face_bones += [bone for bone in data.get("face_bones_add", ()) if bone not in face_bones]
+    for control, target in data.get("controls", {}).items():
+        controls[control] = target or ""
+    return data.get("description", description), mapping, face_bones, controls, files + [filepath]
+
+
+def compile_profile(name, extra=""):
+    # Parse and validate name and the profiles it inherits. Raises ValueError
+    # (and OSError for unreadable files).
+    description, mapping, face_bones, controls, files = _load(name, extra, ())
+    sources = {}
+    for target, source in mapping.items():
+        if source and source in sources:
+            raise ValueError(f"Profile '{name}' maps both '{sources[source]}' and '{target}' to '{source}'")
+        sources[source] = target
+    return MappingProfile(name, description, mapping, face_bones, controls, files)
+
+
+def get(name, extra=""):
+    # Compiled profile, built on first use
+    name = name or DEFAULT_PROFILE
+    key = (name, _search_key(extra))
+    profile = _compiled.get(key)
+    if profile is None:
+        profile = _compiled[key] = compile_profile(name, extra)
+    return profile
+
+
+def clear():
+    # Forget compiled profiles and folder listings (after editing profile files)
+    _compiled.clear()
+    _catalogs.clear()
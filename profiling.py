@@ -0,0 +1,256 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Per-operator and per-stage profiling.
+#
+# An operator run (an instrumented execute, or start()/finish() around other
+# code) records its wall time and the nested stage() blocks executed while
+# it is active, with optional counts (bones, vertices), Python memory deltas
+# (tracemalloc) and a cProfile capture. Outside a run, stage() costs a single
+# check, so the stages can stay in the code. Finished runs are kept in `history` and export to JSON or CSV.
+#
+# A modal operator records into a run of its own from start_detached(). It is
+# only active inside resumed() blocks around the operator's own ticks, so
+# operators run in between get their own runs, and memory and cProfile data
+# leave out the UI work done between ticks.
+
+import contextlib
+import cProfile
+import csv
+import functools
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+import bpy
+
+# Finished runs kept for the panel and exports
+HISTORY_LIMIT = 50
+
+# Lines of cProfile output kept per run
+PROFILE_LINES = 40
+
+history = []
+
+# Run in progress, if any
+_run = None
+
+
+class _Run:
+    def __init__(self, operator, track_memory, use_cprofile):
+        from . import bl_info
+
+        self.record = {
+            "operator": operator,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "blender": bpy.app.version_string,
+            "addon": ".".join(str(part) for part in bl_info["version"]),
+            "seconds": 0.0,
+            "memory_delta": None,
+            "counts": {},
+            "result": [],
+            "stages": [],
+            "profile": None,
+        }
+        self.stack = [self.record]
+        self.started_tracing = False
+        self.track_memory = track_memory
+        self.profile = cProfile.Profile() if use_cprofile else None
+        self.memory_delta = 0
+        self.memory_start = None
+        self.running = False
+        self.time_start = time.perf_counter()
+        self.resume()
+
+    def resume(self):
+        # Record memory and cProfile data again (after pause())
+        if self.running:
+            return
+        self.running = True
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.memory_start = _traced_memory() if self.track_memory else None
+        if self.profile:
+            self.profile.enable()
+
+    def pause(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.profile:
+            self.profile.disable()
+        if self.track_memory:
+            self.memory_delta += _traced_memory() - self.memory_start
+
+    def close(self):
+        self.pause()
+        self.record["seconds"] = time.perf_counter() - self.time_start
+        if self.track_memory:
+            self.record["memory_delta"] = self.memory_delta
+        if self.started_tracing:
+            tracemalloc.stop()
+        if self.profile:
+            text = io.StringIO()
+            pstats.Stats(self.profile, stream=text).sort_stats("cumulative").print_stats(PROFILE_LINES)
+            self.record["profile"] = text.getvalue()
+        return self.record
+
+
+def _traced_memory():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def _settings(context):
+    props = getattr(context.scene, "rig_selection_props", None)
+    if props is None or not props.profile_operators:
+        return None
+    return props.profile_memory, props.profile_cprofile
+
+
+def start(context, operator):
+    # Begin recording an operator run if profiling is enabled in the scene.
+    # Returns False when nothing is recorded (disabled, or a run is active).
+    global _run
+    settings = _settings(context)
+    if _run is not None or settings is None:
+        return False
+    _run = _Run(operator, *settings)
+    return True
+
+
+def start_detached(context, operator):
+    # Begin a run of a modal operator that is not made the current run.
+    # Returns the run (None when profiling is disabled); enter it with
+    # resumed() on every tick and end it with finish(run=run).
+    settings = _settings(context)
+    if settings is None:
+        return None
+    run = _Run(operator, *settings)
+    run.pause()
+    return run
+
+
+@contextlib.contextmanager
+def resumed(run):
+    # Make run the current run for the block, unless it is None or another
+    # run is active (its stages then go to that run)
+    global _run
+    if run is None or _run is not None:
+        yield
+        return
+    _run = run
+    run.resume()
+    try:
+        yield
+    finally:
+        run.pause()
+        _run = None
+
+
+def finish(result=None, run=None):
+    # End run, or the current run when run is None
+    global _run
+    if run is None:
+        run = _run
+    if run is None:
+        return None
+    record = run.close()
+    if run is _run:
+        _run = None
+    if result is not None:
+        record["result"] = sorted(result)
+    history.append(record)
+    del history[:-HISTORY_LIMIT]
+    return record
+
+
+@contextlib.contextmanager
+def stage(name, **counts):
+    # Time a block of the running operator. Yields the stage record (None when
+    # not profiling); count() adds to the innermost open stage.
+    if _run is None:
+        yield None
+        return
+    parent = _run.stack[-1]
+    path = f"{parent['path']}/{name}" if "path" in parent else name
+    record = {"stage": name, "path": path, "depth": len(_run.stack) - 1,
+              "seconds": 0.0, "memory_delta": None, "counts": dict(counts)}
+    _run.record["stages"].append(record)
+    _run.stack.append(record)
+    memory_start = _traced_memory() if _run.track_memory else None
+    time_start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - time_start
+        if memory_start is not None:
+            record["memory_delta"] = _traced_memory() - memory_start
+        _run.stack.pop()
+
+
+def count(**counts):
+    if _run is not None:
+        _run.stack[-1]["counts"].update(counts)
+
+
+def instrumented(execute):
+    # Decorator recording Operator.execute as a run named after bl_idname
+    @functools.wraps(execute)
+    def wrapper(self, context):
+        if _run is not None:
+            with stage(self.bl_idname):
+                return execute(self, context)
+        started = start(context, self.bl_idname)
+        result = None
+        try:
+            result = execute(self, context)
+            return result
+        finally:
+            if started:
+                finish(result)
+    return wrapper
+
+
+def export_json(filepath, runs=None):
+    runs = history if runs is None else runs
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump({"runs": runs}, f, indent=2)
+
+
+CSV_COLUMNS = ("run", "operator", "started", "blender", "addon", "stage", "depth",
+               "seconds", "memory_delta", "counts")
+
+
+def export_csv(filepath, runs=None):
+    # One row per run (stage empty) followed by one row per stage
+    runs = history if runs is None else runs
+    with open(filepath, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for index, record in enumerate(runs):
+            common = (index, record["operator"], record["started"], record["blender"], record["addon"])
+            writer.writerow(common + ("", -1, f"{record['seconds']:.6f}", record["memory_delta"],
+                                      json.dumps(record["counts"], sort_keys=True)))
+            for entry in record["stages"]:
+                writer.writerow(common + (entry["path"], entry["depth"], f"{entry['seconds']:.6f}",
+                                          entry["memory_delta"], json.dumps(entry["counts"], sort_keys=True)))
+
+
+def clear():
+    history.clear()
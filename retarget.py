@@ -0,0 +1,368 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Retargeting of Auto-Rig Pro actions onto the controls of the generated rig.
+#
+# Controls are paired from the bone mapping (c_thigh_fk.l -> thigh_fk.L, ...),
+# with profile overrides. The metarig was aligned to the reference bones, so
+# paired controls sit in the same place and only their rest orientations
+# differ. A pose channel then carries over by a change of basis: the rotation
+# q becomes c* q c and the location l becomes c* l, with c the rotation from
+# the ARP control's rest frame to the Rigify control's. Both maps are linear,
+# so every key of a channel is converted at once as a NumPy array: keys are
+# read with keyframe_points.foreach_get and written with foreach_set, and the
+# scene frame is never changed. Channels keyed on different frames are
+# evaluated only at the frames they miss. Each key keeps the interpolation,
+# easing and handle types of the source key on its frame, and handle offsets
+# go through the same linear map as the values. Euler targets are converted
+# in bulk too, then unwrapped so angles stay continuous. Actions are processed one at a time and keep
+# no arrays around, so memory does not grow with the size of the library.
+#
+# The transfer is exact for controls whose parents are paired too (FK chains,
+# IK targets under the root); the IK/FK switches of the rig are left as they
+# are.
+
+import fnmatch
+import re
+
+import bpy
+import numpy as np
+
+# ARP limbs whose reference bone drives an "_fk" control, and the same limbs
+# on the Rigify side
+ARP_FK_LIMBS = {"thigh", "leg", "foot", "toes", "arm", "forearm", "hand"}
+RIGIFY_FK_LIMBS = {"thigh", "shin", "foot", "toe", "upper_arm", "forearm", "hand"}
+
+# Rigify controls that do not follow the metarig bone's name
+RIGIFY_CONTROLS = {"spine.005": "neck", "spine.006": "head"}
+
+# Controls paired without a reference bone
+EXTRA_CONTROLS = {
+    "c_traj": "root",
+    "c_foot_ik.l": "foot_ik.L",
+    "c_foot_ik.r": "foot_ik.R",
+    "c_hand_ik.l": "hand_ik.L",
+    "c_hand_ik.r": "hand_ik.R",
+}
+
+# Default value of every channel of a pose property
+CHANNEL_DEFAULTS = {
+    "rotation_quaternion": (1.0, 0.0, 0.0, 0.0),
+    "rotation_euler": (0.0, 0.0, 0.0),
+    "location": (0.0, 0.0, 0.0),
+    "scale": (1.0, 1.0, 1.0),
+}
+
+# Keyframe enums copied from the source keys
+KEY_ENUMS = ("interpolation", "easing", "handle_left_type", "handle_right_type")
+
+# Handle types whose position is kept rather than recomputed by fcurve.update()
+FREE_HANDLES = {"FREE", "ALIGNED"}
+
+_POSE_PATH = re.compile(r'^pose\.bones\["(.+)"\]\.(\w+)$')
+
+
+def arp_control_name(reference_name):
+    # c_thigh_fk.l for thigh_ref.l, c_index1.l for index1_ref.l
+    base, dot, side = reference_name.replace("_ref", "", 1).partition(".")
+    return f"c_{base}_fk{dot}{side}" if base in ARP_FK_LIMBS else f"c_{base}{dot}{side}"
+
+
+def rigify_control_name(metarig_name):
+    # thigh_fk.L for thigh.L, spine_fk.001 for spine.001, f_index.01.L unchanged
+    if metarig_name in RIGIFY_CONTROLS:
+        return RIGIFY_CONTROLS[metarig_name]
+    base, dot, rest = metarig_name.partition(".")
+    if base == "spine" or base in RIGIFY_FK_LIMBS:
+        return f"{base}_fk{dot}{rest}"
+    return metarig_name
+
+
+def control_mapping(mapping, overrides=None):
+    # ARP control -> Rigify control, derived from a bone mapping; overrides
+    # (e.g. a profile's controls) replace entries and "" removes them
+    controls = {arp_control_name(source): rigify_control_name(target)
+                for target, source in mapping.items() if source}
+    controls.update(EXTRA_CONTROLS)
+    controls.update(overrides or {})
+    return {source: target for source, target in controls.items() if target}
+
+
+def _multiply(a, b):
+    # Hamilton product of (N, 4) quaternion arrays
+    aw, ax, ay, az = a.T
+    bw, bx, by, bz = b.T
+    return np.stack((aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw), axis=1)
+
+
+def euler_to_quaternion(angles, order):
+    # (N, 3) Euler angles in radians to (N, 4) quaternions, for any order
+    half = np.asarray(angles, dtype=np.float64) / 2.0
+    result = np.tile((1.0, 0.0, 0.0, 0.0), (len(half), 1))
+    for axis in order:
+        index = "XYZ".index(axis)
+        axis_rotation = np.zeros((len(half), 4))
+        axis_rotation[:, 0] = np.cos(half[:, index])
+        axis_rotation[:, index + 1] = np.sin(half[:, index])
+        result = _multiply(axis_rotation, result)
+    return result
+
+
+def change_of_basis(source_bone, target_bone):
+    # (4x4 quaternion map, 3x3 location map) of the rest frame change
+    c = source_bone.matrix_local.to_quaternion().conjugated() @ target_bone.matrix_local.to_quaternion()
+    w, x, y, z = c
+    # q -> c* q c as a matrix acting on (w, x, y, z)
+    left = np.array(((w, x, y, z), (-x, w, z, -y), (-y, -z, w, x), (-z, y, -x, w)))
+    right = np.array(((w, -x, -y, -z), (x, w, z, -y), (y, -z, w, x), (z, y, -x, w)))
+    return left @ right, np.array(c.conjugated().to_matrix())
+
+
+def pose_channels(action):
+    # {bone name: {property: {index: fcurve}}} of the pose F-curves of action
+    channels = {}
+    for fcurve in action.fcurves:
+        match = _POSE_PATH.match(fcurve.data_path)
+        if not match or match.group(2) not in CHANNEL_DEFAULTS:
+            continue
+        bone = bpy.utils.unescape_identifier(match.group(1))
+        channels.setdefault(bone, {}).setdefault(match.group(2), {})[fcurve.array_index] = fcurve
+    return channels
+
+
+def _enum_values(name):
+    # {identifier: value} and {value: identifier} of a Keyframe enum
+    items = bpy.types.Keyframe.bl_rna.properties[name].enum_items
+    return {item.identifier: item.value for item in items}, {item.value: item.identifier for item in items}
+
+
+def _get_enum(points, name):
+    codes = np.empty(len(points), dtype=np.int32)
+    try:
+        points.foreach_get(name, codes)
+    except TypeError:  # enum not exposed to foreach_get
+        values, _identifiers = _enum_values(name)
+        codes[:] = [values[getattr(point, name)] for point in points]
+    return codes
+
+
+def _set_enum(points, name, codes):
+    try:
+        points.foreach_set(name, codes)
+    except TypeError:
+        _values, identifiers = _enum_values(name)
+        for point, code in zip(points, codes.tolist()):
+            setattr(point, name, identifiers[code])
+
+
+def _read_keys(fcurve):
+    # co, handle_left and handle_right as (N, 2) arrays and KEY_ENUMS codes
+    points = fcurve.keyframe_points
+    keys = {}
+    for name in ("co", "handle_left", "handle_right"):
+        data = np.empty(len(points) * 2, dtype=np.float32)
+        points.foreach_get(name, data)
+        keys[name] = data.reshape(-1, 2).astype(np.float64)
+    for name in KEY_ENUMS:
+        keys[name] = _get_enum(points, name)
+    return keys
+
+
+class KeyStyle:
+    # Per frame of a sampled channel set: the KEY_ENUMS codes of the first
+    # channel keyed on it, that key's handle frame offsets (left, right) and
+    # the handle value offsets of every channel, (N, channels) each
+
+    def __init__(self, enums, left_dx, right_dx, left_dy, right_dy):
+        self.enums = enums
+        self.left_dx = left_dx
+        self.right_dx = right_dx
+        self.left_dy = left_dy
+        self.right_dy = right_dy
+
+    def mapped(self, matrix):
+        # Handle value offsets through the linear map applied to the values
+        return KeyStyle(self.enums, self.left_dx, self.right_dx, self.left_dy @ matrix.T, self.right_dy @ matrix.T)
+
+    def recomputed(self, channels):
+        # For a non-linear map: FREE and ALIGNED handles become AUTO_CLAMPED so
+        # fcurve.update() places them, and value offsets are dropped
+        enums = dict(self.enums)
+        for name in ("handle_left_type", "handle_right_type"):
+            values, _identifiers = _enum_values(name)
+            free = np.isin(enums[name], [values[handle] for handle in FREE_HANDLES])
+            enums[name] = np.where(free, values["AUTO_CLAMPED"], enums[name])
+        zero = np.zeros((len(self.left_dx), channels))
+        return KeyStyle(enums, self.left_dx, self.right_dx, zero, zero)
+
+
+def sample(curves, defaults):
+    # (frames, (N, channels) values, KeyStyle) at every key frame of curves;
+    # channels keyed on other frames are evaluated at the frames they miss,
+    # missing channels take defaults
+    keys = {index: _read_keys(fcurve) for index, fcurve in curves.items() if index < len(defaults)}
+    frames = np.unique(np.concatenate([k["co"][:, 0] for k in keys.values()]))
+    channels = len(defaults)
+    values = np.tile(np.asarray(defaults, dtype=np.float64), (len(frames), 1))
+    enums = {name: np.zeros(len(frames), dtype=np.int32) for name in KEY_ENUMS}
+    styled = np.zeros(len(frames), dtype=bool)
+    left_dx, right_dx = np.full(len(frames), -1.0), np.full(len(frames), 1.0)
+    left_dy, right_dy = np.zeros((len(frames), channels)), np.zeros((len(frames), channels))
+    for index in sorted(keys):
+        k = keys[index]
+        rows = np.searchsorted(frames, k["co"][:, 0])
+        values[rows, index] = k["co"][:, 1]
+        left_dy[rows, index] = k["handle_left"][:, 1] - k["co"][:, 1]
+        right_dy[rows, index] = k["handle_right"][:, 1] - k["co"][:, 1]
+        # Key style from the lowest channel keyed on each frame
+        first = ~styled[rows]
+        for name in KEY_ENUMS:
+            enums[name][rows[first]] = k[name][first]
+        left_dx[rows[first]] = (k["handle_left"][:, 0] - k["co"][:, 0])[first]
+        right_dx[rows[first]] = (k["handle_right"][:, 0] - k["co"][:, 0])[first]
+        styled[rows] = True
+
+        missing = np.ones(len(frames), dtype=bool)
+        missing[rows] = False
+        if missing.any():
+            fcurve = curves[index]
+            values[missing, index] = [fcurve.evaluate(frame) for frame in frames[missing].tolist()]
+    return frames, values, KeyStyle(enums, left_dx, right_dx, left_dy, right_dy)
+
+
+def write_channels(action, bone_name, prop, frames, values, style=None):
+    # One F-curve per column of values, keyed at frames in a single foreach_set
+    # per key attribute, with the interpolation and handles of style
+    data_path = f'pose.bones["{bpy.utils.escape_identifier(bone_name)}"].{prop}'
+    co = np.empty((len(frames), 2), dtype=np.float32)
+    co[:, 0] = frames
+    handles = np.empty((len(frames), 2), dtype=np.float32)
+    for index in range(values.shape[1]):
+        fcurve = action.fcurves.new(data_path, index=index, action_group=bone_name)
+        co[:, 1] = values[:, index]
+        points = fcurve.keyframe_points
+        points.add(len(frames))
+        points.foreach_set("co", co.ravel())
+        if style is not None:
+            for name in KEY_ENUMS:
+                _set_enum(points, name, style.enums[name])
+            for name, dx, dy in (("handle_left", style.left_dx, style.left_dy),
+                                 ("handle_right", style.right_dx, style.right_dy)):
+                handles[:, 0] = frames + dx
+                handles[:, 1] = values[:, index] + dy[:, index]
+                points.foreach_set(name, handles.ravel())
+        fcurve.update()
+
+
+def quaternion_to_euler(quaternions, order):
+    # (N, 4) quaternions to (N, 3) Euler angles for any order, unwrapped along
+    # the rows so consecutive keys do not jump by a full turn
+    w, x, y, z = (np.asarray(quaternions, dtype=np.float64)
+                  / np.linalg.norm(quaternions, axis=1, keepdims=True)).T
+    matrices = np.stack((
+        np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)), axis=1),
+        np.stack((2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)), axis=1),
+        np.stack((2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)), axis=1)), axis=1)
+    # The rotation is R = Rk Rj Ri for order "ijk"; odd orders flip the signs
+    i, j, k = ("XYZ".index(axis) for axis in order)
+    sign = 1.0 if (j - i) % 3 == 1 else -1.0
+    angles = np.empty((len(matrices), 3))
+    angles[:, j] = np.arcsin(np.clip(-sign * matrices[:, k, i], -1.0, 1.0))
+    angles[:, i] = np.arctan2(sign * matrices[:, k, j], matrices[:, k, k])
+    angles[:, k] = np.arctan2(sign * matrices[:, j, i], matrices[:, i, i])
+    return np.unwrap(angles, axis=0)
+
+
+def _write_rotation(action, target, frames, quaternions, style):
+    mode = target.rotation_mode
+    if mode == 'QUATERNION':
+        write_channels(action, target.name, "rotation_quaternion", frames, quaternions, style)
+    elif mode != 'AXIS_ANGLE':
+        # Euler angles are not a linear map of the quaternion
+        write_channels(action, target.name, "rotation_euler", frames, quaternion_to_euler(quaternions, mode),
+                       style.recomputed(3))
+
+
+def _uniform_scale(obj):
+    # Scale factor of obj's world matrix, the cube root of its volume change
+    return abs(obj.matrix_world.to_3x3().determinant()) ** (1.0 / 3.0)
+
+
+def retarget_action(action, source_rig, target_rig, controls, name=None):
+    # Write the retargeted copy of action (an Auto-Rig Pro rig action) to a
+    # new action, or over an existing one with the same name. Returns (new
+    # action, controls retargeted, ARP bones skipped).
+    name = name or f"{action.name}_rigify"
+    result = bpy.data.actions.get(name) or bpy.data.actions.new(name)
+    result.use_fake_user = True
+    for fcurve in list(result.fcurves):
+        result.fcurves.remove(fcurve)
+    # Locations are in bone space, which scales with the rig objects
+    location_scale = _uniform_scale(source_rig) / max(_uniform_scale(target_rig), 1e-12)
+
+    retargeted, skipped = 0, []
+    source_bones = source_rig.data.bones
+    for bone_name, props in pose_channels(action).items():
+        target_name = controls.get(bone_name)
+        target = target_rig.pose.bones.get(target_name) if target_name else None
+        if target is None or bone_name not in source_bones:
+            skipped.append(bone_name)
+            continue
+        rotation_map, location_map = change_of_basis(source_bones[bone_name], target.bone)
+
+        if "rotation_quaternion" in props:
+            frames, quaternions, style = sample(props["rotation_quaternion"], CHANNEL_DEFAULTS["rotation_quaternion"])
+            _write_rotation(result, target, frames, quaternions @ rotation_map.T, style.mapped(rotation_map))
+        elif "rotation_euler" in props:
+            source_mode = source_rig.pose.bones[bone_name].rotation_mode
+            order = source_mode if len(source_mode) == 3 else 'XYZ'
+            frames, angles, style = sample(props["rotation_euler"], CHANNEL_DEFAULTS["rotation_euler"])
+            _write_rotation(result, target, frames, euler_to_quaternion(angles, order) @ rotation_map.T,
+                            style.recomputed(4))
+        if "location" in props:
+            frames, locations, style = sample(props["location"], CHANNEL_DEFAULTS["location"])
+            location_matrix = location_map * location_scale
+            write_channels(result, target.name, "location", frames, locations @ location_matrix.T,
+                           style.mapped(location_matrix))
+        if "scale" in props:
+            frames, scales, style = sample(props["scale"], CHANNEL_DEFAULTS["scale"])
+            write_channels(result, target.name, "scale", frames, scales, style)
+        retargeted += 1
+    return result, retargeted, skipped
+
+
+def rig_actions(source_rig, controls, pattern="*"):
+    # Actions whose name matches pattern and that animate a paired control of
+    # source_rig, listed without reading any keyframes
+    paths = {f'pose.bones["{bpy.utils.escape_identifier(name)}"]' for name in controls
+             if name in source_rig.data.bones}
+    actions = []
+    for action in bpy.data.actions:
+        if not fnmatch.fnmatchcase(action.name, pattern) or action.name.endswith("_rigify"):
+            continue
+        if any(fcurve.data_path.rpartition(".")[0] in paths for fcurve in action.fcurves):
+            actions.append(action)
+    return actions
+
+
+def retarget_actions(actions, source_rig, target_rig, controls):
+    # Retarget actions one after the other, yielding (action, retarget_action()
+    # result) so callers can report progress as the library streams through
+    for action in list(actions):
+        yield action, retarget_action(action, source_rig, target_rig, controls)
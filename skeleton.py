@@ -0,0 +1,156 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Skeleton snapshots of Auto-Rig Pro rigs.
+#
+# A snapshot holds the names, world-space rest heads, tails and rolls of the
+# reference bones named in a bone mapping, plus the rig's world matrix. It is
+# saved as a small versioned .npz or .json file and can stand in for the rig
+# when aligning a metarig (align.realign_edit_bones accepts either), so the
+# production .blend with its meshes does not need to be open.
+
+import json
+import os
+import tempfile
+
+import bpy
+import numpy as np
+
+from . import align
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSIONS = (".npz", ".json")
+
+
+class SkeletonSnapshot:
+    def __init__(self, name, matrix_world, names, heads, tails, rolls):
+        self.name = name
+        self.matrix_world = np.asarray(matrix_world, dtype=np.float64).reshape(4, 4)
+        self.names = list(names)
+        self.heads = np.asarray(heads, dtype=np.float64).reshape(-1, 3)
+        self.tails = np.asarray(tails, dtype=np.float64).reshape(-1, 3)
+        self.rolls = np.asarray(rolls, dtype=np.float64).reshape(-1)
+
+    def mapped_rest_positions(self, mapping):
+        # Same result as align.read_mapped_rest_positions on the captured rig
+        index = {name: row for row, name in enumerate(self.names)}
+        target_names = []
+        rows = []
+        for target_name, source_name in mapping.items():
+            row = index.get(source_name) if source_name else None
+            if row is None:
+                continue
+            target_names.append(target_name)
+            rows.append(row)
+        return target_names, self.heads[rows], self.tails[rows]
+
+
+def capture(rig_obj, mapping):
+    # Snapshot of the source bones of mapping that exist on rig_obj
+    source_names = sorted({name for name in mapping.values() if name})
+    names, heads, tails = align.read_mapped_rest_positions(rig_obj, {name: name for name in source_names})
+
+    if rig_obj.mode == 'EDIT':
+        edit_bones = rig_obj.data.edit_bones
+        rolls = [edit_bones[name].roll for name in names]
+    else:
+        bones = rig_obj.data.bones
+        rolls = [bpy.types.Bone.AxisRollFromMatrix(bones[name].matrix_local.to_3x3())[1] for name in names]
+    return SkeletonSnapshot(rig_obj.name, align.matrix_to_array(rig_obj.matrix_world), names, heads, tails, rolls)
+
+
+def save(snapshot, filepath):
+    # Written atomically; the format follows the extension (.npz or .json)
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in SNAPSHOT_EXTENSIONS:
+        raise ValueError(f"Unsupported snapshot format '{extension}', use .npz or .json")
+
+    directory = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=extension, dir=directory)
+    try:
+        if extension == ".npz":
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    version=np.array(SNAPSHOT_VERSION),
+                    rig=np.array(snapshot.name),
+                    matrix_world=snapshot.matrix_world,
+                    names=np.array(snapshot.names, dtype=str),
+                    heads=snapshot.heads,
+                    tails=snapshot.tails,
+                    rolls=snapshot.rolls,
+                )
+        else:
+            with os.fdopen(fd, "w") as f:
+                json.dump({
+                    "version": SNAPSHOT_VERSION,
+                    "rig": snapshot.name,
+                    "matrix_world": snapshot.matrix_world.tolist(),
+                    "bones": {
+                        name: {"head": head.tolist(), "tail": tail.tolist(), "roll": float(roll)}
+                        for name, head, tail, roll in zip(snapshot.names, snapshot.heads, snapshot.tails, snapshot.rolls)
+                    },
+                }, f, indent=1)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load(filepath):
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == ".npz":
+        with np.load(filepath, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version > SNAPSHOT_VERSION:
+                raise ValueError(f"Snapshot version {version} is newer than this addon supports")
+            return SkeletonSnapshot(str(data["rig"]), data["matrix_world"], data["names"].tolist(),
+                                    data["heads"], data["tails"], data["rolls"])
+    if extension == ".json":
+        with open(filepath) as f:
+            data = json.load(f)
+        version = data.get("version", 0)
+        if version > SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {version} is newer than this addon supports")
+        bones = data["bones"]
+        names = list(bones)
+        return SkeletonSnapshot(data["rig"], data["matrix_world"], names,
+                                [bones[name]["head"] for name in names],
+                                [bones[name]["tail"] for name in names],
+                                [bones[name]["roll"] for name in names])
+    raise ValueError(f"Unsupported snapshot format '{extension}', use .npz or .json")
+
+
+def diff(previous, current, tolerance=1e-5):
+    # Compare two snapshots (e.g. two revisions of a character). Returns
+    # (added, removed, moved) where moved maps a bone name to the largest
+    # head, tail or roll change
+    previous_index = {name: row for row, name in enumerate(previous.names)}
+    current_index = {name: row for row, name in enumerate(current.names)}
+    added = sorted(set(current_index) - set(previous_index))
+    removed = sorted(set(previous_index) - set(current_index))
+
+    moved = {}
+    for name in sorted(set(current_index) & set(previous_index)):
+        a, b = previous_index[name], current_index[name]
+        change = max(np.abs(current.heads[b] - previous.heads[a]).max(),
+                     np.abs(current.tails[b] - previous.tails[a]).max(),
+                     abs(current.rolls[b] - previous.rolls[a]))
+        if change > tolerance:
+            moved[name] = float(change)
+    return added, removed, moved
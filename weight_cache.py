@@ -0,0 +1,148 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Persistent, content-addressed cache of computed vertex group weights.
+#
+# An entry is keyed by the fingerprint of the mesh (positions, topology and
+# placement relative to the rig), the fingerprint of the rig's deform bones and
+# the weighting method. Entries are .npz files holding the sparse weight
+# triplets; reading one bumps its modification time, and the oldest entries are
+# evicted once the cache grows past its size limit (LRU).
+
+import os
+import tempfile
+
+import bpy
+import numpy as np
+
+from . import fingerprint
+
+ENTRY_SUFFIX = ".npz"
+CACHE_FORMAT_VERSION = 1
+
+# Last known (entries, bytes) of the cache, shown in the panel without
+# scanning the directory on every redraw
+last_stats = None
+
+
+def default_directory():
+    return bpy.utils.user_resource('DATAFILES', path=os.path.join("arp_to_rigify", "weight_cache"))
+
+
+def entry_key(mesh_obj, rig_obj, method):
+    return fingerprint.combine(
+        CACHE_FORMAT_VERSION,
+        fingerprint.mesh_fingerprint(mesh_obj, relative_to=rig_obj),
+        fingerprint.deform_skeleton_fingerprint(rig_obj),
+        method,
+    )
+
+
+class WeightCache:
+    def __init__(self, directory=None, limit_mb=512):
+        self.directory = bpy.path.abspath(directory) if directory else default_directory()
+        self.limit_bytes = int(limit_mb) * 1024 * 1024
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        # Returns (group_names, vertices, groups, weights) or None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = (list(data["group_names"]), data["vertices"], data["groups"], data["weights"])
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, group_names, vertices, groups, weights):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=ENTRY_SUFFIX, dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    group_names=np.array(group_names, dtype=str),
+                    vertices=np.asarray(vertices, dtype=np.int32),
+                    groups=np.asarray(groups, dtype=np.int32),
+                    weights=np.asarray(weights, dtype=np.float32),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def entries(self):
+        # (path, size, last used) of every entry
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    stat = entry.stat()
+                    found.append((entry.path, stat.st_size, stat.st_mtime))
+        return found
+
+    def evict(self):
+        global last_stats
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if total > self.limit_bytes:
+            for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                if total <= self.limit_bytes:
+                    break
+        last_stats = (len(entries) - removed, total)
+        return removed
+
+    def stats(self):
+        global last_stats
+        entries = self.entries()
+        last_stats = (len(entries), sum(size for _, size, _ in entries))
+        return last_stats
+
+    def clear(self):
+        global last_stats
+        removed = 0
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        last_stats = (0, 0)
+        return removed
+
+
+def from_props(props):
+    return WeightCache(props.weight_cache_dir, props.weight_cache_limit_mb)
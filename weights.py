@@ -0,0 +1,565 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Vertex group weights and mesh parenting.
+#
+# Weights are handled as sparse (vertex, group, weight) triplets in NumPy
+# arrays. The Python API has no bulk access to vertex groups, so
+# read_weights() reads large meshes through a temporary geometry nodes
+# evaluation that copies the vertex groups to float attributes, which are read
+# with one foreach_get per group. Small meshes, and meshes the evaluation
+# cannot read, fall back to a Python loop over the vertices.
+# write_weights() writes a group back with one VertexGroup.add() call per
+# distinct weight value instead of one call per vertex. Influence limiting,
+# pruning and normalization (limit_influences) work on the same triplets.
+
+from collections import defaultdict
+
+import bpy
+import numpy as np
+
+DEFORM_PREFIX = "DEF-"
+
+# Newly computed weights (merges, clean-up) are quantized to this step when
+# written, which bounds the number of VertexGroup.add() calls per group; the
+# change is at most half a step. Restored and cached weights are written
+# exactly as they were read.
+WEIGHT_QUANTUM = 1.0 / 4096
+
+# ARP splits these limbs into twist and stretch deform bones. The order gives
+# which one maps to the first and which to the second Rigify DEF segment.
+ARP_LIMB_SEGMENTS = {
+    "thigh": ("_twist", "_stretch"),
+    "leg": ("_stretch", "_twist"),
+    "arm": ("_twist", "_stretch"),
+    "forearm": ("_stretch", "_twist"),
+}
+
+# Meshes from this vertex count on are read through geometry nodes, and the
+# number of groups copied per evaluation (bounding the dense arrays held at once)
+BULK_READ_MIN_VERTICES = 5000
+BULK_READ_GROUPS = 32
+WEIGHT_ATTRIBUTE_PREFIX = "arp_weight_"
+
+# Proxy vertices blended into each full-resolution vertex when projecting weights
+PROJECTION_NEIGHBOURS = 4
+
+# Prefixes and suffixes ARP adds to the deform bones built from a reference bone
+ARP_DEFORM_PREFIXES = ("c_",)
+ARP_DEFORM_SUFFIXES = ("_bend",)
+
+
+def _empty_weights():
+    return np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32)
+
+
+def _read_weights_per_vertex(mesh_obj):
+    # Python loop over the vertices, for small meshes and as a fallback
+    vertices = mesh_obj.data.vertices
+    pairs = [(v.index, g.group, g.weight) for v in vertices for g in v.groups]
+    if not pairs:
+        return _empty_weights()
+    data = np.array(pairs, dtype=np.float64)
+    return data[:, 0].astype(np.int32), data[:, 1].astype(np.int32), data[:, 2].astype(np.float32)
+
+
+def _weight_reader_tree(group_names):
+    # Geometry nodes tree storing each of group_names as a float point
+    # attribute named WEIGHT_ATTRIBUTE_PREFIX + its position in the list
+    tree = bpy.data.node_groups.new("arp_weight_reader", 'GeometryNodeTree')
+    tree.interface.new_socket("Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    tree.interface.new_socket("Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    nodes, links = tree.nodes, tree.links
+    socket = nodes.new('NodeGroupInput').outputs[0]
+    for offset, name in enumerate(group_names):
+        read = nodes.new('GeometryNodeInputNamedAttribute')
+        read.data_type = 'FLOAT'
+        read.inputs["Name"].default_value = name
+        store = nodes.new('GeometryNodeStoreNamedAttribute')
+        store.data_type = 'FLOAT'
+        store.domain = 'POINT'
+        store.inputs["Name"].default_value = f"{WEIGHT_ATTRIBUTE_PREFIX}{offset}"
+        links.new(socket, store.inputs["Geometry"])
+        links.new(read.outputs["Attribute"], store.inputs["Value"])
+        socket = store.outputs["Geometry"]
+    links.new(socket, nodes.new('NodeGroupOutput').inputs[0])
+    return tree
+
+
+def _read_weights_evaluated(mesh_obj):
+    # Vertex groups of mesh_obj read as attributes of a temporary object
+    # sharing its mesh, with only the reader modifier on it. Zero weights read
+    # the same as no membership and are left out.
+    names = mesh_obj.vertex_groups.keys()
+    vertex_count = len(mesh_obj.data.vertices)
+    context = bpy.context
+    reader = bpy.data.objects.new("arp_weight_reader", mesh_obj.data)
+    context.scene.collection.objects.link(reader)
+    modifier = reader.modifiers.new("arp_weight_reader", 'NODES')
+    dense = np.empty(vertex_count, dtype=np.float32)
+    parts = []
+    try:
+        for first in range(0, len(names), BULK_READ_GROUPS):
+            batch = names[first:first + BULK_READ_GROUPS]
+            tree = _weight_reader_tree(batch)
+            try:
+                modifier.node_group = tree
+                evaluated = reader.evaluated_get(context.evaluated_depsgraph_get()).data
+                for offset in range(len(batch)):
+                    attribute = evaluated.attributes.get(f"{WEIGHT_ATTRIBUTE_PREFIX}{offset}")
+                    if attribute is None or len(attribute.data) != vertex_count:
+                        raise RuntimeError(f"Vertex group '{batch[offset]}' could not be read as an attribute")
+                    attribute.data.foreach_get("value", dense)
+                    used = np.flatnonzero(dense).astype(np.int32)
+                    parts.append((used, np.full(len(used), first + offset, np.int32), dense[used]))
+            finally:
+                modifier.node_group = None
+                bpy.data.node_groups.remove(tree)
+    finally:
+        bpy.data.objects.remove(reader)
+    if not parts:
+        return _empty_weights()
+    vertices, groups, weights = (np.concatenate(arrays) for arrays in zip(*parts))
+    # Vertex-major like the per-vertex read
+    order = np.argsort(vertices, kind="stable")
+    return vertices[order], groups[order], weights[order]
+
+
+def read_weights(mesh_obj):
+    # All influences of a mesh as (vertices, groups, weights) arrays
+    if not mesh_obj.vertex_groups:
+        return _empty_weights()
+    if len(mesh_obj.data.vertices) >= BULK_READ_MIN_VERTICES and mesh_obj.mode != 'EDIT':
+        try:
+            return _read_weights_evaluated(mesh_obj)
+        except (RuntimeError, AttributeError, KeyError, TypeError):
+            pass
+    return _read_weights_per_vertex(mesh_obj)
+
+
+def write_group(mesh_obj, group_name, vertex_indices, weights, quantize=True):
+    # Replace the contents of a vertex group (created if missing). With
+    # quantize, weights are rounded to WEIGHT_QUANTUM and those rounding to 0
+    # are dropped; otherwise every entry is written with its exact value.
+    group = mesh_obj.vertex_groups.get(group_name)
+    if group:
+        group.remove(list(range(len(mesh_obj.data.vertices))))
+    else:
+        group = mesh_obj.vertex_groups.new(name=group_name)
+
+    vertex_indices = np.asarray(vertex_indices)
+    if quantize:
+        weights = np.round(np.asarray(weights, dtype=np.float64) / WEIGHT_QUANTUM) * WEIGHT_QUANTUM
+        keep = weights > 0.0
+        vertex_indices = vertex_indices[keep]
+        weights = weights[keep]
+    else:
+        # float32 like the vertex group storage, so values come back unchanged
+        weights = np.asarray(weights, dtype=np.float32)
+    if not len(weights):
+        return group
+
+    order = np.argsort(weights, kind="stable")
+    values, starts = np.unique(weights[order], return_index=True)
+    for value, indices in zip(values, np.split(vertex_indices[order], starts[1:])):
+        group.add(indices.tolist(), float(value), 'REPLACE')
+    return group
+
+
+def write_weights(mesh_obj, vertices, groups, weights, group_names, quantize=True):
+    # Write sparse triplets back, group indices refer to group_names
+    order = np.argsort(groups, kind="stable")
+    vertices, groups, weights = vertices[order], groups[order], weights[order]
+    unique, starts = np.unique(groups, return_index=True)
+    bounds = list(starts[1:]) + [len(groups)]
+    for group_index, start, end in zip(unique, starts, bounds):
+        write_group(mesh_obj, group_names[group_index], vertices[start:end], weights[start:end], quantize)
+
+
+def _split_side(name):
+    stem, dot, side = name.rpartition(".")
+    return (stem, side) if dot else (name, "")
+
+
+def _normalize_arp_name(name):
+    stem, side = _split_side(name)
+    for prefix in ARP_DEFORM_PREFIXES:
+        if stem.startswith(prefix):
+            stem = stem[len(prefix):]
+    for suffix in ARP_DEFORM_SUFFIXES:
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+    return stem, side.lower()
+
+
+def arp_deform_group_map(mapping, group_names, deform_bone_names):
+    # Map ARP deform vertex groups to Rigify DEF- bones. The correspondence is
+    # derived from the reference-bone mapping: the group of an ARP deform bone
+    # built from `thigh_ref.l` goes to `DEF-thigh.L`, and twist/stretch parts go
+    # to the matching DEF segment. Returns {group name: DEF bone name}.
+    deform_bone_names = set(deform_bone_names)
+    stems = {}
+    for rigify_name, arp_name in mapping.items():
+        if not arp_name:
+            continue
+        stem, side = _split_side(arp_name)
+        if stem.endswith("_ref"):
+            stem = stem[:-len("_ref")]
+        stems[(stem, side.lower())] = rigify_name
+
+    # Longest stem first so `index1_base` wins over `index1`
+    ordered = sorted(stems, key=lambda key: len(key[0]), reverse=True)
+
+    group_map = {}
+    for group_name in group_names:
+        if group_name.startswith(DEFORM_PREFIX):
+            continue
+        core, side = _normalize_arp_name(group_name)
+        for stem, stem_side in ordered:
+            if stem_side != side or not (core == stem or core.startswith(stem + "_")):
+                continue
+            rigify_name = stems[(stem, stem_side)]
+            target = DEFORM_PREFIX + rigify_name
+            segments = ARP_LIMB_SEGMENTS.get(stem)
+            remainder = core[len(stem):]
+            if segments and remainder in segments and segments.index(remainder) > 0:
+                second = f"{target}.{segments.index(remainder):03d}"
+                if second in deform_bone_names:
+                    target = second
+            if target in deform_bone_names:
+                group_map[group_name] = target
+            break
+    return group_map
+
+
+def transfer_arp_weights(mesh_obj, group_map):
+    # Rename ARP deform groups to their DEF- bones; groups that share a target
+    # (twist + stretch on a single-segment limb, bend bones, ...) are summed
+    # into one. Returns (renamed, merged) counts.
+    vertex_groups = mesh_obj.vertex_groups
+    sources_by_target = defaultdict(list)
+    for group in vertex_groups:
+        target = group_map.get(group.name)
+        if target:
+            sources_by_target[target].append(group.name)
+
+    to_merge = {target: names for target, names in sources_by_target.items()
+                if len(names) > 1 or target in vertex_groups}
+    to_rename = {names[0]: target for target, names in sources_by_target.items()
+                 if target not in to_merge}
+
+    if to_merge:
+        vertices, groups, weights = read_weights(mesh_obj)
+        vertex_count = len(mesh_obj.data.vertices)
+        merged = {}
+        for target, names in to_merge.items():
+            indices = [vertex_groups[name].index for name in names]
+            if target in vertex_groups:
+                indices.append(vertex_groups[target].index)
+            mask = np.isin(groups, indices)
+            summed = np.bincount(vertices[mask], weights=weights[mask], minlength=vertex_count)
+            used = np.flatnonzero(summed)
+            merged[target] = (used, np.minimum(summed[used], 1.0))
+
+        for names in to_merge.values():
+            for name in names:
+                vertex_groups.remove(vertex_groups[name])
+        for target, (used, values) in merged.items():
+            write_group(mesh_obj, target, used, values)
+
+    for name, target in to_rename.items():
+        vertex_groups[name].name = target
+
+    return len(to_rename), sum(len(names) for names in to_merge.values())
+
+
+def attach_to_armature(mesh_obj, rig_obj, previous_rig=None):
+    # Parent to the rig keeping the world transform, and point the mesh's
+    # armature modifier at it (reusing one that targeted previous_rig)
+    world = mesh_obj.matrix_world.copy()
+    mesh_obj.parent = rig_obj
+    mesh_obj.parent_type = 'OBJECT'
+    mesh_obj.matrix_parent_inverse = rig_obj.matrix_world.inverted()
+    mesh_obj.matrix_world = world
+
+    armature_modifiers = [m for m in mesh_obj.modifiers if m.type == 'ARMATURE']
+    if any(m.object == rig_obj for m in armature_modifiers):
+        return
+    for modifier in armature_modifiers:
+        if modifier.object is None or (previous_rig and modifier.object == previous_rig):
+            modifier.object = rig_obj
+            return
+    modifier = mesh_obj.modifiers.new(name="Armature", type='ARMATURE')
+    modifier.object = rig_obj
+
+
+def deform_bone_names(rig_obj):
+    return [bone.name for bone in rig_obj.data.bones if bone.use_deform]
+
+
+def parent_with_automatic_weights(context, mesh_obj, rig_obj):
+    # Select mesh first, then rig (rig needs to be active)
+    bpy.ops.object.select_all(action='DESELECT')
+    mesh_obj.select_set(True)
+    rig_obj.select_set(True)
+    context.view_layer.objects.active = rig_obj
+    bpy.ops.object.parent_set(type='ARMATURE_AUTO')
+
+
+def parent_with_transferred_weights(mesh_obj, rig_obj, source_rig, mapping):
+    group_map = arp_deform_group_map(mapping, mesh_obj.vertex_groups.keys(), deform_bone_names(rig_obj))
+    if not group_map:
+        raise RuntimeError(f"'{mesh_obj.name}' has no Auto-Rig Pro deform groups to transfer")
+    renamed, merged = transfer_arp_weights(mesh_obj, group_map)
+    attach_to_armature(mesh_obj, rig_obj, previous_rig=source_rig)
+    return renamed, merged
+
+
+class MeshState:
+    # What parenting changes on a mesh, captured so it can be rolled back:
+    # parent and transform, modifiers and vertex groups. Weights are only
+    # captured when asked for, since reading them costs a pass over the mesh,
+    # and are restored with their exact values (large meshes are read in bulk,
+    # which leaves out memberships with a weight of exactly 0).
+
+    def __init__(self, mesh_obj, capture_weights=False):
+        self.mesh_obj = mesh_obj
+        self.parent = mesh_obj.parent
+        self.parent_type = mesh_obj.parent_type
+        self.parent_bone = mesh_obj.parent_bone
+        self.matrix_parent_inverse = mesh_obj.matrix_parent_inverse.copy()
+        self.matrix_basis = mesh_obj.matrix_basis.copy()
+        self.armature_targets = {m.name: m.object for m in mesh_obj.modifiers if m.type == 'ARMATURE'}
+        self.modifier_names = set(mesh_obj.modifiers.keys())
+        self.group_names = mesh_obj.vertex_groups.keys()
+        self.weights = read_weights(mesh_obj) if capture_weights else None
+
+    def restore(self):
+        mesh_obj = self.mesh_obj
+        for modifier in list(mesh_obj.modifiers):
+            if modifier.name not in self.modifier_names:
+                mesh_obj.modifiers.remove(modifier)
+        for name, target in self.armature_targets.items():
+            mesh_obj.modifiers[name].object = target
+
+        vertex_groups = mesh_obj.vertex_groups
+        if self.weights is not None:
+            vertex_groups.clear()
+            for name in self.group_names:
+                vertex_groups.new(name=name)
+            write_weights(mesh_obj, *self.weights, self.group_names, quantize=False)
+        else:
+            kept = set(self.group_names)
+            for group in list(vertex_groups):
+                if group.name not in kept:
+                    vertex_groups.remove(group)
+
+        mesh_obj.parent = self.parent
+        mesh_obj.parent_type = self.parent_type
+        mesh_obj.parent_bone = self.parent_bone
+        mesh_obj.matrix_parent_inverse = self.matrix_parent_inverse
+        mesh_obj.matrix_basis = self.matrix_basis
+
+
+def read_coordinates(mesh):
+    coordinates = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    return coordinates.reshape(-1, 3)
+
+
+def build_weight_proxy(context, mesh_obj, target_vertices):
+    # Decimated copy of the mesh (without its modifiers or vertex groups),
+    # linked to the scene at the same transform
+    source_mesh = mesh_obj.data.copy()
+    source = bpy.data.objects.new(f"{mesh_obj.name}_proxy_source", source_mesh)
+    context.scene.collection.objects.link(source)
+    try:
+        modifier = source.modifiers.new(name="Weight Proxy", type='DECIMATE')
+        modifier.decimate_type = 'COLLAPSE'
+        modifier.ratio = min(1.0, target_vertices / max(1, len(source_mesh.vertices)))
+        depsgraph = context.evaluated_depsgraph_get()
+        proxy_mesh = bpy.data.meshes.new_from_object(source.evaluated_get(depsgraph))
+    finally:
+        bpy.data.objects.remove(source)
+        bpy.data.meshes.remove(source_mesh)
+
+    proxy = bpy.data.objects.new(f"{mesh_obj.name}_weight_proxy", proxy_mesh)
+    context.scene.collection.objects.link(proxy)
+    proxy.matrix_world = mesh_obj.matrix_world
+    proxy.vertex_groups.clear()
+    return proxy
+
+
+def remove_weight_proxy(proxy):
+    proxy_mesh = proxy.data
+    bpy.data.objects.remove(proxy)
+    bpy.data.meshes.remove(proxy_mesh)
+
+
+def project_weights(proxy, mesh_obj, neighbours=PROJECTION_NEIGHBOURS):
+    # Project the proxy's weights onto the full mesh: every full-resolution
+    # vertex blends its nearest proxy vertices by inverse distance. Both
+    # objects share a transform, so the lookup runs in local space.
+    from mathutils.kdtree import KDTree
+
+    group_names = proxy.vertex_groups.keys()
+    proxy_coordinates = read_coordinates(proxy.data)
+    coordinates = read_coordinates(mesh_obj.data)
+    neighbours = max(1, min(neighbours, len(proxy_coordinates)))
+
+    tree = KDTree(len(proxy_coordinates))
+    for index, co in enumerate(proxy_coordinates):
+        tree.insert(co, index)
+    tree.balance()
+
+    indices = np.empty((len(coordinates), neighbours), dtype=np.int32)
+    distances = np.empty((len(coordinates), neighbours), dtype=np.float64)
+    for row, co in enumerate(coordinates):
+        found = tree.find_n(co, neighbours)
+        count = len(found)
+        indices[row, :count] = [index for _, index, _ in found]
+        distances[row, :count] = [distance for _, _, distance in found]
+        if count < neighbours:
+            indices[row, count:] = indices[row, 0]
+            distances[row, count:] = distances[row, 0]
+
+    blend = 1.0 / np.maximum(distances, 1e-8)
+    blend /= blend.sum(axis=1, keepdims=True)
+
+    # Dense (proxy vertices x groups) matrix, the proxy is small by design
+    vertices, groups, proxy_weights = read_weights(proxy)
+    dense = np.zeros((len(proxy_coordinates), len(group_names)), dtype=np.float32)
+    dense[vertices, groups] = proxy_weights
+
+    # Normalizing the blended rows is linear, so the per-vertex total can be
+    # blended from the proxy row sums once instead of summing every group
+    totals = (dense.sum(axis=1)[indices] * blend).sum(axis=1)
+    totals[totals <= 0.0] = 1.0
+
+    all_vertices = np.arange(len(coordinates))
+    for group_index, name in enumerate(group_names):
+        projected = (dense[indices, group_index] * blend).sum(axis=1) / totals
+        used = projected > 0.0
+        write_group(mesh_obj, name, all_vertices[used], projected[used])
+    return len(group_names)
+
+
+def parent_with_proxy_weights(context, mesh_obj, rig_obj, target_vertices):
+    # Automatic weights solved on a decimated proxy and projected back
+    if len(mesh_obj.data.vertices) <= target_vertices:
+        parent_with_automatic_weights(context, mesh_obj, rig_obj)
+        return False
+
+    proxy = build_weight_proxy(context, mesh_obj, target_vertices)
+    try:
+        parent_with_automatic_weights(context, proxy, rig_obj)
+        project_weights(proxy, mesh_obj)
+    finally:
+        remove_weight_proxy(proxy)
+    attach_to_armature(mesh_obj, rig_obj)
+    return True
+
+
+def deform_weights(mesh_obj, deform_names):
+    # Sparse weights of the groups named after deform bones, with group
+    # indices renumbered into the returned name list
+    vertices, groups, weights = read_weights(mesh_obj)
+    names = mesh_obj.vertex_groups.keys()
+    kept = [index for index, name in enumerate(names) if name in deform_names]
+    remap = np.full(max(len(names), 1), -1, dtype=np.int32)
+    remap[kept] = np.arange(len(kept), dtype=np.int32)
+    mask = remap[groups] >= 0 if len(groups) else np.zeros(0, dtype=bool)
+    return [names[index] for index in kept], vertices[mask], remap[groups[mask]], weights[mask]
+
+
+def limit_influences(vertices, groups, weights, vertex_count, max_influences=4, min_weight=0.0, normalize=True):
+    # Keep the max_influences largest weights of each vertex that are at least
+    # min_weight (the largest one is always kept, so no vertex is left
+    # unweighted), then scale each vertex's weights to sum to 1. Normalized
+    # weights are quantized like write_group() does, with the rounding
+    # remainder given to the largest weight so the sums stay exactly 1.
+    # Works on sparse triplets and returns new ones.
+    if not len(weights):
+        return vertices, groups, weights
+    order = np.lexsort((-weights, vertices))
+    vertices, groups, weights = vertices[order], groups[order], weights[order].astype(np.float64)
+    first = np.searchsorted(vertices, vertices)
+    rank = np.arange(len(vertices)) - first
+    keep = (rank == 0) | ((rank < max_influences) & (weights >= min_weight))
+    vertices, groups, weights, rank = vertices[keep], groups[keep], weights[keep], rank[keep]
+
+    if normalize:
+        totals = np.bincount(vertices, weights, minlength=vertex_count)
+        weights = np.divide(weights, totals[vertices], out=np.zeros_like(weights), where=totals[vertices] > 0.0)
+        weights = np.round(weights / WEIGHT_QUANTUM) * WEIGHT_QUANTUM
+        remainder = 1.0 - np.bincount(vertices, weights, minlength=vertex_count)
+        top = rank == 0
+        weights[top] += np.where(totals[vertices[top]] > 0.0, remainder[vertices[top]], 0.0)
+    return vertices, groups, weights.astype(np.float32)
+
+
+def clean_up_weights(mesh_obj, deform_names, max_influences=4, min_weight=0.01, normalize=True, remove_empty=True):
+    # limit_influences() on the groups of mesh_obj named in deform_names, the
+    # other groups are left alone. Only groups whose weights changed are
+    # written. With remove_empty, deform groups left without weights are
+    # deleted. Returns (vertices changed, groups removed).
+    names = mesh_obj.vertex_groups.keys()
+    deform = np.array([name in deform_names for name in names] or [False])
+    all_vertices, all_groups, all_weights = read_weights(mesh_obj)
+    mask = deform[all_groups] if len(all_groups) else np.zeros(0, dtype=bool)
+    vertices, groups, weights = all_vertices[mask], all_groups[mask], all_weights[mask]
+    vertex_count = len(mesh_obj.data.vertices)
+
+    new_vertices, new_groups, new_weights = limit_influences(
+        vertices, groups, weights, vertex_count, max_influences, min_weight, normalize)
+
+    # Limiting only drops and reweights influences, so every new (group,
+    # vertex) key is found among the old ones
+    changed_keys = np.empty(0, dtype=np.int64)
+    if len(weights):
+        old_keys = groups.astype(np.int64) * vertex_count + vertices
+        new_keys = new_groups.astype(np.int64) * vertex_count + new_vertices
+        order = np.argsort(old_keys)
+        old_keys, old_weights = old_keys[order], weights[order]
+        reweighted = np.abs(old_weights[np.searchsorted(old_keys, new_keys)] - new_weights) > WEIGHT_QUANTUM / 2
+        dropped = ~np.isin(old_keys, new_keys)
+        changed_keys = np.concatenate((new_keys[reweighted], old_keys[dropped]))
+        for index in np.unique(changed_keys // vertex_count):
+            rows = new_groups == index
+            # Only normalized weights are quantized, kept ones stay exact
+            write_group(mesh_obj, names[index], new_vertices[rows], new_weights[rows], quantize=normalize)
+
+    removed = 0
+    if remove_empty:
+        filled = set(np.unique(new_groups).tolist())
+        for index in reversed(range(len(names))):
+            if deform[index] and index not in filled:
+                mesh_obj.vertex_groups.remove(mesh_obj.vertex_groups[index])
+                removed += 1
+    return len(np.unique(changed_keys % max(vertex_count, 1))), removed
+
+
+def apply_weights(mesh_obj, rig_obj, group_names, vertices, groups, weights):
+    # Write previously computed weights exactly as given (cache entries, or
+    # worker results already quantized) and bind the mesh to the rig
+    group_names = [str(name) for name in group_names]
+    filled = set(np.unique(groups).tolist())
+    for index, name in enumerate(group_names):
+        if index not in filled:
+            write_group(mesh_obj, name, [], [])
+    write_weights(mesh_obj, np.asarray(vertices), np.asarray(groups), np.asarray(weights), group_names,
+                  quantize=False)
+    attach_to_armature(mesh_obj, rig_obj)
@@ -0,0 +1,160 @@
+#    Copyright (C) 2025 Israel Andrew Brown
+#    Created by Israel Andrew Brown
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the GNU General Public License for more details.
+#    You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Pool of background Blender processes.
+#
+# Every job runs `blender -b [file.blend] --python <script> -- <args> --result <path>`.
+# The worker script writes its outcome as JSON to the result path; a worker that
+# crashes or times out without writing one is turned into a failed result here,
+# so one bad job never takes the rest of the pool down with it.
+
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of characters of worker output kept in a failed result
+LOG_TAIL_CHARS = 4000
+
+
+def default_worker_count():
+    return max(1, os.cpu_count() or 1)
+
+
+def blender_binary():
+    try:
+        import bpy
+        return bpy.app.binary_path
+    except ImportError:
+        return "blender"
+
+
+def write_json_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".json.tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def worker_command(script, script_args, blend_file=None, binary=None, factory_startup=True):
+    command = [binary or blender_binary(), "-b"]
+    if factory_startup:
+        command.append("--factory-startup")
+    if blend_file:
+        command.append(blend_file)
+    command += ["--python-exit-code", "1", "--python", script, "--"]
+    command += [str(arg) for arg in script_args]
+    return command
+
+
+class WorkerPool:
+    def __init__(self, max_workers=None, binary=None):
+        self.max_workers = max_workers or default_worker_count()
+        self.binary = binary
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="arp_worker")
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(cancel=exc_type is not None)
+
+    def submit(self, script, script_args, blend_file=None, timeout=None):
+        return self._executor.submit(self._run, script, list(script_args), blend_file, timeout)
+
+    def shutdown(self, wait=True, cancel=False):
+        if cancel:
+            self.cancel()
+        self._executor.shutdown(wait=wait, cancel_futures=cancel)
+
+    def cancel(self):
+        # Stop queued jobs from starting and kill the running ones
+        self._cancelled = True
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+    def _run(self, script, script_args, blend_file, timeout):
+        fd, result_path = tempfile.mkstemp(prefix="arp_to_rigify_", suffix=".json")
+        os.close(fd)
+        os.remove(result_path)
+
+        command = worker_command(script, script_args + ["--result", result_path],
+                                 blend_file=blend_file, binary=self.binary)
+        start = time.perf_counter()
+        returncode = None
+        output = ""
+        error = None
+
+        if self._cancelled:
+            return {"status": "cancelled", "source": blend_file, "error": "Cancelled before start"}
+
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, errors="replace")
+        with self._lock:
+            self._processes.add(process)
+        try:
+            output, _ = process.communicate(timeout=timeout)
+            returncode = process.returncode
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output, _ = process.communicate()
+            error = f"Worker timed out after {timeout} s"
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+        result = read_json(result_path)
+        if os.path.exists(result_path):
+            os.remove(result_path)
+
+        if result is None:
+            if self._cancelled:
+                result = {"status": "cancelled", "error": "Cancelled"}
+            else:
+                result = {"status": "failed",
+                          "error": error or f"Worker exited with code {returncode} without writing a result"}
+        result.setdefault("source", blend_file)
+        result["returncode"] = returncode
+        result["wall_seconds"] = round(time.perf_counter() - start, 3)
+        if result.get("status") != "ok":
+            result["log_tail"] = (output or "")[-LOG_TAIL_CHARS:]
+        return result